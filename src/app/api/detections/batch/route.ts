@@ -0,0 +1,113 @@
+import { NextRequest, NextResponse } from "next/server";
+import { prisma } from "@/lib/prisma";
+
+// Interface untuk data deteksi dari Python backend
+interface DetectionDetailData {
+  className: string;
+  confidence: number;
+  boundingBox: {
+    x1: number;
+    y1: number;
+    x2: number;
+    y2: number;
+  };
+}
+
+interface FishDetectionRecord {
+  sessionId?: string;
+  timestamp?: string;
+  fishCount: number;
+  frameNumber?: number;
+  imageUrl?: string;
+  detections: DetectionDetailData[];
+}
+
+interface FishDetectionBatchRequest {
+  records: FishDetectionRecord[];
+}
+
+// Batas jumlah record per request
+const MAX_RECORDS_PER_BATCH = 1000;
+
+// POST /api/detections/batch - Simpan banyak hasil deteksi sekaligus (write-behind dari Python backend)
+export async function POST(req: NextRequest) {
+  try {
+    const body: FishDetectionBatchRequest = await req.json();
+
+    // Validasi data
+    if (!Array.isArray(body.records)) {
+      return NextResponse.json(
+        { error: "records harus berupa array" },
+        { status: 400 }
+      );
+    }
+
+    if (body.records.length > MAX_RECORDS_PER_BATCH) {
+      return NextResponse.json(
+        { error: `Maksimal ${MAX_RECORDS_PER_BATCH} record per batch` },
+        { status: 413 }
+      );
+    }
+
+    for (const record of body.records) {
+      if (typeof record.fishCount !== "number" || record.fishCount < 0) {
+        return NextResponse.json(
+          { error: "fishCount harus berupa angka positif" },
+          { status: 400 }
+        );
+      }
+
+      if (!Array.isArray(record.detections)) {
+        return NextResponse.json(
+          { error: "detections harus berupa array" },
+          { status: 400 }
+        );
+      }
+    }
+
+    // Simpan semua record dalam satu transaction
+    const result = await prisma.$transaction(
+      body.records.map((record) =>
+        prisma.fishDetection.create({
+          data: {
+            sessionId: record.sessionId || null,
+            timestamp: record.timestamp ? new Date(record.timestamp) : new Date(),
+            fishCount: record.fishCount,
+            frameNumber: record.frameNumber ?? null,
+            imageUrl: record.imageUrl || null,
+            detectionDetails: {
+              create: record.detections.map((detection) => ({
+                className: detection.className,
+                confidence: detection.confidence,
+                boundingBoxX1: detection.boundingBox.x1,
+                boundingBoxY1: detection.boundingBox.y1,
+                boundingBoxX2: detection.boundingBox.x2,
+                boundingBoxY2: detection.boundingBox.y2,
+              })),
+            },
+          },
+          select: { id: true },
+        })
+      )
+    );
+
+    return NextResponse.json(
+      {
+        success: true,
+        message: "Batch deteksi berhasil disimpan",
+        count: result.length,
+      },
+      { status: 201 }
+    );
+  } catch (error) {
+    console.error("Error saving detection batch:", error);
+    return NextResponse.json(
+      {
+        success: false,
+        error: "Gagal menyimpan batch deteksi",
+        details: error instanceof Error ? error.message : "Unknown error",
+      },
+      { status: 500 }
+    );
+  }
+}
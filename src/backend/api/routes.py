@@ -6,17 +6,31 @@ import os
 import torch
 import logging
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
-from typing import Set
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
+from typing import Dict, Set
 
 from models.yolo_detector import get_model, get_model_info
-from video.detection_track import get_fps, get_inference_fps
-from video.recording import start_recording, stop_recording, is_recording, get_recording_info
+from models.batch_engine import inference_engine
+from database.detection_writer import detection_writer
+from monitoring.metrics import render_metrics
+from video.shared_encoder import get_shared_encoders
+from video.source_hub import get_fps, get_inference_fps, get_pipeline_lag_ms, get_inference_control, get_source_stats
+from video.recording import (
+    start_recording,
+    stop_recording,
+    is_recording,
+    get_recording_info,
+    get_finalize_status,
+    status_listeners
+)
+from video.passthrough_recording import sidecar_path
+from video.event_clips import get_event_clip_state
 from webrtc.peer_connection import (
     handle_offer,
     cleanup_pc,
     get_peer_connections,
-    get_detection_track
+    get_detection_track,
+    get_client_stats
 )
 from config import RTSP_URL
 
@@ -24,10 +38,27 @@ logger = logging.getLogger("carter-backend")
 
 # Active WebSocket connections
 active_connections: Set[WebSocket] = set()
+client_sockets: Dict[str, WebSocket] = {}
+
+
+async def _push_recording_status(status: dict):
+    """Tell the recording's client (if still connected) how finalizing went"""
+    websocket = client_sockets.get(status.get("client_id"))
+    if websocket is not None:
+        await websocket.send_text(json.dumps({"type": "recording-status", **status}))
+
+
+def _video_media_type(filename: str) -> str:
+    if filename.endswith(".webm"):
+        return "video/webm"
+    if filename.endswith(".mkv"):
+        return "video/x-matroska"
+    return "video/mp4"
 
 
 def setup_routes(app: FastAPI):
     """Setup all API routes"""
+    status_listeners.add(_push_recording_status)
 
     @app.get("/")
     async def root():
@@ -60,6 +91,8 @@ def setup_routes(app: FastAPI):
             "fps": get_fps(),
             "inference_fps": get_inference_fps(),
             "active_peer_connections": len(get_peer_connections()),
+            "sources": get_source_stats(),
+            "clients": get_client_stats(),
             "cuda": torch.cuda.is_available(),
             "torch": torch.__version__,
             "gpu": gpu,
@@ -72,12 +105,25 @@ def setup_routes(app: FastAPI):
         return {
             "fps": round(get_fps(), 2),
             "inference_fps": round(get_inference_fps(), 2),
+            "pipeline_lag_ms": round(get_pipeline_lag_ms(), 1),
+            "inference_control": get_inference_control(),
+            "inference_engine": inference_engine.state(),
+            "detection_writer": detection_writer.state(),
             "active_peer_connections": len(get_peer_connections()),
+            "sources": get_source_stats(),
+            "clients": get_client_stats(),
+            "shared_encoders": get_shared_encoders(),
+            "event_clips": get_event_clip_state(),
             "device": get_device_info(),
             "model_loaded": model is not None,
             "cuda_available": torch.cuda.is_available(),
         }
 
+    @app.get("/metrics")
+    async def metrics():
+        """Prometheus text exposition of per-stage latency histograms and gauges"""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
     @app.get("/api/model-info")
     async def model_info():
         """Model information endpoint"""
@@ -109,22 +155,27 @@ def setup_routes(app: FastAPI):
         if not is_recording(client_id):
             return {"success": False, "error": "Not recording"}
 
-        # Stop recording on detection track FIRST (releases writer)
-        detection_track = get_detection_track(client_id)
-        if detection_track:
-            detection_track.stop_recording()
-
-        # Then save metadata to database
+        # Returns at once; the file is finalized and saved in the background
+        # (poll /api/recording/finalize/{recording_id} or wait for the
+        # "recording-status" WebSocket message)
         recording_data = await stop_recording(client_id)
         if recording_data:
             return {
                 "success": True,
                 "recording": recording_data,
-                "message": "Recording stopped"
+                "message": "Recording stopped, finalizing"
             }
         else:
             return {"success": False, "error": "Failed to stop recording"}
 
+    @app.get("/api/recording/finalize/{recording_id}")
+    async def recording_finalize_endpoint(recording_id: str):
+        """Finalize status of a stopped recording"""
+        status = get_finalize_status(recording_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Unknown recording")
+        return status
+
     @app.get("/api/recording/status/{client_id}")
     async def recording_status_endpoint(client_id: str):
         """Get recording status for a client"""
@@ -149,8 +200,7 @@ def setup_routes(app: FastAPI):
         if not os.path.exists(filepath):
             raise HTTPException(status_code=404, detail="Video not found")
 
-        # Detect media type based on file extension
-        media_type = "video/webm" if filename.endswith(".webm") else "video/mp4"
+        media_type = _video_media_type(filename)
 
         # Return video file with proper content type
         return FileResponse(
@@ -159,6 +209,22 @@ def setup_routes(app: FastAPI):
             filename=filename
         )
 
+    @app.get("/api/video/sidecar/{filename}")
+    async def video_sidecar(filename: str):
+        """Detections sidecar of a pass-through recording (404 if it has none)"""
+        from config import RECORDINGS_DIR
+
+        # Security: prevent directory traversal
+        if ".." in filename or "/" in filename or "\\" in filename:
+            raise HTTPException(status_code=400, detail="Invalid filename")
+
+        filepath = sidecar_path(os.path.join(RECORDINGS_DIR, filename))
+
+        if not os.path.exists(filepath):
+            raise HTTPException(status_code=404, detail="Sidecar not found")
+
+        return FileResponse(filepath, media_type="application/x-ndjson")
+
     @app.get("/api/video/download/{filename}")
     async def download_video(filename: str):
         """Download video file"""
@@ -173,8 +239,7 @@ def setup_routes(app: FastAPI):
         if not os.path.exists(filepath):
             raise HTTPException(status_code=404, detail="Video not found")
 
-        # Detect media type based on file extension
-        media_type = "video/webm" if filename.endswith(".webm") else "video/mp4"
+        media_type = _video_media_type(filename)
 
         # Force download with proper headers
         return FileResponse(
@@ -189,6 +254,7 @@ def setup_routes(app: FastAPI):
         """WebSocket endpoint for WebRTC signaling"""
         await websocket.accept()
         active_connections.add(websocket)
+        client_sockets[client_id] = websocket
         logger.info(f"WS client {client_id} connected")
 
         try:
@@ -206,6 +272,8 @@ def setup_routes(app: FastAPI):
             logger.exception(f"WS error {client_id}: {e}")
         finally:
             active_connections.discard(websocket)
+            if client_sockets.get(client_id) is websocket:
+                client_sockets.pop(client_id, None)
             await cleanup_pc(client_id)
 
 
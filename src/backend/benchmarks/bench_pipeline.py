@@ -0,0 +1,319 @@
+"""
+Offline benchmark for the detection track pipeline
+
+Drives SourceHub + RtspDetectionTrack from a local video file or a synthetic
+frame generator in place of the RTSP MediaPlayer, so the full path
+(convert -> resize -> inference -> overlay -> VideoFrame.from_ndarray ->
+track.recv) can be measured without a camera:
+
+    python -m benchmarks.bench_pipeline --seconds 30
+    python -m benchmarks.bench_pipeline --video sample.mp4 --fps 25 --json out.json
+    python -m benchmarks.bench_pipeline --baseline out.json --tolerance 0.15
+
+Reports p50/p95/p99 per stage, sustained FPS and peak RSS. Runs headless and
+on CPU only unless --device cuda is given. With --baseline, exits non-zero
+when any stage p95 or the delivered FPS regresses beyond --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import resource
+import fractions
+import numpy as np
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("carter-backend")
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+# Order of stages in the report
+STAGES = ("convert", "resize", "submit", "overlay", "to_frame", "process", "inference", "pipeline_lag", "end_to_end")
+
+
+class _PacedTrack:
+    """Common pacing and pts bookkeeping for the benchmark sources"""
+
+    kind = "video"
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.pts = 0
+        self.emitted_at: Dict[int, float] = {}
+        self._next_at: Optional[float] = None
+
+    async def _pace(self):
+        if self.fps <= 0:
+            # Unpaced: still yield so the pipeline and consumers get to run
+            await asyncio.sleep(0)
+            return
+        now = time.perf_counter()
+        if self._next_at is None:
+            self._next_at = now
+        wait = self._next_at - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._next_at += 1.0 / self.fps
+
+    def _stamp(self, frame):
+        self.pts += VIDEO_CLOCK_RATE // int(self.fps or 30)
+        frame.pts = self.pts
+        frame.time_base = VIDEO_TIME_BASE
+        self.emitted_at[self.pts] = time.perf_counter()
+        if len(self.emitted_at) > 1000:
+            self.emitted_at.pop(next(iter(self.emitted_at)))
+        return frame
+
+    def stop(self):
+        pass
+
+
+class SyntheticVideoTrack(_PacedTrack):
+    """Moving bright blobs over a noisy dark background, pre-rendered into a ring"""
+
+    def __init__(self, width: int, height: int, fps: float, ring: int = 60):
+        super().__init__(fps)
+        import cv2
+        from av import VideoFrame
+
+        rng = np.random.default_rng(0)
+        base = rng.integers(0, 60, size=(height, width, 3), dtype=np.uint8)
+        self.frames = []
+        for i in range(ring):
+            img = base.copy()
+            for k in range(6):
+                cx = int((width * (k + 1) / 7 + i * 7 * (k + 1)) % width)
+                cy = int(height / 2 + np.sin(i / 10.0 + k) * height / 3)
+                cv2.ellipse(img, (cx, cy), (width // 20, height // 30), k * 30, 0, 360,
+                            (80 + 25 * k, 160, 200), -1)
+            self.frames.append(VideoFrame.from_ndarray(img, format="bgr24"))
+        self.index = 0
+
+    async def recv(self):
+        await self._pace()
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return self._stamp(frame)
+
+
+class FileVideoTrack(_PacedTrack):
+    """Decodes a local video file (looping) on a worker thread, like MediaPlayer does"""
+
+    def __init__(self, path: str, fps: float):
+        super().__init__(fps)
+        self.path = path
+        self._container = None
+        self._frames = None
+
+    def _open(self):
+        import av
+        if self._container is not None:
+            self._container.close()
+        self._container = av.open(self.path)
+        self._frames = self._container.decode(video=0)
+
+    def _next_frame(self):
+        if self._frames is None:
+            self._open()
+        try:
+            return next(self._frames)
+        except StopIteration:
+            self._open()
+            return next(self._frames)
+
+    async def recv(self):
+        await self._pace()
+        frame = await asyncio.to_thread(self._next_frame)
+        return self._stamp(frame)
+
+    def stop(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+
+class BenchPlayer:
+    """Stands in for aiortc's MediaPlayer: only .video is used by SourceHub"""
+
+    def __init__(self, track):
+        self.video = track
+        self.audio = None
+
+
+def percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    arr = np.asarray(samples, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "count": int(arr.size),
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+
+async def run_benchmark(track, seconds: float, warmup_frames: int) -> dict:
+    from video.source_hub import SourceHub
+    from video.detection_track import RtspDetectionTrack
+    from models.yolo_detector import get_device_info, get_model
+
+    samples: Dict[str, List[float]] = {name: [] for name in STAGES}
+    counters = {"processed": 0, "delivered": 0, "inferences": 0}
+    measuring = False
+
+    hub = SourceHub("bench", player_factory=lambda _: BenchPlayer(track))
+
+    def on_stages(stages: Dict[str, float]):
+        if measuring:
+            counters["processed"] += 1
+            for name, ms in stages.items():
+                samples[name].append(ms)
+
+    on_detections = hub.pipeline.on_result
+
+    def on_result(result):
+        if measuring:
+            counters["inferences"] += 1
+            samples["inference"].append(result.inference_ms)
+            samples["pipeline_lag"].append((time.monotonic() - result.frame_time) * 1000.0)
+        on_detections(result)
+
+    hub.stage_listener = on_stages
+    hub.pipeline.on_result = on_result
+    hub.start()
+    consumer = RtspDetectionTrack(hub)
+
+    try:
+        for _ in range(warmup_frames):
+            await consumer.recv()
+
+        measuring = True
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            frame = await consumer.recv()
+            emitted = track.emitted_at.pop(frame.pts, None)
+            if emitted is not None:
+                samples["end_to_end"].append((time.perf_counter() - emitted) * 1000.0)
+            counters["delivered"] += 1
+        elapsed = time.perf_counter() - started
+        measuring = False
+    finally:
+        consumer.stop()
+
+    return {
+        "device": get_device_info(),
+        "model_loaded": get_model() is not None,
+        "seconds": round(elapsed, 3),
+        "source_fps": round(counters["processed"] / elapsed, 2),
+        "delivered_fps": round(counters["delivered"] / elapsed, 2),
+        "inference_fps": round(counters["inferences"] / elapsed, 2),
+        "stages_ms": {name: percentiles(samples[name]) for name in STAGES},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Return human readable regressions (empty when within tolerance)"""
+    regressions = []
+    for name, stats in report["stages_ms"].items():
+        base = baseline.get("stages_ms", {}).get(name, {})
+        if stats["p95"] is None or not base.get("p95"):
+            continue
+        if stats["p95"] > base["p95"] * (1.0 + tolerance):
+            regressions.append(f"{name} p95 {stats['p95']}ms > baseline {base['p95']}ms")
+    base_fps = baseline.get("delivered_fps")
+    if base_fps and report["delivered_fps"] < base_fps * (1.0 - tolerance):
+        regressions.append(f"delivered FPS {report['delivered_fps']} < baseline {base_fps}")
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"Device: {report['device']} (model loaded: {report['model_loaded']})")
+    print(f"Duration: {report['seconds']}s")
+    print(f"FPS: source {report['source_fps']}, delivered {report['delivered_fps']}, "
+          f"inference {report['inference_fps']}")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+    print(f"{'stage':<14}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name, s in report["stages_ms"].items():
+        if not s["count"]:
+            continue
+        print(f"{name:<14}{s['count']:>8}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{s['max']:>10.2f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the detection track pipeline offline")
+    parser.add_argument("--video", help="Local video file (default: synthetic frames)")
+    parser.add_argument("--width", type=int, default=1920, help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=1080, help="Synthetic frame height")
+    parser.add_argument("--fps", type=float, default=0, help="Source pacing; 0 = as fast as possible")
+    parser.add_argument("--seconds", type=float, default=20.0, help="Measured duration")
+    parser.add_argument("--warmup", type=int, default=30, help="Frames discarded before measuring")
+    parser.add_argument("--device", choices=("cpu", "cuda"), default="cpu")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression vs baseline")
+    args = parser.parse_args()
+
+    # Must be set before config is imported
+    if args.device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    os.environ["SAVE_DETECTIONS_ENABLED"] = "false"
+
+    from models.yolo_detector import load_custom_model
+    from models.batch_engine import inference_engine
+    from models.inference_executor import shutdown_inference_executor
+
+    if args.video and not os.path.exists(args.video):
+        print(f"Video not found: {args.video}", file=sys.stderr)
+        return 2
+
+    load_custom_model()
+
+    async def _run() -> dict:
+        if args.video:
+            track = FileVideoTrack(args.video, args.fps)
+        else:
+            track = SyntheticVideoTrack(args.width, args.height, args.fps)
+        try:
+            return await run_benchmark(track, args.seconds, args.warmup)
+        finally:
+            track.stop()
+            inference_engine.stop()
+
+    try:
+        report = asyncio.run(_run())
+    finally:
+        shutdown_inference_executor()
+
+    report["source"] = args.video or f"synthetic {args.width}x{args.height}"
+    print_report(report)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
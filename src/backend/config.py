@@ -9,6 +9,19 @@ RTSP_TRANSPORT = os.getenv("RTSP_TRANSPORT", "udp")
 TARGET_FPS = int(os.getenv("TARGET_FPS", "30"))
 RESIZE_WIDTH = int(os.getenv("RESIZE_WIDTH", "1280"))
 RESIZE_HEIGHT = int(os.getenv("RESIZE_HEIGHT", "720"))
+# Scale and convert in one swscale pass as frames leave the decoder,
+# instead of a full-resolution BGR conversion followed by cv2.resize
+DECODER_SCALING = os.getenv("DECODER_SCALING", "true").lower() == "true"
+DECODER_PIXEL_FORMAT = os.getenv("DECODER_PIXEL_FORMAT", "bgr24")
+# FAST_BILINEAR | BILINEAR | BICUBIC | AREA ...
+DECODER_SCALE_INTERPOLATION = os.getenv("DECODER_SCALE_INTERPOLATION", "BILINEAR").upper()
+# burn = draw boxes/HUD into the video; metadata = leave pixels untouched and
+# send detections to the browser alongside the stream
+OVERLAY_MODE = os.getenv("OVERLAY_MODE", "burn").lower()
+# Per-frame detections over a negotiated WebRTC data channel (id 0)
+DETECTION_CHANNEL_ENABLED = os.getenv("DETECTION_CHANNEL_ENABLED", "true").lower() == "true"
+# Skip frames while this many bytes are still queued on the channel
+DETECTION_CHANNEL_MAX_BUFFERED = int(os.getenv("DETECTION_CHANNEL_MAX_BUFFERED", str(256 * 1024)))
 
 # ==========================
 # Bitrate Control
@@ -19,28 +32,140 @@ BITRATE_REAPPLY_SEC = float(os.getenv("BITRATE_REAPPLY_SEC", "4.0"))
 PREFER_CODEC = os.getenv("PREFER_CODEC", "h264").lower()
 DISABLE_TWCC_REM = os.getenv("DISABLE_TWCC_REMB", "1") == "1"
 
+# ==========================
+# Shared Encoder (encode once, relay to every peer)
+# ==========================
+# H.264 peers receive packets from one libx264 encoder per source instead of
+# an aiortc encoder each; VP8-only peers keep per-peer encoding
+SHARED_ENCODER_ENABLED = os.getenv("SHARED_ENCODER_ENABLED", "false").lower() == "true"
+SHARED_ENCODER_BITRATE_KBPS = int(os.getenv("SHARED_ENCODER_BITRATE_KBPS", str(MAX_BITRATE_KBPS_DEFAULT)))
+SHARED_ENCODER_PRESET = os.getenv("SHARED_ENCODER_PRESET", "veryfast")
+SHARED_ENCODER_GOP_SEC = float(os.getenv("SHARED_ENCODER_GOP_SEC", "2.0"))
+# Packets buffered per peer before it is resynced at the next keyframe
+SHARED_ENCODER_QUEUE = int(os.getenv("SHARED_ENCODER_QUEUE", "30"))
+SHARED_ENCODER_KEYFRAME_MIN_SEC = float(os.getenv("SHARED_ENCODER_KEYFRAME_MIN_SEC", "0.5"))
+
+# ==========================
+# Rendition Ladder
+# ==========================
+# WxH@kbps, comma separated, e.g. "1280x720@2500,640x360@800,320x180@250";
+# empty (default) = every peer gets the source size at MAX_BITRATE_KBPS
+# (SHARED_ENCODER_BITRATE_KBPS with a shared encoder)
+RENDITION_LADDER = os.getenv("RENDITION_LADDER", "")
+# Peers move between renditions based on RTCP receiver reports
+RENDITION_CHECK_SEC = float(os.getenv("RENDITION_CHECK_SEC", "2.0"))
+RENDITION_DOWN_LOSS = float(os.getenv("RENDITION_DOWN_LOSS", "0.05"))
+RENDITION_DOWN_RTT_SEC = float(os.getenv("RENDITION_DOWN_RTT_SEC", "1.0"))
+RENDITION_UP_LOSS = float(os.getenv("RENDITION_UP_LOSS", "0.01"))
+RENDITION_UP_AFTER_SEC = float(os.getenv("RENDITION_UP_AFTER_SEC", "10.0"))
+
 # ==========================
 # Database Saving Config
 # ==========================
 SAVE_DETECTIONS_ENABLED = os.getenv("SAVE_DETECTIONS_ENABLED", "true").lower() == "true"
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:3000")
-SAVE_INTERVAL_SECONDS = float(os.getenv("SAVE_INTERVAL_SECONDS", "5.0"))
+# 0 = record every inference result; > 0 = at most one record per interval
+SAVE_INTERVAL_SECONDS = float(os.getenv("SAVE_INTERVAL_SECONDS", "0"))
 MIN_DETECTIONS_TO_SAVE = int(os.getenv("MIN_DETECTIONS_TO_SAVE", "1"))
+# Write-behind queue flushed to /api/detections/batch
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", "100"))
+DETECTION_FLUSH_INTERVAL_SECONDS = float(os.getenv("DETECTION_FLUSH_INTERVAL_SECONDS", "2.0"))
+DETECTION_QUEUE_MAX = int(os.getenv("DETECTION_QUEUE_MAX", "5000"))
+DETECTION_RETRY_MAX = int(os.getenv("DETECTION_RETRY_MAX", "3"))
+DETECTION_RETRY_BASE_SECONDS = float(os.getenv("DETECTION_RETRY_BASE_SECONDS", "0.5"))
+DETECTION_RETRY_MAX_SECONDS = float(os.getenv("DETECTION_RETRY_MAX_SECONDS", "10.0"))
+# On-disk spool used while the API is unreachable
+DETECTION_SPOOL_ENABLED = os.getenv("DETECTION_SPOOL_ENABLED", "true").lower() == "true"
+DETECTION_SPOOL_DIR = os.getenv(
+    "DETECTION_SPOOL_DIR",
+    os.path.join(os.path.dirname(__file__), "spool", "detections")
+)
+DETECTION_SPOOL_SEGMENT_BYTES = int(os.getenv("DETECTION_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+DETECTION_SPOOL_MAX_BYTES = int(os.getenv("DETECTION_SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+DETECTION_SPOOL_PROBE_SECONDS = float(os.getenv("DETECTION_SPOOL_PROBE_SECONDS", "15.0"))
 
 # ==========================
 # Recording Settings
 # ==========================
 import tempfile
 RECORDINGS_DIR = tempfile.gettempdir()
+# encode = re-encode the annotated frames; passthrough = store the camera's own
+# packets (remux, no decode/encode) plus a detections sidecar for playback
+RECORDING_MODE = os.getenv("RECORDING_MODE", "encode").lower()
+# Packets buffered for the pass-through writer before it resyncs at a keyframe
+RECORDING_PASSTHROUGH_QUEUE = int(os.getenv("RECORDING_PASSTHROUGH_QUEUE", "600"))
+# Recordings are encoded by a separate worker process fed through shared memory
+# libvpx (VP8, .webm) | libvpx-vp9 (.webm) | libx264 (.mp4)
+RECORDING_CODEC = os.getenv("RECORDING_CODEC", "libvpx")
+# x264 preset names; mapped to cpu-used for libvpx
+RECORDING_ENCODER_PRESET = os.getenv("RECORDING_ENCODER_PRESET", "veryfast")
+RECORDING_BITRATE_KBPS = int(os.getenv("RECORDING_BITRATE_KBPS", "4000"))
+# Frames the worker may fall behind before new ones are dropped
+RECORDING_RING_SLOTS = int(os.getenv("RECORDING_RING_SLOTS", "30"))
+RECORDING_STOP_TIMEOUT_SEC = float(os.getenv("RECORDING_STOP_TIMEOUT_SEC", "10.0"))
+# Recordings are timed by the source frames' pts; a jump larger than this
+# (camera restart, pts wrap) is closed up instead of kept as a frozen frame
+RECORDING_MAX_GAP_SEC = float(os.getenv("RECORDING_MAX_GAP_SEC", "5.0"))
+
+# Event clips: the last EVENT_CLIP_PRE_ROLL_SEC of camera packets are kept in
+# memory (at most EVENT_CLIP_BUFFER_MB) and written out with the following
+# EVENT_CLIP_POST_ROLL_SEC when detections cross the trigger
+EVENT_CLIPS_ENABLED = os.getenv("EVENT_CLIPS_ENABLED", "false").lower() == "true"
+EVENT_CLIP_PRE_ROLL_SEC = float(os.getenv("EVENT_CLIP_PRE_ROLL_SEC", "10.0"))
+EVENT_CLIP_POST_ROLL_SEC = float(os.getenv("EVENT_CLIP_POST_ROLL_SEC", "10.0"))
+EVENT_CLIP_MAX_SEC = float(os.getenv("EVENT_CLIP_MAX_SEC", "120.0"))
+EVENT_CLIP_BUFFER_MB = int(os.getenv("EVENT_CLIP_BUFFER_MB", "64"))
+# Trigger: at least MIN_COUNT detections of CLASSES (comma-separated names or
+# ids, empty = any) at MIN_CONFIDENCE, in TRIGGER_FRAMES consecutive results
+EVENT_CLIP_MIN_COUNT = int(os.getenv("EVENT_CLIP_MIN_COUNT", "1"))
+EVENT_CLIP_MIN_CONFIDENCE = float(os.getenv("EVENT_CLIP_MIN_CONFIDENCE", "0.6"))
+EVENT_CLIP_CLASSES = os.getenv("EVENT_CLIP_CLASSES", "")
+EVENT_CLIP_TRIGGER_FRAMES = int(os.getenv("EVENT_CLIP_TRIGGER_FRAMES", "3"))
 
 # ==========================
 # Model Settings
 # ==========================
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "16sept.pt")
+# torch | onnx | openvino (non-torch backends export MODEL_PATH once and cache it)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+MODEL_IMGSZ = int(os.getenv("MODEL_IMGSZ", "640"))
+# Letterbox frames into reusable model-input buffers before inference
+# (false = hand the display image to ultralytics and let it letterbox)
+MODEL_INPUT_LETTERBOX = os.getenv("MODEL_INPUT_LETTERBOX", "true").lower() == "true"
+# fp32 | fp16 (CUDA: torch) | int8 (CPU: onnx / openvino)
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32").lower()
+# static (calibrated on recorded frames) | dynamic (onnx only, no calibration)
+INT8_MODE = os.getenv("INT8_MODE", "static").lower()
+CALIBRATION_DIR = os.getenv("CALIBRATION_DIR", os.path.join(tempfile.gettempdir(), "carter_calibration"))
+CALIBRATION_FRAMES = int(os.getenv("CALIBRATION_FRAMES", "200"))
+# Compare reduced-precision detections against fp32 at startup, on
+# ACCURACY_CHECK_FRAMES frames held out of calibration
+ACCURACY_CHECK_ENABLED = os.getenv("ACCURACY_CHECK_ENABLED", "true").lower() == "true"
+ACCURACY_CHECK_FRAMES = int(os.getenv("ACCURACY_CHECK_FRAMES", "50"))
 YOLO_CONF_THRESHOLD = float(os.getenv("YOLO_CONF_THRESHOLD", "0.45"))
 YOLO_IOU_THRESHOLD = float(os.getenv("YOLO_IOU_THRESHOLD", "0.5"))
 YOLO_MAX_DETECTIONS = int(os.getenv("YOLO_MAX_DETECTIONS", "30"))
 
+# ==========================
+# Inference Executor
+# ==========================
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Batches the engine may run at once (frames queue for the next batch meanwhile).
+# Ultralytics predictors are not thread-safe; keep at 1 unless each call uses its own model
+INFERENCE_MAX_IN_FLIGHT = int(os.getenv("INFERENCE_MAX_IN_FLIGHT", "1"))
+# Frames from all active sources are batched into one model call
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "4"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+# ==========================
+# Adaptive Inference Rate
+# ==========================
+ADAPTIVE_INFERENCE = os.getenv("ADAPTIVE_INFERENCE", "true").lower() == "true"
+ADAPTIVE_INTERVAL_MAX_SEC = float(os.getenv("ADAPTIVE_INTERVAL_MAX_SEC", "1.0"))
+ADAPTIVE_PERIOD_SEC = float(os.getenv("ADAPTIVE_PERIOD_SEC", "1.0"))
+ADAPTIVE_RESOLUTION = os.getenv("ADAPTIVE_RESOLUTION", "false").lower() == "true"
+ADAPTIVE_IMGSZ_STEPS = [int(v) for v in os.getenv("ADAPTIVE_IMGSZ_STEPS", "640,512,416,320").split(",") if v.strip()]
+
 # ==========================
 # Session ID
 # ==========================
@@ -0,0 +1,176 @@
+"""
+Durable on-disk spool for detection records
+
+Append-only, segmented JSON Lines files in DETECTION_SPOOL_DIR. The detection
+writer spills batches here while the API is unreachable and drains closed
+segments oldest-first once it comes back. Delivery is at-least-once: a
+segment is deleted only after every record in it was accepted. Total size is
+capped by DETECTION_SPOOL_MAX_BYTES; past that the oldest segment is dropped.
+
+All methods do blocking file I/O; call them through asyncio.to_thread.
+"""
+import os
+import json
+import glob
+import logging
+import threading
+from typing import List, Optional
+
+from config import (
+    DETECTION_SPOOL_DIR,
+    DETECTION_SPOOL_SEGMENT_BYTES,
+    DETECTION_SPOOL_MAX_BYTES
+)
+
+logger = logging.getLogger("carter-backend")
+
+_PREFIX = "spool-"
+_SUFFIX = ".jsonl"
+
+
+class DetectionSpool:
+
+    def __init__(
+        self,
+        directory: str = DETECTION_SPOOL_DIR,
+        segment_bytes: int = DETECTION_SPOOL_SEGMENT_BYTES,
+        max_bytes: int = DETECTION_SPOOL_MAX_BYTES
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._active: Optional[str] = None
+        self._active_file = None
+        self._next_seq = 0
+        # Kept up to date under the lock so state() needs no directory scan
+        self._segment_count = 0
+        self._bytes = 0
+
+        # Stats
+        self.spooled = 0
+        self.drained = 0
+        self.dropped = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self._segments()
+        self._segment_count = len(existing)
+        self._bytes = sum(os.path.getsize(p) for p in existing)
+        if existing:
+            self._next_seq = self._seq_of(existing[-1]) + 1
+            logger.info(f"Detection spool has {len(existing)} segment(s) left from a previous run")
+
+    def _segments(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, f"{_PREFIX}*{_SUFFIX}")))
+
+    @staticmethod
+    def _seq_of(path: str) -> int:
+        return int(os.path.basename(path)[len(_PREFIX):-len(_SUFFIX)])
+
+    def _open_new_segment(self):
+        self._active = os.path.join(self.directory, f"{_PREFIX}{self._next_seq:012d}{_SUFFIX}")
+        self._next_seq += 1
+        self._active_file = open(self._active, "a", encoding="utf-8")
+        self._segment_count += 1
+
+    def _close_active(self):
+        if self._active_file is not None:
+            self._active_file.close()
+        self._active_file = None
+        self._active = None
+
+    def _forget(self, path: str):
+        """Delete a segment and take it off the counters (lock held)"""
+        size = os.path.getsize(path)
+        os.remove(path)
+        self._segment_count -= 1
+        self._bytes -= size
+
+    def _enforce_limit(self):
+        for path in self._segments():
+            if self._bytes <= self.max_bytes or path == self._active:
+                break
+            lost = _count_lines(path)
+            self._forget(path)
+            self.dropped += lost
+            logger.warning(f"Detection spool over {self.max_bytes} bytes, dropped oldest segment ({lost} records)")
+
+    def append(self, records: List[dict]):
+        """Durably append records (flushed and fsynced before returning)"""
+        if not records:
+            return
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        with self._lock:
+            if self._active_file is None:
+                self._open_new_segment()
+            start = self._active_file.tell()
+            self._active_file.write(data)
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._bytes += self._active_file.tell() - start
+            self.spooled += len(records)
+            if self._active_file.tell() >= self.segment_bytes:
+                self._close_active()
+                self._enforce_limit()
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._segments())
+
+    def oldest_segment(self) -> Optional[str]:
+        """Oldest segment ready to drain; seals the active one if it is the only one left"""
+        with self._lock:
+            for path in self._segments():
+                if path != self._active:
+                    return path
+            if self._active is not None:
+                path = self._active
+                self._close_active()
+                return path
+            return None
+
+    def read(self, path: str) -> List[dict]:
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Torn last line after a crash
+                    logger.warning(f"Skipping corrupt spool line in {path}")
+        return records
+
+    def remove(self, path: str, delivered: int):
+        with self._lock:
+            try:
+                self._forget(path)
+            except FileNotFoundError:
+                pass
+            self.drained += delivered
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._bytes
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    def state(self) -> dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "segments": self._segment_count,
+                "bytes": self._bytes,
+                "spooled": self.spooled,
+                "drained": self.drained,
+                "dropped": self.dropped,
+            }
+
+
+def _count_lines(path: str) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
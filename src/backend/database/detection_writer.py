@@ -0,0 +1,333 @@
+"""
+Write-behind queue for detection records
+
+Every inference result is queued in memory and flushed in bulk to
+/api/detections/batch, either when DETECTION_BATCH_SIZE records are waiting
+or DETECTION_FLUSH_INTERVAL_SECONDS after the last flush. Failed flushes are
+retried with exponential backoff; if the API stays unreachable, batches go
+to the on-disk spool and are drained in the background once it returns. A
+4xx answer (other than 408/429) means the batch itself is bad: it is dropped
+and counted as rejected instead of retried. The in-memory queue is bounded;
+on overflow the oldest batch is spilled to the spool, and only when there is
+no spool are the oldest records dropped and counted. The video path never
+waits on the database.
+"""
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional, Set
+
+from config import (
+    API_BASE_URL,
+    DETECTION_BATCH_SIZE,
+    DETECTION_FLUSH_INTERVAL_SECONDS,
+    DETECTION_QUEUE_MAX,
+    DETECTION_RETRY_MAX,
+    DETECTION_RETRY_BASE_SECONDS,
+    DETECTION_RETRY_MAX_SECONDS,
+    DETECTION_SPOOL_ENABLED,
+    DETECTION_SPOOL_PROBE_SECONDS
+)
+from database.detections import format_detection_record, get_http_client
+from database.detection_spool import DetectionSpool
+from monitoring.metrics import GaugeFunction, registry
+
+logger = logging.getLogger("carter-backend")
+
+# Outcomes of one POST
+_SENT = "sent"
+_REJECTED = "rejected"  # permanent 4xx: retrying the same batch cannot succeed
+_FAILED = "failed"      # API down or overloaded: retry / spool
+_RETRYABLE_4XX = (408, 429)
+# Overflow batches that may be on their way to the spool at once
+_MAX_SPILLS = 4
+
+
+class DetectionWriter:
+
+    def __init__(
+        self,
+        batch_size: int = DETECTION_BATCH_SIZE,
+        flush_interval: float = DETECTION_FLUSH_INTERVAL_SECONDS,
+        max_queue: int = DETECTION_QUEUE_MAX
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max(self.batch_size, max_queue)
+
+        self._queue: Deque[dict] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Disk fallback while the API is unreachable
+        self.spool: Optional[DetectionSpool] = None
+        self._spooling = False
+        self._drain_task: Optional[asyncio.Task] = None
+        self._spill_tasks: Set[asyncio.Task] = set()
+
+        # Stats
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.spilled = 0
+        self.failed_flushes = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            if DETECTION_SPOOL_ENABLED and self.spool is None:
+                try:
+                    self.spool = DetectionSpool()
+                except OSError as e:
+                    logger.error(f"Detection spool unavailable: {e}")
+            self._task = asyncio.create_task(self._run())
+            if self.spool is not None and self.spool.pending():
+                self._start_drain()
+
+    async def stop(self, timeout: float = 5.0):
+        """Flush what is queued (best effort, bounded by timeout) and stop"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.warning(f"Detection writer stopped with {len(self._queue)} records unflushed")
+        self._task = None
+        if self._spill_tasks:
+            await asyncio.wait(set(self._spill_tasks), timeout=timeout)
+
+        # Whatever is still in memory goes to disk for the next start
+        if self._queue and self.spool is not None:
+            await self._spool_batch(list(self._queue))
+            self._queue.clear()
+        if self.spool is not None:
+            self.spool.close()
+
+    def enqueue(self, detections, frame_number: Optional[int] = None) -> bool:
+        """
+        Queue one frame's detections without blocking
+
+        Returns:
+            False if the queue was full and the oldest record was dropped
+            (with a spool, the oldest batch goes to disk instead)
+        """
+        record = format_detection_record(detections, frame_number, datetime.utcnow())
+        accepted = True
+        if len(self._queue) >= self.max_queue:
+            if self.spool is not None and self._task is not None and len(self._spill_tasks) < _MAX_SPILLS:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                task = asyncio.create_task(self._spill(batch))
+                self._spill_tasks.add(task)
+                task.add_done_callback(self._spill_tasks.discard)
+            else:
+                self._queue.popleft()
+                self.dropped += 1
+                accepted = False
+                if self.dropped % 100 == 1:
+                    logger.warning(f"Detection queue full ({self.max_queue}), dropped {self.dropped} records so far")
+        self._queue.append(record)
+        self.enqueued += 1
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return accepted
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    async def _run(self):
+        try:
+            while True:
+                if len(self._queue) < self.batch_size and not self._stopping:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._wakeup.clear()
+
+                if not self._queue:
+                    if self._stopping:
+                        return
+                    continue
+
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+                # API known to be down: straight to disk, the drain task probes for recovery
+                if self._spooling and await self._spool_batch(batch):
+                    self._start_drain()
+                    continue
+
+                if await self._flush_with_retry(batch):
+                    continue
+
+                if self.spool is not None and await self._spool_batch(batch):
+                    self._spooling = True
+                    self._start_drain()
+                    continue
+
+                self._requeue(batch)
+                if self._stopping:
+                    return
+                # API still down after all retries and no spool: pause before the next round
+                await asyncio.sleep(DETECTION_RETRY_MAX_SECONDS)
+        except asyncio.CancelledError:
+            pass
+
+    async def _spool_batch(self, batch: List[dict]) -> bool:
+        if self.spool is None:
+            return False
+        try:
+            await asyncio.to_thread(self.spool.append, batch)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to spool {len(batch)} detection records: {e}")
+            return False
+
+    async def _spill(self, batch: List[dict]):
+        """Queue overflow: park the oldest batch on disk for the drain task"""
+        if await self._spool_batch(batch):
+            self.spilled += len(batch)
+            self._spooling = True
+            self._start_drain()
+        else:
+            self.dropped += len(batch)
+
+    def _start_drain(self):
+        """Start the drain task, or restart it if it has ended (spool emptied or crashed)"""
+        if self._stopping:
+            return
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        """Send spooled segments oldest-first; probe periodically while the API is down"""
+        try:
+            while True:
+                path = await asyncio.to_thread(self.spool.oldest_segment)
+                if path is None:
+                    self._spooling = False
+                    logger.info("Detection spool drained")
+                    return
+
+                try:
+                    records = await asyncio.to_thread(self.spool.read, path)
+                except FileNotFoundError:
+                    # Dropped by the size cap while we were getting to it
+                    logger.warning(f"Spool segment vanished before draining: {path}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Failed to read spool segment {path}: {e}")
+                    await asyncio.sleep(DETECTION_SPOOL_PROBE_SECONDS)
+                    continue
+
+                sent = 0
+                delivered = 0
+                while sent < len(records):
+                    chunk = records[sent:sent + self.batch_size]
+                    outcome = await self._post(chunk)
+                    if outcome == _FAILED:
+                        break
+                    sent += len(chunk)
+                    if outcome == _SENT:
+                        delivered += len(chunk)
+
+                if sent < len(records):
+                    # Still down; the segment stays (records already sent may repeat later)
+                    self._spooling = True
+                    await asyncio.sleep(DETECTION_SPOOL_PROBE_SECONDS)
+                    continue
+
+                await asyncio.to_thread(self.spool.remove, path, delivered)
+                self.sent += delivered
+                logger.info(f"Drained {delivered} spooled detection records")
+        except asyncio.CancelledError:
+            pass
+
+    def _requeue(self, batch: List[dict]):
+        """Put an unsent batch back at the head, keeping the queue bounded"""
+        room = self.max_queue - len(self._queue)
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            batch = batch[len(batch) - room:] if room > 0 else []
+        self._queue.extendleft(reversed(batch))
+
+    async def _flush_with_retry(self, batch: List[dict]) -> bool:
+        delay = DETECTION_RETRY_BASE_SECONDS
+        for attempt in range(DETECTION_RETRY_MAX + 1):
+            outcome = await self._post(batch)
+            if outcome == _SENT:
+                self.sent += len(batch)
+                return True
+            if outcome == _REJECTED:
+                return True
+            if attempt == DETECTION_RETRY_MAX or self._stopping:
+                break
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay = min(delay * 2, DETECTION_RETRY_MAX_SECONDS)
+        self.failed_flushes += 1
+        return False
+
+    async def _post(self, batch: List[dict]) -> str:
+        """POST one batch; returns _SENT, _REJECTED (dropped for good) or _FAILED"""
+        client = get_http_client()
+        if client is None:
+            self.last_error = "HTTP client not initialized"
+            return _FAILED
+        try:
+            response = await client.post(
+                f"{API_BASE_URL}/api/detections/batch",
+                json={"records": batch},
+                timeout=10.0
+            )
+            if response.status_code == 201:
+                logger.debug(f"Flushed {len(batch)} detection records")
+                self.last_error = None
+                return _SENT
+            self.last_error = f"HTTP {response.status_code}"
+            if 400 <= response.status_code < 500 and response.status_code not in _RETRYABLE_4XX:
+                self.rejected += len(batch)
+                logger.error(
+                    f"Detection batch rejected, dropping {len(batch)} records: "
+                    f"HTTP {response.status_code} - {response.text}"
+                )
+                return _REJECTED
+            logger.warning(f"Failed to flush detections: HTTP {response.status_code} - {response.text}")
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            logger.warning(f"Error flushing detections: {self.last_error}")
+        return _FAILED
+
+    def state(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "spilled": self.spilled,
+            "failed_flushes": self.failed_flushes,
+            "last_error": self.last_error,
+            "spooling": self._spooling,
+            "spool": self.spool.state() if self.spool is not None else None,
+        }
+
+
+# Shared writer for all sources
+detection_writer = DetectionWriter()
+
+registry.register(GaugeFunction(
+    "carter_detection_queue_depth", "Detection records waiting to be flushed", (),
+    lambda: [((), detection_writer.queue_depth())]
+))
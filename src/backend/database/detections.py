@@ -3,14 +3,14 @@ Database operations for fish detections
 """
 import logging
 import httpx
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
 from datetime import datetime
 from config import (
     SAVE_DETECTIONS_ENABLED,
     API_BASE_URL,
-    MIN_DETECTIONS_TO_SAVE,
     streaming_session_id
 )
+from models.detection_batch import DetectionBatch
 
 logger = logging.getLogger("carter-backend")
 
@@ -24,7 +24,7 @@ async def initialize_http_client():
     if SAVE_DETECTIONS_ENABLED:
         http_client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
         logger.info(f"Database saving enabled - Session ID: {streaming_session_id}")
-        logger.info(f"API endpoint: {API_BASE_URL}/api/detections")
+        logger.info(f"API endpoint: {API_BASE_URL}/api/detections/batch")
 
 
 async def close_http_client():
@@ -35,66 +35,34 @@ async def close_http_client():
         http_client = None
 
 
-async def save_detections_to_db(
-    detections: List[Tuple[int, int, int, int, float, str]],
-    frame_number: Optional[int] = None
-) -> bool:
-    """
-    Save fish detections to database via Next.js API
+def format_detection_record(
+    detections: Union[DetectionBatch, List[Tuple[int, int, int, int, float, str]]],
+    frame_number: Optional[int] = None,
+    timestamp: Optional[datetime] = None
+) -> dict:
+    """Build the /api/detections JSON document for one frame"""
+    detection_details = []
+    for (x1, y1, x2, y2, conf, name) in detections:
+        detection_details.append({
+            "className": name,
+            "confidence": float(conf),
+            "boundingBox": {
+                "x1": float(x1),
+                "y1": float(y1),
+                "x2": float(x2),
+                "y2": float(y2)
+            }
+        })
+
+    return {
+        "sessionId": streaming_session_id,
+        "timestamp": (timestamp or datetime.utcnow()).isoformat() + "Z",
+        "fishCount": len(detections),
+        "frameNumber": frame_number,
+        "detections": detection_details
+    }
+
+
+def get_http_client() -> Optional[httpx.AsyncClient]:
+    return http_client
 
-    Args:
-        detections: List of (x1, y1, x2, y2, confidence, class_name)
-        frame_number: Frame number (optional)
-
-    Returns:
-        bool: True if successful, False otherwise
-    """
-    if not SAVE_DETECTIONS_ENABLED or not http_client:
-        return False
-
-    if len(detections) < MIN_DETECTIONS_TO_SAVE:
-        return False
-
-    try:
-        # Format data for API
-        detection_details = []
-        for (x1, y1, x2, y2, conf, name) in detections:
-            detection_details.append({
-                "className": name,
-                "confidence": float(conf),
-                "boundingBox": {
-                    "x1": float(x1),
-                    "y1": float(y1),
-                    "x2": float(x2),
-                    "y2": float(y2)
-                }
-            })
-
-        payload = {
-            "sessionId": streaming_session_id,
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "fishCount": len(detections),
-            "frameNumber": frame_number,
-            "detections": detection_details
-        }
-
-        # Send to API
-        response = await http_client.post(
-            f"{API_BASE_URL}/api/detections",
-            json=payload,
-            timeout=5.0
-        )
-
-        if response.status_code == 201:
-            logger.info(f"✓ Saved {len(detections)} detections to database (frame {frame_number})")
-            return True
-        else:
-            logger.warning(f"Failed to save detections: HTTP {response.status_code} - {response.text}")
-            return False
-
-    except httpx.TimeoutException:
-        logger.warning("Timeout while saving detections to database")
-        return False
-    except Exception as e:
-        logger.error(f"Error saving detections to database: {e}")
-        return False
@@ -1,15 +1,19 @@
 import logging
 import torch
 from contextlib import asynccontextmanager
-from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from config import SAVE_DETECTIONS_ENABLED, SAVE_INTERVAL_SECONDS, API_BASE_URL
+from config import SAVE_DETECTIONS_ENABLED, SAVE_INTERVAL_SECONDS, API_BASE_URL, EVENT_CLIPS_ENABLED, SHARED_ENCODER_ENABLED
 from models.yolo_detector import load_custom_model, get_device_info
+from models.inference_executor import shutdown_inference_executor
+from models.batch_engine import inference_engine
 from database.detections import initialize_http_client, close_http_client
+from database.detection_writer import detection_writer
 from video.recording import initialize_recordings_dir, cleanup_all_recordings
+from video.event_clips import start_event_clips, stop_event_clips
+from video.detection_track import check_keyframe_forwarding
 from webrtc.peer_connection import cleanup_all
 from api.routes import setup_routes
 
@@ -19,12 +23,6 @@ from api.routes import setup_routes
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("carter-backend")
 
-# ==========================
-# Global Resources
-# ==========================
-inference_executor = ThreadPoolExecutor(max_workers=2)
-
-
 # ==========================
 # Lifespan Manager
 # ==========================
@@ -41,12 +39,22 @@ async def lifespan(app: FastAPI):
     # Initialize HTTP client for database operations
     if SAVE_DETECTIONS_ENABLED:
         await initialize_http_client()
+        detection_writer.start()
         logger.info(f"Database saving enabled")
-        logger.info(f"API endpoint: {API_BASE_URL}/api/detections")
-        logger.info(f"Save interval: {SAVE_INTERVAL_SECONDS}s")
+        logger.info(f"API endpoint: {API_BASE_URL}/api/detections/batch")
+        logger.info(f"Save interval: {SAVE_INTERVAL_SECONDS or 'every inference'}"
+                    f"{'s' if SAVE_INTERVAL_SECONDS else ''}")
     else:
         logger.info("Database saving disabled")
 
+    # Shared-encoder peers' keyframe requests go through a private aiortc flag
+    if SHARED_ENCODER_ENABLED:
+        check_keyframe_forwarding()
+
+    # Event clips keep the camera open and buffer its packets from startup
+    if EVENT_CLIPS_ENABLED:
+        start_event_clips()
+
     logger.info("=" * 60)
     logger.info("Backend ready!")
     logger.info("=" * 60)
@@ -56,17 +64,20 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down...")
     try:
-        # Close HTTP client
+        # Flush queued detections, then close HTTP client
+        await detection_writer.stop()
         await close_http_client()
 
-        # Cleanup all recordings
-        cleanup_all_recordings()
+        # Close an in-progress event clip, then finalize open recordings and wait for pending ones
+        await stop_event_clips()
+        await cleanup_all_recordings()
 
         # Close all peer connections
         await cleanup_all()
 
-        # Shutdown executor
-        inference_executor.shutdown(wait=True)
+        # Shutdown batching engine and executor
+        inference_engine.stop()
+        shutdown_inference_executor()
 
         # Clear GPU memory
         if torch.cuda.is_available():
@@ -0,0 +1,273 @@
+"""
+Inference backends
+
+Every backend serves the same ultralytics YOLO predict API; they differ in the
+weights format they load, the device they run on and the numeric precision
+they support. Non-torch backends export the .pt checkpoint on first start and
+cache the artifact next to it.
+"""
+import os
+import shutil
+import logging
+import torch
+from typing import Dict, Type, Optional
+
+from config import MODEL_IMGSZ, INT8_MODE
+
+logger = logging.getLogger("carter-backend")
+
+PRECISIONS = ("fp32", "fp16", "int8")
+
+
+class InferenceBackend:
+    name = "torch"
+    export_format: str = ""
+
+    def __init__(self, weights: str, precision: str = "fp32"):
+        self.weights = weights
+        self.model_path = weights
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.requested_precision = precision
+        self.precision = "fp32"
+        self.model = None
+        # Filled in after load when precision != fp32
+        self.accuracy_delta: Optional[dict] = None
+
+    def check_available(self):
+        """Raise ImportError if the runtime for this backend is not installed"""
+
+    def supported_precision(self, precision: str) -> bool:
+        if precision == "fp16":
+            return self.device == "cuda"
+        return precision == "fp32"
+
+    def resolve_precision(self):
+        precision = self.requested_precision
+        if precision not in PRECISIONS:
+            logger.warning(f"Unknown precision '{precision}', using fp32")
+            precision = "fp32"
+        if not self.supported_precision(precision):
+            logger.warning(
+                f"Precision {precision} not supported by backend '{self.name}' on {self.device}, using fp32"
+            )
+            precision = "fp32"
+        self.precision = precision
+
+    def artifact_path(self, precision: str) -> str:
+        return self.weights
+
+    def prepare(self) -> str:
+        """Return the path to load, exporting and caching it if needed"""
+        self.check_available()
+        self.resolve_precision()
+        path = self.artifact_path(self.precision)
+        if path != self.weights and not self._is_fresh(path):
+            path = self._build(self.precision, path)
+        self.model_path = path
+        return path
+
+    def _is_fresh(self, path: str) -> bool:
+        return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.weights)
+
+    def _build(self, precision: str, target: str) -> str:
+        return self._export(target, **self.export_kwargs(precision))
+
+    def _export(self, target: str, **kwargs) -> str:
+        from ultralytics import YOLO
+        logger.info(f"Exporting {self.weights} to {self.export_format} {kwargs or ''} (first start, cached afterwards)...")
+        exported = str(YOLO(self.weights).export(
+            format=self.export_format,
+            imgsz=MODEL_IMGSZ,
+            **kwargs
+        ))
+        if os.path.abspath(exported) != os.path.abspath(target):
+            _replace_path(exported, target)
+        logger.info(f"Exported model cached at {target}")
+        return target
+
+    def export_kwargs(self, precision: str) -> dict:
+        return {"dynamic": True}
+
+    def predict_kwargs(self) -> dict:
+        return {}
+
+    def load(self):
+        from ultralytics import YOLO
+        model = YOLO(self.prepare(), task="detect")
+        if self.name == "torch" and self.device == "cuda":
+            model.to("cuda")
+        self.model = model
+        return model
+
+    def info(self) -> dict:
+        return {
+            "backend": self.name,
+            "model_path": self.model_path,
+            "backend_device": self.device,
+            "precision": self.precision,
+            "accuracy_delta": self.accuracy_delta,
+        }
+
+
+class TorchBackend(InferenceBackend):
+    name = "torch"
+
+    def predict_kwargs(self) -> dict:
+        return {"half": True} if self.precision == "fp16" else {}
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+    export_format = "onnx"
+
+    def __init__(self, weights: str, precision: str = "fp32"):
+        super().__init__(weights, precision)
+        self.device = "cpu"
+
+    def check_available(self):
+        import onnxruntime
+        if "CUDAExecutionProvider" in onnxruntime.get_available_providers() and torch.cuda.is_available():
+            self.device = "cuda"
+
+    def artifact_path(self, precision: str) -> str:
+        suffix = "" if precision == "fp32" else f"-{precision}"
+        return os.path.splitext(self.weights)[0] + f"{suffix}.onnx"
+
+    def supported_precision(self, precision: str) -> bool:
+        # INT8 runs through ONNX Runtime quantization; FP16 is served by
+        # the torch backend, since half ONNX exports lose dynamic batch shapes
+        return precision in ("fp32", "int8")
+
+    def export_kwargs(self, precision: str) -> dict:
+        return {"dynamic": True, "simplify": True}
+
+    def _build(self, precision: str, target: str) -> str:
+        if precision != "int8":
+            return super()._build(precision, target)
+
+        fp32_path = self.artifact_path("fp32")
+        if not self._is_fresh(fp32_path):
+            self._export(fp32_path, **self.export_kwargs("fp32"))
+        return _quantize_onnx(fp32_path, target)
+
+
+class OpenVinoBackend(InferenceBackend):
+    name = "openvino"
+    export_format = "openvino"
+
+    def __init__(self, weights: str, precision: str = "fp32"):
+        super().__init__(weights, precision)
+        self.device = "cpu"
+
+    def check_available(self):
+        import openvino  # noqa: F401
+
+    def supported_precision(self, precision: str) -> bool:
+        # FP16 IR halves weight size; INT8 goes through NNCF post-training quantization
+        return precision in PRECISIONS
+
+    def artifact_path(self, precision: str) -> str:
+        suffix = "" if precision == "fp32" else f"-{precision}"
+        return os.path.splitext(self.weights)[0] + f"{suffix}_openvino_model"
+
+    def export_kwargs(self, precision: str) -> dict:
+        if precision == "fp16":
+            return {"dynamic": True, "half": True}
+        if precision == "int8":
+            from models.calibration import split_calibration_frames, write_dataset_yaml
+            from ultralytics import YOLO
+            calibration, _ = split_calibration_frames()
+            if not calibration:
+                raise RuntimeError("INT8 calibration needs recorded footage; no calibration frames available")
+            data = write_dataset_yaml(YOLO(self.weights).names, calibration)
+            return {"dynamic": True, "int8": True, "data": data}
+        return {"dynamic": True}
+
+
+def _replace_path(src: str, dst: str):
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.exists(dst):
+        os.remove(dst)
+    shutil.move(src, dst)
+
+
+def _quantize_onnx(fp32_path: str, target: str) -> str:
+    """
+    INT8 quantization for ONNX Runtime on CPU
+
+    Static (QDQ, calibrated on recorded frames) when INT8_MODE=static and
+    frames are available, dynamic (weights only, no calibration) otherwise.
+    """
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static
+    )
+    from models.calibration import split_calibration_frames, load_frames, letterbox_tensor
+
+    # The held-out frames are left for the accuracy check
+    paths = split_calibration_frames()[0] if INT8_MODE == "static" else []
+    if not paths:
+        if INT8_MODE == "static":
+            logger.warning("No calibration frames available, falling back to dynamic INT8 quantization")
+        logger.info(f"Quantizing {fp32_path} to INT8 (dynamic)...")
+        quantize_dynamic(fp32_path, target, weight_type=QuantType.QUInt8)
+        _copy_onnx_metadata(fp32_path, target)
+        logger.info(f"INT8 model cached at {target}")
+        return target
+
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=["CPUExecutionProvider"]
+    ).get_inputs()[0].name
+
+    class _FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            for path in self._paths:
+                frames = load_frames([path])
+                if frames:
+                    return {input_name: letterbox_tensor(frames[0], MODEL_IMGSZ)}
+            return None
+
+    logger.info(f"Quantizing {fp32_path} to INT8 with {len(paths)} calibration frames...")
+    quantize_static(
+        fp32_path,
+        target,
+        _FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    _copy_onnx_metadata(fp32_path, target)
+    logger.info(f"INT8 model cached at {target}")
+    return target
+
+
+def _copy_onnx_metadata(src_path: str, dst_path: str):
+    """Keep the ultralytics metadata (class names, stride, imgsz) on the quantized graph"""
+    import onnx
+    src, dst = onnx.load(src_path), onnx.load(dst_path)
+    if not dst.metadata_props:
+        dst.metadata_props.extend(src.metadata_props)
+        onnx.save(dst, dst_path)
+
+
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    "torch": TorchBackend,
+    "onnx": OnnxBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def create_backend(name: str, weights: str, precision: str = "fp32") -> InferenceBackend:
+    backend_cls = BACKENDS.get(name.lower())
+    if backend_cls is None:
+        raise ValueError(f"Unknown inference backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return backend_cls(weights, precision.lower())
@@ -0,0 +1,176 @@
+"""
+Batching inference engine
+
+Frames from every active detection pipeline are collected over a short window
+(up to INFERENCE_MAX_BATCH frames or INFERENCE_MAX_WAIT_MS) and run through
+the model in one call; results are scattered back to the callers. While the
+model is busy, new frames keep accumulating, so batches grow with load.
+"""
+import time
+import asyncio
+import logging
+import numpy as np
+from typing import Optional, List, Tuple, Union
+
+from config import INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS, INFERENCE_MAX_IN_FLIGHT
+from models.detection_batch import DetectionBatch
+from models.preprocess import ModelInput
+from models.inference_executor import submit_batch_inference
+from monitoring.metrics import Histogram, GaugeFunction, registry
+
+logger = logging.getLogger("carter-backend")
+
+# (image or ModelInput, (conf, iou, max_det, imgsz), future)
+_Request = Tuple[Union[np.ndarray, ModelInput], tuple, asyncio.Future]
+
+BATCH_SECONDS = registry.register(Histogram(
+    "carter_inference_batch_seconds",
+    "Wall time of one batched model call",
+))
+BATCH_SIZE = registry.register(Histogram(
+    "carter_inference_batch_size",
+    "Frames per batched model call",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+))
+
+
+class BatchInferenceEngine:
+
+    def __init__(
+        self,
+        max_batch: int = INFERENCE_MAX_BATCH,
+        max_wait_ms: float = INFERENCE_MAX_WAIT_MS,
+        max_in_flight: int = INFERENCE_MAX_IN_FLIGHT
+    ):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_in_flight = max(1, max_in_flight)
+
+        # Pipelines feeding the engine; each has at most one frame pending
+        self.producers = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Stats
+        self.batches = 0
+        self.frames = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+
+    def register(self):
+        self.producers += 1
+
+    def unregister(self):
+        self.producers = max(0, self.producers - 1)
+
+    def accepting(self) -> bool:
+        """True if a new frame would join the next batch instead of queueing behind it"""
+        return self._queue is None or self._queue.qsize() < self.max_batch
+
+    def _ensure_started(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.create_task(self._collect())
+
+    async def infer(
+        self,
+        img: Union[np.ndarray, ModelInput],
+        conf: float,
+        iou: float,
+        max_det: int,
+        imgsz: Optional[int] = None
+    ) -> DetectionBatch:
+        """Queue one frame for the next batch and wait for its detections"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((img, (conf, iou, max_det, imgsz), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch: List[_Request] = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+
+                # Wait for the other producers, but never longer than the window
+                while len(batch) < min(self.max_batch, max(1, self.producers)):
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                await self._slots.acquire()
+                # Frames that arrived while waiting for a slot ride along
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                asyncio.create_task(self._run_batch(batch))
+        except asyncio.CancelledError:
+            pass
+
+    async def _run_batch(self, batch: List[_Request]):
+        try:
+            # A single model call needs shared thresholds; group by parameters
+            groups = {}
+            for req in batch:
+                groups.setdefault(req[1], []).append(req)
+
+            for (conf, iou, max_det, imgsz), reqs in groups.items():
+                t0 = time.perf_counter()
+                try:
+                    results = await submit_batch_inference(
+                        [img for img, _, _ in reqs], conf, iou, max_det, imgsz
+                    )
+                except Exception as e:
+                    logger.warning(f"Batch inference error: {e}")
+                    results = [DetectionBatch.empty() for _ in reqs]
+
+                self.batches += 1
+                self.frames += len(reqs)
+                self.last_batch_size = len(reqs)
+                self.last_batch_ms = (time.perf_counter() - t0) * 1000.0
+                BATCH_SECONDS.labels().observe(self.last_batch_ms / 1000.0)
+                BATCH_SIZE.labels().observe(len(reqs))
+
+                for (_, _, future), dets in zip(reqs, results):
+                    if not future.done():
+                        future.set_result(dets)
+        finally:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batch inference aborted"))
+            self._slots.release()
+
+    def state(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000.0, 1),
+            "producers": self.producers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "avg_batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+        }
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queue = None
+
+
+# Shared engine for all sources
+inference_engine = BatchInferenceEngine()
+
+registry.register(GaugeFunction(
+    "carter_inference_queue_depth", "Frames waiting for the next batch", (),
+    lambda: [((), inference_engine._queue.qsize() if inference_engine._queue is not None else 0)]
+))
@@ -0,0 +1,174 @@
+"""
+Calibration frames and accuracy checks for reduced-precision models
+
+Frames are sampled from saved recordings and cached as JPEGs in
+CALIBRATION_DIR, so INT8 calibration and the accuracy check see real
+underwater footage instead of random noise. The last ACCURACY_CHECK_FRAMES
+are held out of calibration, so the accuracy check never scores a model on
+the data it was calibrated with.
+"""
+import os
+import glob
+import logging
+import cv2
+import numpy as np
+from typing import List, Optional, Tuple
+
+from config import (
+    RECORDINGS_DIR,
+    CALIBRATION_DIR,
+    CALIBRATION_FRAMES,
+    ACCURACY_CHECK_FRAMES,
+    YOLO_CONF_THRESHOLD,
+    YOLO_IOU_THRESHOLD,
+    YOLO_MAX_DETECTIONS
+)
+
+logger = logging.getLogger("carter-backend")
+
+IMAGES_DIR = os.path.join(CALIBRATION_DIR, "images")
+
+
+def _cached_frame_paths() -> List[str]:
+    return sorted(glob.glob(os.path.join(IMAGES_DIR, "*.jpg")))
+
+
+def _recording_paths() -> List[str]:
+    paths = []
+    for pattern in ("recording_*.webm", "recording_*.mp4", "recording_*.mkv"):
+        paths.extend(glob.glob(os.path.join(RECORDINGS_DIR, pattern)))
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def _sample_recording(path: str, count: int) -> List[np.ndarray]:
+    cap = cv2.VideoCapture(path)
+    frames = []
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total <= 0:
+            # Containers without a frame count: read sequentially, keep every 10th
+            idx = 0
+            while len(frames) < count:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                if idx % 10 == 0:
+                    frames.append(frame)
+                idx += 1
+            return frames
+
+        for pos in np.linspace(0, total - 1, num=min(count, total), dtype=int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(pos))
+            ok, frame = cap.read()
+            if ok:
+                frames.append(frame)
+    finally:
+        cap.release()
+    return frames
+
+
+def collect_calibration_frames(limit: int = CALIBRATION_FRAMES) -> List[str]:
+    """
+    Ensure up to `limit` calibration frames exist on disk
+
+    Returns:
+        Paths of the cached calibration JPEGs
+    """
+    paths = _cached_frame_paths()
+    if len(paths) >= limit:
+        return paths[:limit]
+
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    recordings = _recording_paths()
+    if not recordings:
+        logger.warning(f"No recordings in {RECORDINGS_DIR} to sample calibration frames from")
+        return paths
+
+    per_recording = max(1, (limit - len(paths)) // len(recordings) + 1)
+    index = len(paths)
+    for rec in recordings:
+        for frame in _sample_recording(rec, per_recording):
+            if index >= limit:
+                break
+            cv2.imwrite(os.path.join(IMAGES_DIR, f"frame_{index:05d}.jpg"), frame)
+            index += 1
+        if index >= limit:
+            break
+
+    paths = _cached_frame_paths()
+    logger.info(f"Calibration set: {len(paths)} frames in {IMAGES_DIR}")
+    return paths[:limit]
+
+
+def split_calibration_frames() -> Tuple[List[str], List[str]]:
+    """
+    (calibration, accuracy check) frame paths; the two never overlap
+
+    With few frames on hand at most half are held out, so calibration keeps
+    enough data.
+    """
+    paths = collect_calibration_frames(CALIBRATION_FRAMES + ACCURACY_CHECK_FRAMES)
+    held_out = min(ACCURACY_CHECK_FRAMES, len(paths) // 2)
+    if held_out == 0:
+        return paths, []
+    return paths[:-held_out], paths[-held_out:]
+
+
+def load_frames(paths: List[str]) -> List[np.ndarray]:
+    frames = [cv2.imread(p) for p in paths]
+    return [f for f in frames if f is not None]
+
+
+def write_dataset_yaml(names, image_paths: List[str]) -> str:
+    """Write an ultralytics dataset YAML listing exactly the given calibration images"""
+    if isinstance(names, dict):
+        names = [names[i] for i in sorted(names)]
+    with open(os.path.join(CALIBRATION_DIR, "calibration.txt"), "w") as f:
+        for image in image_paths:
+            f.write(os.path.abspath(image) + "\n")
+    path = os.path.join(CALIBRATION_DIR, "calibration.yaml")
+    with open(path, "w") as f:
+        f.write(f"path: {CALIBRATION_DIR}\n")
+        f.write("train: calibration.txt\n")
+        f.write("val: calibration.txt\n")
+        f.write("names:\n")
+        for i, name in enumerate(names or []):
+            f.write(f"  {i}: {name}\n")
+    return path
+
+
+def letterbox_tensor(img: np.ndarray, imgsz: int) -> np.ndarray:
+    """BGR HWC uint8 -> letterboxed RGB NCHW float32 in [0, 1]"""
+    h, w = img.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+    return np.ascontiguousarray(tensor)
+
+
+def measure_accuracy_delta(candidate, reference, frames: Optional[List[np.ndarray]] = None) -> Optional[dict]:
+    """
+    Compare a reduced-precision backend against an fp32 reference
+
+    Uses the frames held out of INT8 calibration unless explicit frames are
+    given; returns None if none are available.
+    """
+    from models.parity import compare_detections, summarize
+    from models.yolo_detector import predict_batch, _build_class_names
+
+    if frames is None:
+        _, held_out = split_calibration_frames()
+        frames = load_frames(held_out)
+    if not frames:
+        return None
+
+    names = _build_class_names(getattr(reference.model, "names", None))
+    comparisons = []
+    for img in frames:
+        ref = predict_batch(reference, names, [img], YOLO_CONF_THRESHOLD, YOLO_IOU_THRESHOLD, YOLO_MAX_DETECTIONS)[0]
+        cand = predict_batch(candidate, names, [img], YOLO_CONF_THRESHOLD, YOLO_IOU_THRESHOLD, YOLO_MAX_DETECTIONS)[0]
+        comparisons.append(compare_detections(ref, cand))
+    return summarize(comparisons)
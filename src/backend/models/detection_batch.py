@@ -0,0 +1,81 @@
+"""
+Array-backed detection results
+"""
+import numpy as np
+from typing import Iterator, Optional, Tuple
+
+Detection = Tuple[int, int, int, int, float, str]
+
+
+class DetectionBatch:
+    """
+    Detections for one frame stored as contiguous arrays
+
+    Iterating (or indexing) yields the classic
+    (x1, y1, x2, y2, confidence, class_name) tuples, built on demand.
+    """
+    __slots__ = ("boxes", "scores", "classes", "class_names")
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        scores: np.ndarray,
+        classes: np.ndarray,
+        class_names: Optional[np.ndarray] = None
+    ):
+        self.boxes = boxes              # (N, 4) int32 xyxy
+        self.scores = scores            # (N,) float32
+        self.classes = classes          # (N,) int32
+        self.class_names = class_names  # object array indexed by class id
+
+    @classmethod
+    def empty(cls) -> "DetectionBatch":
+        return cls(
+            np.empty((0, 4), dtype=np.int32),
+            np.empty((0,), dtype=np.float32),
+            np.empty((0,), dtype=np.int32),
+        )
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, class_names: Optional[np.ndarray] = None) -> "DetectionBatch":
+        """Build from an (N, 6) [x1, y1, x2, y2, conf, cls] array"""
+        if data.size == 0:
+            batch = cls.empty()
+            batch.class_names = class_names
+            return batch
+        return cls(
+            np.ascontiguousarray(data[:, :4], dtype=np.int32),
+            np.ascontiguousarray(data[:, 4], dtype=np.float32),
+            np.ascontiguousarray(data[:, 5], dtype=np.int32),
+            class_names,
+        )
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def name(self, cls: int) -> str:
+        if self.class_names is not None and 0 <= cls < len(self.class_names):
+            return self.class_names[cls]
+        return f"Class_{cls}"
+
+    def __getitem__(self, i: int) -> Detection:
+        x1, y1, x2, y2 = self.boxes[i].tolist()
+        cls = int(self.classes[i])
+        return (x1, y1, x2, y2, float(self.scores[i]), self.name(cls))
+
+    def __iter__(self) -> Iterator[Detection]:
+        boxes = self.boxes.tolist()
+        scores = self.scores.tolist()
+        classes = self.classes.tolist()
+        for (x1, y1, x2, y2), conf, cls in zip(boxes, scores, classes):
+            yield (x1, y1, x2, y2, conf, self.name(cls))
+
+    def names(self) -> list:
+        """Class name of every detection"""
+        return [self.name(c) for c in self.classes.tolist()]
+
+    def copy(self) -> "DetectionBatch":
+        return DetectionBatch(self.boxes.copy(), self.scores.copy(), self.classes.copy(), self.class_names)
+
+    def to_list(self) -> list:
+        return list(self)
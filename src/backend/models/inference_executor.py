@@ -0,0 +1,41 @@
+"""
+Dedicated executor for YOLO inference
+
+Model forward passes run on worker threads so the asyncio loop (signaling,
+health endpoints, RTP for every peer) never blocks on the model. Calls come
+from the batching engine, which bounds how many batches are in flight
+(INFERENCE_MAX_IN_FLIGHT).
+"""
+import asyncio
+import logging
+import numpy as np
+from typing import Optional, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from config import INFERENCE_WORKERS
+from models.yolo_detector import run_inference_batch
+from models.preprocess import ModelInput
+
+logger = logging.getLogger("carter-backend")
+
+inference_executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS,
+    thread_name_prefix="inference"
+)
+
+
+def submit_batch_inference(
+    imgs: List[Union[np.ndarray, ModelInput]],
+    conf: float,
+    iou: float,
+    max_det: int,
+    imgsz: Optional[int] = None
+) -> asyncio.Future:
+    """Schedule run_inference_batch on the inference executor"""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(
+        inference_executor, run_inference_batch, imgs, conf, iou, max_det, imgsz
+    )
+
+
+def shutdown_inference_executor():
+    inference_executor.shutdown(wait=True)
@@ -0,0 +1,145 @@
+"""
+Detection parity between inference backends
+
+Runs the same fixed images through several backends and compares every
+backend's detections against the first one (the reference):
+
+    python -m models.parity img1.jpg img2.jpg --backends torch,onnx,openvino
+
+A backend may carry a precision suffix, e.g. --backends torch,onnx:int8.
+
+Exits non-zero when any backend's agreement falls below --min-agreement.
+"""
+import sys
+import argparse
+import logging
+import numpy as np
+from typing import Dict, List
+
+from config import MODEL_PATH, YOLO_CONF_THRESHOLD, YOLO_IOU_THRESHOLD, YOLO_MAX_DETECTIONS
+from models.detection_batch import DetectionBatch
+
+logger = logging.getLogger("carter-backend")
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes"""
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def compare_detections(ref: DetectionBatch, other: DetectionBatch, iou_thr: float = 0.5) -> dict:
+    """Greedy same-class IoU matching of other against ref"""
+    matched_iou: List[float] = []
+    conf_delta: List[float] = []
+    if len(ref) and len(other):
+        ious = box_iou(ref.boxes, other.boxes)
+        ious[ref.classes[:, None] != other.classes[None, :]] = 0.0
+        while True:
+            i, j = np.unravel_index(np.argmax(ious), ious.shape)
+            if ious[i, j] < iou_thr:
+                break
+            matched_iou.append(float(ious[i, j]))
+            conf_delta.append(abs(float(ref.scores[i]) - float(other.scores[j])))
+            ious[i, :] = 0.0
+            ious[:, j] = 0.0
+
+    return {
+        "reference": len(ref),
+        "candidate": len(other),
+        "matched": len(matched_iou),
+        "iou_sum": sum(matched_iou),
+        "conf_delta_sum": sum(conf_delta),
+    }
+
+
+def summarize(comparisons: List[dict]) -> dict:
+    """Aggregate per-image comparisons into recall/precision style agreement"""
+    ref = sum(c["reference"] for c in comparisons)
+    cand = sum(c["candidate"] for c in comparisons)
+    matched = sum(c["matched"] for c in comparisons)
+    return {
+        "images": len(comparisons),
+        "reference_detections": ref,
+        "candidate_detections": cand,
+        "matched": matched,
+        "recall": round(matched / ref, 4) if ref else 1.0,
+        "precision": round(matched / cand, 4) if cand else 1.0,
+        "mean_iou": round(sum(c["iou_sum"] for c in comparisons) / matched, 4) if matched else None,
+        "mean_conf_delta": round(sum(c["conf_delta_sum"] for c in comparisons) / matched, 4) if matched else None,
+    }
+
+
+def run_parity(
+    images: List[np.ndarray],
+    backend_names: List[str],
+    conf: float = YOLO_CONF_THRESHOLD,
+    iou: float = YOLO_IOU_THRESHOLD,
+    max_det: int = YOLO_MAX_DETECTIONS
+) -> Dict[str, dict]:
+    """Compare every backend against the first one on the given images"""
+    from models.backends import create_backend
+    from models.yolo_detector import predict_batch, _build_class_names
+
+    results: Dict[str, List[DetectionBatch]] = {}
+    for name in backend_names:
+        backend_name, _, precision = name.partition(":")
+        backend = create_backend(backend_name, MODEL_PATH, precision or "fp32")
+        model = backend.load()
+        names = _build_class_names(getattr(model, "names", None))
+        results[name] = [
+            predict_batch(backend, names, [img], conf, iou, max_det)[0]
+            for img in images
+        ]
+
+    reference = backend_names[0]
+    report = {}
+    for name in backend_names[1:]:
+        report[name] = summarize([
+            compare_detections(r, o) for r, o in zip(results[reference], results[name])
+        ])
+    return report
+
+
+def main() -> int:
+    import cv2
+
+    parser = argparse.ArgumentParser(description="Compare detections across inference backends")
+    parser.add_argument("images", nargs="+", help="Fixed test images")
+    parser.add_argument("--backends", default="torch,onnx", help="Comma separated; first is the reference")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="Minimum recall and precision")
+    args = parser.parse_args()
+
+    images = []
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"Cannot read image: {path}", file=sys.stderr)
+            return 2
+        images.append(img)
+
+    backend_names = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if len(backend_names) < 2:
+        print("Need at least two backends to compare", file=sys.stderr)
+        return 2
+
+    report = run_parity(images, backend_names)
+    ok = True
+    for name, stats in report.items():
+        passed = stats["recall"] >= args.min_agreement and stats["precision"] >= args.min_agreement
+        ok = ok and passed
+        print(f"{backend_names[0]} vs {name}: {'PASS' if passed else 'FAIL'} {stats}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Model input preprocessing
+
+The display frame is letterboxed once into a pooled uint8 canvas at the
+model's input shape (ultralytics-style rect letterbox: long side to imgsz,
+short side padded to a stride multiple). On the inference thread the canvases
+are packed into a reusable batch tensor (pinned host memory and a
+non-blocking upload on CUDA; BGR->RGB, CHW and /255 happen on the device),
+so ultralytics skips its own letterbox. Boxes come back in canvas
+coordinates and are mapped to display space with the stored LetterboxMeta.
+"""
+import threading
+import cv2
+import numpy as np
+import torch
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import MODEL_IMGSZ
+from video.frame_pool import FramePool
+
+PAD_VALUE = 114
+
+
+class LetterboxMeta(NamedTuple):
+    ratio: float   # display -> canvas scale
+    pad_x: int     # left padding in canvas pixels
+    pad_y: int     # top padding in canvas pixels
+    width: int     # display size
+    height: int
+
+
+class ModelInput(NamedTuple):
+    image: np.ndarray  # (H, W, 3) uint8 BGR canvas, H and W multiples of the stride
+    meta: LetterboxMeta
+
+
+def letterbox_shape(width: int, height: int, imgsz: int, stride: int = 32) -> Tuple[int, int, int, int, float]:
+    """(canvas_h, canvas_w, resized_h, resized_w, ratio) for a display size"""
+    r = min(imgsz / height, imgsz / width)
+    nw, nh = int(round(width * r)), int(round(height * r))
+    ch = nh + (imgsz - nh) % stride
+    cw = nw + (imgsz - nw) % stride
+    return ch, cw, nh, nw, r
+
+
+class Preprocessor:
+
+    def __init__(self, pool: Optional[FramePool] = None, stride: int = 32):
+        self.pool = pool or FramePool()
+        self.stride = stride
+
+    def letterbox(self, img: np.ndarray, imgsz: Optional[int] = None) -> ModelInput:
+        """Letterbox img into a pooled canvas; img itself is not kept"""
+        h, w = img.shape[:2]
+        ch, cw, nh, nw, r = letterbox_shape(w, h, imgsz or MODEL_IMGSZ, self.stride)
+        top, left = (ch - nh) // 2, (cw - nw) // 2
+
+        canvas = self.pool.acquire((ch, cw, 3))
+        if top:
+            canvas[:top] = PAD_VALUE
+            canvas[top + nh:] = PAD_VALUE
+        if left:
+            canvas[:, :left] = PAD_VALUE
+            canvas[:, left + nw:] = PAD_VALUE
+
+        if left == 0:
+            # Full-width rows are contiguous: resize straight into the canvas
+            cv2.resize(img, (nw, nh), dst=canvas[top:top + nh], interpolation=cv2.INTER_LINEAR)
+        else:
+            canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        return ModelInput(canvas, LetterboxMeta(r, left, top, w, h))
+
+    def release(self, item):
+        """Return a submitted frame's buffer once inference is done with it"""
+        self.pool.release(item.image if isinstance(item, ModelInput) else item)
+
+
+# Per inference thread: {(key): tensor}
+_buffers = threading.local()
+
+
+def _buffer(key: tuple, shape: tuple, dtype: torch.dtype, device: str, pinned: bool = False) -> torch.Tensor:
+    cache: Dict[tuple, torch.Tensor] = getattr(_buffers, "cache", None)
+    if cache is None:
+        cache = _buffers.cache = {}
+    buf = cache.get(key)
+    if buf is None or buf.shape != shape:
+        buf = torch.empty(shape, dtype=dtype, device=device, pin_memory=pinned)
+        cache[key] = buf
+    return buf
+
+
+def to_batch_tensor(inputs: List[ModelInput], device: str, half: bool = False) -> torch.Tensor:
+    """
+    Pack same-shape canvases into a normalized (B, 3, H, W) RGB tensor
+
+    The returned tensor is reused by the next call on the same thread.
+    """
+    b = len(inputs)
+    h, w = inputs[0].image.shape[:2]
+    cuda = device.startswith("cuda")
+
+    host = _buffer(("host",), (b, h, w, 3), torch.uint8, "cpu", pinned=cuda)
+    for i, item in enumerate(inputs):
+        host[i].copy_(torch.from_numpy(item.image))
+
+    # uint8 upload is 4x smaller than float; convert on the device
+    src = host.to(device, non_blocking=True) if cuda else host
+    dtype = torch.float16 if half else torch.float32
+    out = _buffer(("input", device, dtype), (b, 3, h, w), dtype, device)
+    for c in range(3):
+        out[:, c].copy_(src[..., 2 - c])
+    out.mul_(1.0 / 255.0)
+    return out
+
+
+def map_to_display(rows: np.ndarray, meta: LetterboxMeta) -> np.ndarray:
+    """Map (N, 6) [x1, y1, x2, y2, conf, cls] rows from canvas to display coordinates"""
+    if not len(rows):
+        return rows
+    rows = rows.copy()
+    rows[:, [0, 2]] = np.clip((rows[:, [0, 2]] - meta.pad_x) / meta.ratio, 0, meta.width)
+    rows[:, [1, 3]] = np.clip((rows[:, [1, 3]] - meta.pad_y) / meta.ratio, 0, meta.height)
+    return rows
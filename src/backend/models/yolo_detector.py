@@ -5,55 +5,139 @@ import os
 import logging
 import torch
 import numpy as np
-from typing import Optional, List, Tuple
-from config import MODEL_PATH
+from typing import Optional, List, Union
+from config import (
+    MODEL_PATH,
+    INFERENCE_BACKEND,
+    MODEL_PRECISION,
+    ACCURACY_CHECK_ENABLED,
+    MODEL_INPUT_LETTERBOX,
+    RESIZE_WIDTH,
+    RESIZE_HEIGHT
+)
+from models.detection_batch import DetectionBatch
+from models.backends import InferenceBackend, create_backend
+from models.preprocess import ModelInput, Preprocessor, to_batch_tensor, map_to_display
 
 logger = logging.getLogger("carter-backend")
 
 # Global model instance
 custom_model = None
 device_info = "CPU"
+class_names: Optional[np.ndarray] = None  # class id -> name lookup table
+backend: Optional[InferenceBackend] = None
+
+
+def _load_backend(name: str, precision: str) -> InferenceBackend:
+    selected = create_backend(name, MODEL_PATH, precision)
+    try:
+        selected.load()
+        return selected
+    except ImportError as e:
+        if selected.name == "torch":
+            raise
+        logger.warning(f"Backend '{selected.name}' unavailable ({e}), falling back to torch")
+    except Exception as e:
+        if selected.precision != "fp32":
+            logger.exception(f"{selected.precision} model failed to build ({e}), retrying with fp32")
+            return _load_backend(name, "fp32")
+        if selected.name == "torch":
+            raise
+        logger.exception(f"Backend '{selected.name}' failed to load ({e}), falling back to torch")
+    fallback = create_backend("torch", MODEL_PATH)
+    fallback.load()
+    return fallback
+
+
+def _check_accuracy(candidate: InferenceBackend):
+    """Report detection agreement of a reduced-precision model against fp32"""
+    from models.calibration import measure_accuracy_delta
+    try:
+        reference = create_backend("torch", MODEL_PATH)
+        reference.load()
+        candidate.accuracy_delta = measure_accuracy_delta(candidate, reference)
+        del reference
+        if candidate.accuracy_delta is None:
+            logger.warning("Accuracy check skipped: no calibration frames (record some footage first)")
+        else:
+            logger.info(f"{candidate.precision} vs fp32 accuracy delta: {candidate.accuracy_delta}")
+    except Exception as e:
+        logger.warning(f"Accuracy check failed: {e}")
 
 
 def load_custom_model():
-    """Load and initialize YOLO model with GPU support if available"""
-    global custom_model, device_info
+    """Load and initialize YOLO model on the configured backend"""
+    global custom_model, device_info, class_names, backend
 
     try:
         cuda = torch.cuda.is_available()
         if cuda:
-            cuda_ver = getattr(getattr(torch, "version", None), "cuda", None)
-            device_info = f"CUDA {cuda_ver or 'unknown'} - {torch.cuda.get_device_name(0)}"
             torch.backends.cudnn.benchmark = True
             torch.backends.cudnn.deterministic = False
             torch.cuda.empty_cache()
-        else:
-            device_info = "CPU"
 
         if not os.path.exists(MODEL_PATH):
             logger.warning(f"Model not found at {MODEL_PATH}, running passthrough (no detection).")
             custom_model = None
+            device_info = "CUDA" if cuda else "CPU"
             return
 
-        from ultralytics import YOLO
-        custom_model = YOLO(MODEL_PATH)
-        if cuda:
-            custom_model.to('cuda')
+        backend = _load_backend(INFERENCE_BACKEND, MODEL_PRECISION)
+        custom_model = backend.model
+        class_names = _build_class_names(getattr(custom_model, "names", None))
+
+        if backend.device == "cuda":
+            cuda_ver = getattr(getattr(torch, "version", None), "cuda", None)
+            device_info = f"CUDA {cuda_ver or 'unknown'} - {torch.cuda.get_device_name(0)}"
+        else:
+            device_info = "CPU"
+        if backend.name != "torch" or backend.precision != "fp32":
+            device_info = f"{device_info} ({backend.name} {backend.precision})"
 
         # Warmup
         dummy = np.random.randint(0, 255, (640, 640, 3), dtype=np.uint8)
         for _ in range(2):
-            _ = custom_model(dummy, verbose=False, device='cuda' if cuda else 'cpu')
-        if cuda:
+            _ = custom_model(dummy, verbose=False, device=backend.device, **backend.predict_kwargs())
+        if MODEL_INPUT_LETTERBOX:
+            # Streams arrive as preprocessed tensors at the display aspect ratio
+            frame = np.zeros((RESIZE_HEIGHT or 720, RESIZE_WIDTH or 1280, 3), dtype=np.uint8)
+            warm = Preprocessor().letterbox(frame)
+            for _ in range(2):
+                predict_batch(backend, class_names, [warm], 0.5, 0.5, 1)
+        if backend.device == "cuda":
             torch.cuda.synchronize()
 
-        logger.info("YOLO model loaded & warmed up.")
+        if backend.precision != "fp32" and ACCURACY_CHECK_ENABLED:
+            _check_accuracy(backend)
+
+        logger.info(f"YOLO model loaded & warmed up (backend={backend.name}, path={backend.model_path}).")
     except Exception as e:
         logger.exception(f"Failed to load model: {e}")
         custom_model = None
+        backend = None
         device_info = "Error"
 
 
+def _build_class_names(names) -> Optional[np.ndarray]:
+    if not names:
+        return None
+    if isinstance(names, dict):
+        size = max(names) + 1
+        table = np.array([f"Class_{i}" for i in range(size)], dtype=object)
+        for i, name in names.items():
+            table[i] = name
+        return table
+    return np.array(list(names), dtype=object)
+
+
+def _box_rows(boxes):
+    """[x1, y1, x2, y2, conf, cls] rows, still on the model device"""
+    data = boxes.data
+    if data.shape[1] == 7:  # tracked results carry an id column before conf
+        return data[:, [0, 1, 2, 3, 5, 6]]
+    return data
+
+
 def get_model():
     """Get the loaded YOLO model instance"""
     return custom_model
@@ -64,54 +148,127 @@ def get_device_info():
     return device_info
 
 
+def get_class_names() -> List[str]:
+    """Class id -> name list (empty when no model is loaded)"""
+    return [] if class_names is None else [str(n) for n in class_names]
+
+
 def run_inference(
-    img: np.ndarray,
+    img: Union[np.ndarray, ModelInput],
     conf: float = 0.45,
     iou: float = 0.5,
-    max_det: int = 30
-) -> List[Tuple[int, int, int, int, float, str]]:
+    max_det: int = 30,
+    imgsz: Optional[int] = None
+) -> DetectionBatch:
     """
     Run YOLO inference on an image
 
     Args:
-        img: Input image (BGR format)
+        img: Input image (BGR format) or a letterboxed ModelInput
         conf: Confidence threshold
         iou: IoU threshold for NMS
         max_det: Maximum number of detections
+        imgsz: Model input size (None = model default)
+
+    Returns:
+        DetectionBatch; iterates as (x1, y1, x2, y2, confidence, class_name)
+    """
+    return run_inference_batch([img], conf, iou, max_det, imgsz)[0]
+
+
+def run_inference_batch(
+    imgs: List[Union[np.ndarray, ModelInput]],
+    conf: float = 0.45,
+    iou: float = 0.5,
+    max_det: int = 30,
+    imgsz: Optional[int] = None
+) -> List[DetectionBatch]:
+    """
+    Run YOLO inference on several images in a single model call
 
     Returns:
-        List of detections: (x1, y1, x2, y2, confidence, class_name)
+        One DetectionBatch per input image, in order
     """
     if custom_model is None:
-        return []
+        return [DetectionBatch.empty() for _ in imgs]
 
     try:
-        res = custom_model(
-            img,
+        return predict_batch(backend, class_names, imgs, conf, iou, max_det, imgsz)
+    except Exception as e:
+        logger.warning(f"Inference error: {e}")
+        return [DetectionBatch.empty() for _ in imgs]
+
+
+def predict_batch(
+    backend: InferenceBackend,
+    names: Optional[np.ndarray],
+    imgs: List[Union[np.ndarray, ModelInput]],
+    conf: float,
+    iou: float,
+    max_det: int,
+    imgsz: Optional[int] = None
+) -> List[DetectionBatch]:
+    """Run a loaded backend's model on a list of images"""
+    if imgs and isinstance(imgs[0], ModelInput):
+        return _predict_letterboxed(backend, names, imgs, conf, iou, max_det)
+
+    kwargs = backend.predict_kwargs()
+    if imgsz:
+        kwargs["imgsz"] = imgsz
+    res = backend.model(
+        imgs,
+        verbose=False,
+        conf=conf,
+        iou=iou,
+        max_det=max_det,
+        device=backend.device,
+        **kwargs
+    )
+
+    # One device -> host transfer per image: rows of [x1, y1, x2, y2, conf, cls]
+    batches = []
+    for r in res:
+        if getattr(r, "boxes", None) is None or not len(r.boxes):
+            batches.append(DetectionBatch.empty())
+            continue
+        batches.append(DetectionBatch.from_array(_box_rows(r.boxes).cpu().numpy(), names))
+    return batches
+
+
+def _predict_letterboxed(
+    backend: InferenceBackend,
+    names: Optional[np.ndarray],
+    inputs: List[ModelInput],
+    conf: float,
+    iou: float,
+    max_det: int
+) -> List[DetectionBatch]:
+    """Predict on preprocessed canvases; one model call per canvas shape"""
+    half = backend.name == "torch" and backend.precision == "fp16"
+    kwargs = backend.predict_kwargs()
+
+    groups = {}
+    for i, item in enumerate(inputs):
+        groups.setdefault(item.image.shape, []).append(i)
+
+    batches: List[DetectionBatch] = [DetectionBatch.empty()] * len(inputs)
+    for idx in groups.values():
+        group = [inputs[i] for i in idx]
+        res = backend.model(
+            to_batch_tensor(group, backend.device, half),
             verbose=False,
             conf=conf,
             iou=iou,
             max_det=max_det,
-            device='cuda' if torch.cuda.is_available() else 'cpu'
+            device=backend.device,
+            **kwargs
         )
-
-        dets = []
-        for r in res:
-            if getattr(r, "boxes", None) is None:
+        for i, item, r in zip(idx, group, res):
+            if getattr(r, "boxes", None) is None or not len(r.boxes):
                 continue
-            for box in r.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                cls = int(box.cls[0].cpu().numpy())
-                name = f"Class_{cls}"
-                if hasattr(custom_model, "names") and cls < len(custom_model.names):
-                    name = custom_model.names[cls]
-                dets.append((int(x1), int(y1), int(x2), int(y2), confidence, name))
-
-        return dets
-    except Exception as e:
-        logger.warning(f"Inference error: {e}")
-        return []
+            rows = map_to_display(_box_rows(r.boxes).cpu().numpy(), item.meta)
+            batches[i] = DetectionBatch.from_array(rows, names)
+    return batches
 
 
 def get_model_info():
@@ -124,6 +281,8 @@ def get_model_info():
         "model_type": type(custom_model).__name__,
         "device": device_info
     }
+    if backend is not None:
+        info.update(backend.info())
 
     if hasattr(custom_model, "names"):
         info["classes"] = custom_model.names
@@ -0,0 +1,188 @@
+"""
+In-process metrics with Prometheus text exposition
+
+Histograms use fixed buckets and keep only per-bucket counts, a sum and a
+count per label set, so observing is a bisect and three additions. Children
+are created on first use and can be cached by the caller (labels() returns
+the same object every time). Observe from the event loop thread.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; sized for per-frame work at 5-60 FPS
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03,
+    0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5
+)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram:
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children: Dict[Tuple[str, ...], _HistogramChild] = {}
+
+    def labels(self, **labels) -> _HistogramChild:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = _HistogramChild(self.buckets)
+        return child
+
+    def remove(self, **labels):
+        """Drop every child matching the given subset of labels"""
+        idx = [(self.labelnames.index(n), str(v)) for n, v in labels.items()]
+        for key in [k for k in self._children if all(k[i] == v for i, v in idx)]:
+            del self._children[key]
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def remove(self, **labels):
+        idx = [(self.labelnames.index(n), str(v)) for n, v in labels.items()]
+        for key in [k for k in self._values if all(k[i] == v for i, v in idx)]:
+            del self._values[key]
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class GaugeFunction:
+    """Gauge whose samples are read from a callback at scrape time"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str],
+        read: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in self.read():
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, tuple(map(str, key)))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Per-source stages: recv, convert, resize, submit, inference, overlay, to_frame
+STAGE_SECONDS = registry.register(Histogram(
+    "carter_stage_seconds",
+    "Time spent per frame in each source pipeline stage",
+    ("source", "stage")
+))
+
+# Per-client stages: recv_wait, recording_enqueue
+CLIENT_STAGE_SECONDS = registry.register(Histogram(
+    "carter_client_stage_seconds",
+    "Time spent per frame in each client track stage",
+    ("client", "stage")
+))
+
+FRAMES_TOTAL = registry.register(Counter(
+    "carter_frames_total",
+    "Frames processed per source",
+    ("source",)
+))
+
+CLIENT_FRAMES_TOTAL = registry.register(Counter(
+    "carter_client_frames_total",
+    "Frames handed to each client track",
+    ("client",)
+))
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    return registry.render()
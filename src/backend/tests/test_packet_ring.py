@@ -0,0 +1,78 @@
+import unittest
+from fractions import Fraction
+
+from video.packet_ring import GopRing
+
+TIME_BASE = Fraction(1, 90000)
+
+
+class FakePacket:
+
+    def __init__(self, pts, size=1000, is_keyframe=False):
+        self.pts = pts
+        self.dts = pts
+        self.size = size
+        self.is_keyframe = is_keyframe
+        self.time_base = TIME_BASE
+
+
+def stream(ring, seconds, fps=10, gop_sec=1.0, size=1000, start=0.0):
+    """Push seconds of packets with a keyframe every gop_sec"""
+    per_gop = int(gop_sec * fps)
+    for i in range(int(seconds * fps)):
+        t = start + i / fps
+        ring.push(FakePacket(int(t * 90000), size, is_keyframe=(i % per_gop == 0)))
+
+
+class GopRingTest(unittest.TestCase):
+
+    def test_waits_for_first_keyframe(self):
+        ring = GopRing(seconds=5, max_bytes=10**9)
+        ring.push(FakePacket(0))
+        ring.push(FakePacket(3000))
+        self.assertEqual(ring.snapshot(), [])
+        self.assertEqual(ring.bytes, 0)
+        ring.push(FakePacket(6000, is_keyframe=True))
+        self.assertEqual(len(ring.snapshot()), 1)
+
+    def test_time_budget_keeps_pre_roll_from_a_keyframe(self):
+        ring = GopRing(seconds=3, max_bytes=10**9)
+        stream(ring, seconds=20)
+        packets = ring.snapshot()
+        self.assertTrue(packets[0].is_keyframe)
+        # Covers the pre-roll, but not a whole GOP more than needed
+        self.assertGreaterEqual(ring.span_seconds(), 3)
+        self.assertLess(ring.span_seconds(), 3 + 1.0)
+        self.assertGreater(ring.evicted, 0)
+        self.assertEqual(ring.bytes, sum(p.size for p in packets))
+
+    def test_byte_budget_evicts_whole_gops(self):
+        # 10 packets of 1000 bytes per GOP; room for 2.5 GOPs
+        ring = GopRing(seconds=60, max_bytes=25000)
+        stream(ring, seconds=20)
+        packets = ring.snapshot()
+        self.assertLessEqual(ring.bytes, 25000)
+        self.assertTrue(packets[0].is_keyframe)
+        self.assertEqual(ring.bytes, sum(p.size for p in packets))
+        self.assertLess(ring.span_seconds(), 60)
+
+    def test_gop_larger_than_budget_is_dropped(self):
+        ring = GopRing(seconds=60, max_bytes=5000)
+        stream(ring, seconds=1.5)
+        self.assertLessEqual(ring.bytes, 5000)
+        packets = ring.snapshot()
+        # The oversized first GOP is gone entirely; the second one fits
+        self.assertTrue(packets[0].is_keyframe)
+        self.assertTrue(all(p.pts >= 90000 for p in packets))
+
+    def test_clear(self):
+        ring = GopRing(seconds=5, max_bytes=10**9)
+        stream(ring, seconds=3)
+        ring.clear()
+        self.assertEqual(ring.snapshot(), [])
+        self.assertEqual(ring.bytes, 0)
+        self.assertEqual(ring.span_seconds(), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import unittest
+import importlib.util
+
+import numpy as np
+
+from config import MODEL_PATH
+from models.detection_batch import DetectionBatch
+from models.parity import box_iou, compare_detections, summarize
+
+
+def batch(rows):
+    """DetectionBatch from [(x1, y1, x2, y2, conf, cls), ...]"""
+    return DetectionBatch.from_array(np.array(rows, dtype=np.float32).reshape(-1, 6))
+
+
+def _installed(*modules) -> bool:
+    return all(importlib.util.find_spec(m) is not None for m in modules)
+
+
+def synthetic_images(count=4, size=640, seed=7):
+    """Deterministic underwater-ish frames: blue gradient, noise and a few bright ellipses"""
+    import cv2
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        img = np.zeros((size, size, 3), dtype=np.uint8)
+        img[..., 0] = np.linspace(120, 200, size, dtype=np.uint8)[:, None]
+        img[..., 1] = 90
+        img = cv2.add(img, rng.integers(0, 25, img.shape, dtype=np.uint8))
+        for _ in range(rng.integers(1, 4)):
+            center = tuple(int(v) for v in rng.integers(80, size - 80, 2))
+            axes = (int(rng.integers(30, 70)), int(rng.integers(10, 25)))
+            cv2.ellipse(img, center, axes, float(rng.integers(0, 180)), 0, 360, (40, 160, 230), -1)
+        images.append(img)
+    return images
+
+
+class BoxIouTest(unittest.TestCase):
+
+    def test_identical_disjoint_and_partial(self):
+        a = np.array([[0, 0, 10, 10]])
+        b = np.array([[0, 0, 10, 10], [20, 20, 30, 30], [5, 0, 15, 10]])
+        ious = box_iou(a, b)
+        self.assertEqual(ious.shape, (1, 3))
+        self.assertAlmostEqual(float(ious[0, 0]), 1.0)
+        self.assertAlmostEqual(float(ious[0, 1]), 0.0)
+        self.assertAlmostEqual(float(ious[0, 2]), 50 / 150, places=5)
+
+    def test_degenerate_box(self):
+        ious = box_iou(np.array([[5, 5, 5, 5]]), np.array([[5, 5, 5, 5]]))
+        self.assertEqual(float(ious[0, 0]), 0.0)
+
+
+class CompareDetectionsTest(unittest.TestCase):
+
+    def test_matches_same_class_only(self):
+        ref = batch([(0, 0, 10, 10, 0.9, 0), (20, 20, 40, 40, 0.8, 1)])
+        other = batch([(0, 0, 10, 10, 0.7, 0), (20, 20, 40, 40, 0.8, 2)])
+        result = compare_detections(ref, other)
+        self.assertEqual(result["reference"], 2)
+        self.assertEqual(result["candidate"], 2)
+        self.assertEqual(result["matched"], 1)
+        self.assertAlmostEqual(result["conf_delta_sum"], 0.2, places=5)
+
+    def test_greedy_one_to_one(self):
+        # Two candidates over one reference box: only the better one matches
+        ref = batch([(0, 0, 10, 10, 0.9, 0)])
+        other = batch([(0, 0, 10, 10, 0.9, 0), (1, 0, 11, 10, 0.9, 0)])
+        result = compare_detections(ref, other)
+        self.assertEqual(result["matched"], 1)
+        self.assertAlmostEqual(result["iou_sum"], 1.0, places=5)
+
+    def test_iou_threshold(self):
+        ref = batch([(0, 0, 10, 10, 0.9, 0)])
+        other = batch([(6, 0, 16, 10, 0.9, 0)])
+        self.assertEqual(compare_detections(ref, other)["matched"], 0)
+        self.assertEqual(compare_detections(ref, other, iou_thr=0.2)["matched"], 1)
+
+    def test_empty(self):
+        result = compare_detections(DetectionBatch.empty(), batch([(0, 0, 10, 10, 0.9, 0)]))
+        self.assertEqual(result["matched"], 0)
+        summary = summarize([result])
+        self.assertEqual(summary["recall"], 1.0)
+        self.assertEqual(summary["precision"], 0.0)
+        self.assertIsNone(summary["mean_iou"])
+
+    def test_summarize(self):
+        ref = batch([(0, 0, 10, 10, 0.9, 0), (20, 20, 40, 40, 0.8, 1)])
+        other = batch([(0, 0, 10, 10, 0.85, 0)])
+        summary = summarize([compare_detections(ref, other), compare_detections(ref, ref)])
+        self.assertEqual(summary["images"], 2)
+        self.assertEqual(summary["matched"], 3)
+        self.assertEqual(summary["recall"], 0.75)
+        self.assertEqual(summary["precision"], 1.0)
+
+
+@unittest.skipUnless(os.path.exists(MODEL_PATH), "model weights not present")
+@unittest.skipUnless(_installed("torch", "ultralytics", "cv2"), "torch/ultralytics/opencv not installed")
+class BackendParityTest(unittest.TestCase):
+    """fp32 exports must detect what the torch checkpoint detects on fixed images"""
+
+    MIN_AGREEMENT = 0.9
+
+    def _check(self, backend: str):
+        from models.parity import run_parity
+        report = run_parity(synthetic_images(), ["torch", backend])[backend]
+        self.assertGreaterEqual(report["recall"], self.MIN_AGREEMENT, report)
+        self.assertGreaterEqual(report["precision"], self.MIN_AGREEMENT, report)
+
+    @unittest.skipUnless(_installed("onnxruntime"), "onnxruntime not installed")
+    def test_onnx(self):
+        self._check("onnx")
+
+    @unittest.skipUnless(_installed("openvino"), "openvino not installed")
+    def test_openvino(self):
+        self._check("openvino")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from video.rate_controller import InferenceRateController
+
+
+class InferenceRateControllerTest(unittest.TestCase):
+
+    def _feed(self, controller, now, seconds, fps, frame_ms):
+        for _ in range(int(seconds * fps)):
+            now += 1.0 / fps
+            controller.observe_frame(frame_ms, now=now)
+        return now
+
+    def test_slow_camera_recovers_after_spike(self):
+        # 25 fps camera, TARGET_FPS=30: video_fps stays below target the whole time
+        controller = InferenceRateController(target_fps=30, enabled=True, max_interval=1.0, imgsz_steps=[])
+        now = controller._period_start
+
+        now = self._feed(controller, now, 3, 25, 5.0)
+        self.assertEqual(controller.interval, 0.0)
+
+        now = self._feed(controller, now, 3, 25, 60.0)
+        self.assertGreater(controller.interval, 0.0)
+
+        self._feed(controller, now, 30, 25, 5.0)
+        self.assertEqual(controller.interval, 0.0)
+
+    def test_slow_camera_restores_imgsz(self):
+        controller = InferenceRateController(
+            target_fps=30, enabled=True, max_interval=0.1, imgsz_steps=[640, 320]
+        )
+        now = controller._period_start
+
+        now = self._feed(controller, now, 10, 25, 60.0)
+        self.assertEqual(controller.imgsz, 320)
+
+        self._feed(controller, now, 30, 25, 5.0)
+        self.assertEqual(controller.imgsz, 640)
+        self.assertEqual(controller.interval, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
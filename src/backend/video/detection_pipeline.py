@@ -0,0 +1,129 @@
+"""
+Decoupled detection stage
+
+Video frames flow at camera rate; this stage runs beside them, always taking
+the newest frame when the model becomes free and publishing the result for
+the overlay stage to apply to whatever frame is being sent. Frames never
+queue up behind the model.
+"""
+import time
+import asyncio
+import logging
+from typing import Optional, Tuple, Callable, NamedTuple
+
+from models.detection_batch import DetectionBatch
+from models.batch_engine import inference_engine
+from video.rate_controller import InferenceRateController
+
+logger = logging.getLogger("carter-backend")
+
+
+class DetectionResult(NamedTuple):
+    detections: DetectionBatch
+    frame_number: int
+    frame_time: float  # time.monotonic() when the source frame was received
+    inference_ms: float
+
+
+EMPTY_RESULT = DetectionResult(DetectionBatch.empty(), -1, 0.0, 0.0)
+
+
+class DetectionPipeline:
+
+    def __init__(
+        self,
+        conf: float,
+        iou: float,
+        max_det: int,
+        on_result: Optional[Callable[[DetectionResult], None]] = None,
+        release: Optional[Callable[[object], None]] = None
+    ):
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.on_result = on_result
+        # Submitted frames are handed back here once inference is done with them
+        self.release = release
+        self.controller = InferenceRateController()
+
+        self.result: DetectionResult = EMPTY_RESULT
+        # (image or ModelInput, frame_number, frame_time)
+        self._pending: Optional[Tuple[object, int, float]] = None
+        self._wakeup = asyncio.Event()
+        self._busy = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Inference rate
+        self.inference_count = 0
+        self.last_infer_time = time.time()
+        self.infer_fps = 0.0
+
+    def start(self):
+        if self._task is None:
+            inference_engine.register()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            inference_engine.unregister()
+            self._task.cancel()
+            self._task = None
+        if self._pending is not None and self.release is not None:
+            self.release(self._pending[0])
+        self._pending = None
+
+    def wants_frame(self) -> bool:
+        """True if the stage is idle and would start on a frame right away"""
+        return (
+            self._task is not None
+            and not self._busy
+            and self._pending is None
+            and inference_engine.accepting()
+            and self.controller.allow(time.monotonic())
+        )
+
+    def submit(self, img, frame_number: int, frame_time: float):
+        """Hand a frame to the stage; img must not be modified afterwards"""
+        if self._pending is not None and self.release is not None:
+            self.release(self._pending[0])
+        self._pending = (img, frame_number, frame_time)
+        self.controller.started(time.monotonic())
+        self._wakeup.set()
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if self._pending is None:
+                    continue
+
+                img, frame_number, frame_time = self._pending
+                self._pending = None
+                self._busy = True
+                try:
+                    t0 = time.perf_counter()
+                    dets = await inference_engine.infer(
+                        img, self.conf, self.iou, self.max_det, self.controller.imgsz
+                    )
+                    infer_ms = (time.perf_counter() - t0) * 1000.0
+                    self.controller.observe_inference(infer_ms)
+                    self.result = DetectionResult(dets, frame_number, frame_time, infer_ms)
+                    if self.on_result is not None:
+                        self.on_result(self.result)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Inference error: {e}")
+                finally:
+                    if self.release is not None:
+                        self.release(img)
+                    self._busy = False
+                    self.inference_count += 1
+                    now = time.time()
+                    if now - self.last_infer_time >= 1.0:
+                        self.infer_fps = self.inference_count / (now - self.last_infer_time)
+                        self.inference_count = 0
+                        self.last_infer_time = now
+        except asyncio.CancelledError:
+            pass
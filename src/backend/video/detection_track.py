@@ -1,211 +1,195 @@
-import cv2
 import time
-import asyncio
 import logging
-import numpy as np
-import queue
-import threading
-from typing import Optional, List, Tuple
-from aiortc import VideoStreamTrack
-from av import VideoFrame
-
-from config import (
-    RESIZE_WIDTH,
-    RESIZE_HEIGHT,
-    YOLO_CONF_THRESHOLD,
-    YOLO_IOU_THRESHOLD,
-    YOLO_MAX_DETECTIONS,
-    SAVE_DETECTIONS_ENABLED,
-    SAVE_INTERVAL_SECONDS,
-    MIN_DETECTIONS_TO_SAVE
-)
-from models.yolo_detector import run_inference, get_device_info
-from database.detections import save_detections_to_db
+from typing import Optional, Union
+from aiortc import RTCRtpSender, VideoStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame, Packet
+
+from video.source_hub import SourceHub, SharedFrame
+from video.shared_encoder import SharedEncoder, acquire_shared_encoder
+from video.renditions import Rendition
+from video.recording_worker import RecordingProcess
+from video.passthrough_recording import PassthroughRecorder
+from monitoring.metrics import CLIENT_STAGE_SECONDS, CLIENT_FRAMES_TOTAL
 
 logger = logging.getLogger("carter-backend")
 
-# Performance counters
-frame_count = 0
-inference_count = 0
-last_fps_time = time.time()
-last_infer_time = time.time()
-current_fps = 0.0
-current_infer_fps = 0.0
+# aiortc's private PLI/FIR flag (name-mangled RTCRtpSender.__force_keyframe)
+_FORCE_KEYFRAME_ATTR = "_RTCRtpSender__force_keyframe"
 
 
-class RtspDetectionTrack(VideoStreamTrack):
-
-    def __init__(self, video_source_track):
-        super().__init__()
-        self.src = video_source_track
-        self.frame_skip = 0
-        self.skip_n = 0  # 0 = process every frame
-        self.last_dets: List[Tuple[int, int, int, int, float, str]] = []
+def check_keyframe_forwarding() -> bool:
+    """Startup: warn once if this aiortc no longer has the flag we forward"""
+    if _FORCE_KEYFRAME_ATTR in RTCRtpSender.__init__.__code__.co_names:
+        return True
+    logger.warning(
+        "aiortc RTCRtpSender has no __force_keyframe flag: shared-encoder peers' "
+        "keyframe requests are not forwarded, they rely on the encoder's GOP interval"
+    )
+    return False
 
-        self.size = (RESIZE_WIDTH, RESIZE_HEIGHT) if (RESIZE_WIDTH and RESIZE_HEIGHT) else None
-        self.conf = YOLO_CONF_THRESHOLD
-        self.iou = YOLO_IOU_THRESHOLD
-        self.max_det = YOLO_MAX_DETECTIONS
 
-        # Database saving
-        self.last_save_time = time.time()
-        self.save_task: Optional[asyncio.Task] = None
+class RtspDetectionTrack(VideoStreamTrack):
 
-        # Recording support with background thread for non-blocking writes
+    def __init__(
+        self,
+        hub: SourceHub,
+        client_id: Optional[str] = None,
+        encoder: Optional[SharedEncoder] = None,
+        rendition: Optional[Rendition] = None
+    ):
+        super().__init__()
+        self.hub = hub
+        self.client_id = client_id or self.id
+        self.last_seq = 0
+        hub.subscribe(self)
+
+        # Shared-encoder mode: recv returns pre-encoded H.264 packets
+        self.encoder = encoder
+        self.encoded = encoder.subscribe() if encoder is not None else None
+        # Output size/bitrate this peer currently gets (None = source size)
+        self.rendition = encoder.rendition if encoder is not None else rendition
+        self.rendition_switches = 0
+        if encoder is None:
+            hub.set_rendition(self, rendition)
+        # RTCRtpSender, set by the signalling layer to forward keyframe requests
+        self.sender = None
+
+        # Set by the signalling layer when the peer negotiated a detection channel
+        self.detection_channel = None
+
+        # Per-client counters
+        self.frames_sent = 0
+        self.frames_dropped = 0  # source frames this client skipped (slow consumer)
+        self.recording_dropped = 0
+        self.frame_count = 0
+        self.last_fps_time = time.time()
+        self.fps = 0.0
+
+        self._recv_hist = CLIENT_STAGE_SECONDS.labels(client=self.client_id, stage="recv_wait")
+        self._enqueue_hist = CLIENT_STAGE_SECONDS.labels(client=self.client_id, stage="recording_enqueue")
+
+        # Recording: frames go to an encoder process through shared memory;
+        # a pass-through recorder taps the demuxer itself and is only tracked here
         self.recording = False
-        self.video_writer: Optional[cv2.VideoWriter] = None
-        self.frame_queue: Optional[queue.Queue] = None
-        self.writer_thread: Optional[threading.Thread] = None
-        self.stop_writer_thread = False
-
-    async def recv(self) -> VideoFrame:
-        global frame_count, last_fps_time, current_fps
-        global inference_count, last_infer_time, current_infer_fps
-
-        frame: VideoFrame = await self.src.recv()
-        img = frame.to_ndarray(format="bgr24")
-
-        if self.size:
-            img = cv2.resize(img, self.size, interpolation=cv2.INTER_LINEAR)
-
-        # Run inference
-        do_infer = (self.frame_skip % (self.skip_n + 1) == 0)
-        if do_infer:
-            try:
-                dets = run_inference(img, self.conf, self.iou, self.max_det)
-                self.last_dets = dets
-
-                # Save detections to database periodically
-                now = time.time()
-                if (SAVE_DETECTIONS_ENABLED and
-                    len(dets) >= MIN_DETECTIONS_TO_SAVE and
-                    now - self.last_save_time >= SAVE_INTERVAL_SECONDS):
-                    # Save without blocking
-                    if self.save_task is None or self.save_task.done():
-                        self.save_task = asyncio.create_task(
-                            save_detections_to_db(dets.copy(), self.frame_skip)
-                        )
-                        self.last_save_time = now
-
-            except Exception as e:
-                logger.warning(f"Inference error: {e}")
-            finally:
-                inference_count += 1
-                now = time.time()
-                if now - last_infer_time >= 1.0:
-                    current_infer_fps = inference_count / (now - last_infer_time)
-                    inference_count = 0
-                    last_infer_time = now
-
-        self.frame_skip += 1
-
-        # Draw overlay
-        for (x1, y1, x2, y2, conf, name) in self.last_dets:
-            cv2.rectangle(img, (x1, y1), (x2, y2), (50, 220, 50), 3)
-            label = f"{name} {conf:.2f}"
-            cv2.putText(img, label, (x1, max(0, y1 - 8)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-        # Performance text
-        frame_count += 1
+        self.recorder: Optional[Union[RecordingProcess, PassthroughRecorder]] = None
+
+    async def recv(self) -> Union[VideoFrame, Packet]:
+        t0 = time.perf_counter()
+        if self.encoded is not None:
+            while True:
+                sub = self.encoded
+                item = await sub.get()
+                if item is not None:
+                    break
+                if self.encoded is None or self.encoded is sub:
+                    self.stop()
+                    raise MediaStreamError
+                # Rendition switched while waiting; continue on the new subscription
+            packet, shared = item
+            self._forward_keyframe_request()
+            self._recv_hist.observe(time.perf_counter() - t0)
+            if shared.seq != self.last_seq:
+                self._deliver(shared)
+            return packet
+
+        shared = await self.hub.next_frame(self.last_seq)
+        if shared is None:
+            self.stop()
+            raise MediaStreamError
+        self._recv_hist.observe(time.perf_counter() - t0)
+        self._deliver(shared)
+        return await self.hub.rendition_frame(shared, self.rendition)
+
+    def switch_rendition(self, rendition: Rendition):
+        """Move this peer to another rendition; the new stream starts at a keyframe"""
+        if rendition == self.rendition:
+            return
+        if self.encoded is not None:
+            old_encoder, old_sub = self.encoder, self.encoded
+            self.encoder = acquire_shared_encoder(self.hub, rendition)
+            self.encoded = self.encoder.subscribe()
+            old_encoder.unsubscribe(old_sub)
+        else:
+            self.hub.set_rendition(self, rendition)
+        self.rendition = rendition
+        self.rendition_switches += 1
+
+    def _deliver(self, shared: SharedFrame):
+        """Per-client bookkeeping for a frame handed to the encoder"""
+        t1 = time.perf_counter()
+        if self.last_seq:
+            self.frames_dropped += shared.seq - self.last_seq - 1
+        self.last_seq = shared.seq
+        CLIENT_FRAMES_TOTAL.inc(client=self.client_id)
+
+        self.frames_sent += 1
+        self.frame_count += 1
         now = time.time()
-        if now - last_fps_time >= 1.0:
-            current_fps = frame_count / (now - last_fps_time)
-            frame_count = 0
-            last_fps_time = now
-
-        device = get_device_info()
-        cv2.putText(img, f"FPS: {current_fps:.1f}", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-        cv2.putText(img, f"Inference: {current_infer_fps:.1f}", (10, 70),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-        cv2.putText(img, f"Device: {device}", (10, 110),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 255), 2)
-
-        if self.recording and self.frame_queue is not None:
-            try:
-                self.frame_queue.put_nowait(img.copy())
-            except queue.Full:
-                pass
-
-        img = img.astype(np.uint8)
-        out = VideoFrame.from_ndarray(img, format="bgr24")
-        out.pts = frame.pts
-        out.time_base = frame.time_base
-        return out
-
-    def _video_writer_thread(self):
-        logger.info("Video writer thread started")
-        frames_written = 0
-
-        while not self.stop_writer_thread:
-            try:
-                if self.frame_queue is not None:
-                    frame = self.frame_queue.get(timeout=0.5)
-
-                    if self.video_writer is not None:
-                        self.video_writer.write(frame)
-                        frames_written += 1
-
-            except queue.Empty:
-                continue
-            except Exception as e:
-                logger.error(f"Error writing frame to video: {e}")
-
-        logger.info(f"Video writer thread stopped. Frames written: {frames_written}")
-
-    def start_recording(self, video_writer: cv2.VideoWriter):
+        if now - self.last_fps_time >= 1.0:
+            self.fps = self.frame_count / (now - self.last_fps_time)
+            self.frame_count = 0
+            self.last_fps_time = now
+
+        if self.detection_channel is not None:
+            self.detection_channel.send(self.hub, shared)
+
+        # One memcpy into the recorder's ring; dropped (and counted) if it is full
+        if self.recording and isinstance(self.recorder, RecordingProcess):
+            if not self.recorder.submit(shared.image, shared.frame.pts, shared.frame.time_base):
+                self.recording_dropped += 1
+            self._enqueue_hist.observe(time.perf_counter() - t1)
+
+    def _forward_keyframe_request(self):
+        # aiortc records PLI/FIR in a private flag that only its own encoder
+        # reads; with pre-encoded packets we hand it to the shared encoder
+        if self.sender is None:
+            return
+        if getattr(self.sender, _FORCE_KEYFRAME_ATTR, False):
+            setattr(self.sender, _FORCE_KEYFRAME_ATTR, False)
+            self.encoder.request_keyframe()
+
+    def stop(self):
+        super().stop()
+        if self.encoded is not None:
+            self.encoder.unsubscribe(self.encoded)
+            self.encoded = None
+        self.hub.unsubscribe(self)
+        CLIENT_STAGE_SECONDS.remove(client=self.client_id)
+        CLIENT_FRAMES_TOTAL.remove(client=self.client_id)
+
+    def stats(self) -> dict:
+        """Counters for this client only (inference rate is per source)"""
+        # A stalled client never reaches the fps update in recv
+        fps = self.fps if time.time() - self.last_fps_time < 2.0 else 0.0
+        return {
+            "source": self.hub.transport,
+            "fps": round(fps, 2),
+            "inference_fps": round(self.hub.pipeline.infer_fps, 2),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "recording": self.recording,
+            "recording_dropped": self.recording_dropped,
+            "recorder": self.recorder.state() if self.recorder is not None else None,
+            "detection_channel": self.detection_channel.state() if self.detection_channel else None,
+            "rendition": (
+                {"name": self.rendition.name, "kbps": self.rendition.kbps, "switches": self.rendition_switches}
+                if self.rendition is not None else None
+            ),
+            "shared_encoder": (
+                {"bitrate_kbps": self.encoder.bitrate_kbps, "dropped": self.encoded.dropped, "resyncs": self.encoded.resyncs}
+                if self.encoded is not None else None
+            ),
+        }
+
+    def start_recording(self, recorder: Union[RecordingProcess, PassthroughRecorder]):
+        self.recorder = recorder
         self.recording = True
-        self.video_writer = video_writer
-        self.stop_writer_thread = False
+        if isinstance(recorder, RecordingProcess):
+            logger.info(f"Started recording to encoder process ({recorder.slots}-frame shared ring)")
 
-        # Create queue for frames (max 30 frames buffered)
-        self.frame_queue = queue.Queue(maxsize=30)
-
-        # Start background writer thread
-        self.writer_thread = threading.Thread(target=self._video_writer_thread, daemon=True)
-        self.writer_thread.start()
-
-        logger.info(f"Started recording with background thread at full FPS (non-blocking)")
-
-    def stop_recording(self):
+    def detach_recorder(self) -> Optional[Union[RecordingProcess, PassthroughRecorder]]:
+        """Stop feeding the recorder (non-blocking); the caller finalizes it"""
         self.recording = False
-
-        # Stop the writer thread
-        self.stop_writer_thread = True
-
-        # Wait for queue to drain and thread to finish
-        if self.writer_thread is not None:
-            # Give thread time to process remaining frames in queue
-            logger.info("Waiting for video writer thread to finish...")
-            self.writer_thread.join(timeout=10.0)  # Increased timeout for queue drain
-
-            if self.writer_thread.is_alive():
-                logger.warning("Video writer thread did not finish in time")
-
-            self.writer_thread = None
-
-        # Release video writer
-        if self.video_writer is not None:
-            try:
-                self.video_writer.release()
-                logger.info("Video writer released successfully")
-            except Exception as e:
-                logger.error(f"Error releasing video writer: {e}")
-            finally:
-                self.video_writer = None
-
-        # Clear queue
-        self.frame_queue = None
-
-        logger.info("Stopped recording video frames")
-
-
-def get_fps() -> float:
-    """Get current FPS"""
-    return current_fps
-
-
-def get_inference_fps() -> float:
-    """Get current inference FPS"""
-    return current_infer_fps
+        recorder, self.recorder = self.recorder, None
+        return recorder
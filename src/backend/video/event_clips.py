@@ -0,0 +1,311 @@
+"""
+Event-triggered clips
+
+Keeps the last EVENT_CLIP_PRE_ROLL_SEC of the camera's compressed packets in
+a GOP-aligned ring (bounded by EVENT_CLIP_BUFFER_MB; raw frames are never
+buffered). When EVENT_CLIP_TRIGGER_FRAMES consecutive inference results
+satisfy the trigger (at least EVENT_CLIP_MIN_COUNT detections of
+EVENT_CLIP_CLASSES at EVENT_CLIP_MIN_CONFIDENCE or better), the ring is
+written out as the start of a pass-through clip, live packets follow until
+EVENT_CLIP_POST_ROLL_SEC after the last trigger, and the clip is registered
+through the normal /api/recordings finalize path with a detections sidecar.
+
+The recorder subscribes to the source hub like a viewer, so the source and
+detector keep running while nobody is watching.
+"""
+import os
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, List, Optional, Tuple
+import av
+import numpy as np
+
+from config import (
+    RTSP_TRANSPORT,
+    RECORDINGS_DIR,
+    RECORDING_PASSTHROUGH_QUEUE,
+    TARGET_FPS,
+    EVENT_CLIP_PRE_ROLL_SEC,
+    EVENT_CLIP_POST_ROLL_SEC,
+    EVENT_CLIP_MAX_SEC,
+    EVENT_CLIP_BUFFER_MB,
+    EVENT_CLIP_MIN_COUNT,
+    EVENT_CLIP_MIN_CONFIDENCE,
+    EVENT_CLIP_CLASSES,
+    EVENT_CLIP_TRIGGER_FRAMES,
+    streaming_session_id
+)
+from models.yolo_detector import get_class_names
+from video.detection_pipeline import DetectionResult
+from video.packet_ring import GopRing, packet_time
+from video.passthrough_recording import PassthroughRecorder, container_extension
+from video.recording import finalize_recording, JAKARTA_TZ
+from video.source_hub import SourceHub, acquire_source_hub
+
+logger = logging.getLogger("carter-backend")
+
+# Retry interval while the camera is unreachable or a clip file cannot be opened
+_RETRY_SEC = 5.0
+
+
+def _resolve_classes(spec: str) -> Optional[np.ndarray]:
+    """EVENT_CLIP_CLASSES (names or ids) -> class ids; None = any class"""
+    items = [c.strip() for c in spec.split(",") if c.strip()]
+    if not items:
+        return None
+    names = {n.lower(): i for i, n in enumerate(get_class_names())}
+    ids = []
+    for item in items:
+        if item.isdigit():
+            ids.append(int(item))
+        elif item.lower() in names:
+            ids.append(names[item.lower()])
+        else:
+            logger.warning(f"EVENT_CLIP_CLASSES: unknown class '{item}'")
+    return np.array(ids, dtype=np.int32)
+
+
+class EventClipRecorder:
+
+    def __init__(self, transport: str = RTSP_TRANSPORT):
+        self.transport = transport
+        self.hub: Optional[SourceHub] = None
+        self.ring = GopRing(EVENT_CLIP_PRE_ROLL_SEC, EVENT_CLIP_BUFFER_MB * 1024 * 1024)
+        # Inference results for the pre-roll part of the sidecar
+        self._recent: Deque[Tuple[DetectionResult, Optional[int]]] = deque(
+            maxlen=int(EVENT_CLIP_PRE_ROLL_SEC * TARGET_FPS) + 1
+        )
+        self.class_ids = _resolve_classes(EVENT_CLIP_CLASSES)
+        # Guards the ring and the active clip against the demux thread
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.clip: Optional[PassthroughRecorder] = None
+        self._clip_info: Optional[dict] = None
+        # Opening a clip's files runs in a thread; live packets and results
+        # are collected meanwhile and handed over with the writer
+        self._start_task: Optional[asyncio.Task] = None
+        self._pending: Optional[List[av.Packet]] = None
+        self._pending_dets: List[Tuple[DetectionResult, Optional[int]]] = []
+        self._retry_at = 0.0
+        self._clip_started = 0.0
+        self._clip_until = 0.0
+        self._hits = 0
+
+        # Stats
+        self.triggers = 0
+        self.clips = 0
+        self.last_clip: Optional[str] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Event clips armed ({self.transport}): pre-roll {EVENT_CLIP_PRE_ROLL_SEC}s, "
+            f"post-roll {EVENT_CLIP_POST_ROLL_SEC}s, buffer {EVENT_CLIP_BUFFER_MB}MB"
+        )
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._start_task is not None:
+            # Not cancelled: the writer being opened would be left running
+            await asyncio.wait({self._start_task})
+        await self._end_clip()
+        self._detach()
+
+    def _attach(self):
+        hub = acquire_source_hub(self.transport)
+        if hub.packet_source() is None:
+            raise RuntimeError("source has no packet tap")
+        hub.subscribe(self)
+        hub.packet_source().add_packet_tap(self._on_packet)
+        hub.detection_listeners.add(self._on_detections)
+        self.hub = hub
+
+    def _detach(self):
+        hub, self.hub = self.hub, None
+        if hub is None:
+            return
+        source = hub.packet_source()
+        if source is not None:
+            source.remove_packet_tap(self._on_packet)
+        hub.detection_listeners.discard(self._on_detections)
+        hub.unsubscribe(self)
+        with self._lock:
+            self.ring.clear()
+            self._recent.clear()
+
+    async def _run(self):
+        try:
+            while True:
+                if self.hub is None or self.hub.closed:
+                    # Source went away (or never came up): close the clip, reopen
+                    await self._end_clip()
+                    self._detach()
+                    try:
+                        self._attach()
+                    except Exception as e:
+                        logger.warning(f"Event clips: cannot open source ({e}), retrying in {_RETRY_SEC}s")
+                        await asyncio.sleep(_RETRY_SEC)
+                        continue
+
+                if self.clip is not None and time.monotonic() >= self._clip_until:
+                    await self._end_clip()
+                await asyncio.sleep(0.5)
+        except asyncio.CancelledError:
+            pass
+
+    def _on_packet(self, packet: av.Packet):
+        """Demux thread"""
+        # The ring and _pending keep the demuxed packet itself (decoding only
+        # reads it); a packet is copied once, by clip.feed, when it is written
+        with self._lock:
+            self.ring.push(packet)
+            if self.clip is not None:
+                self.clip.feed(packet)
+            elif self._pending is not None:
+                self._pending.append(packet)
+
+    def _matches(self, result: DetectionResult) -> bool:
+        dets = result.detections
+        if len(dets) == 0:
+            return False
+        mask = dets.scores >= EVENT_CLIP_MIN_CONFIDENCE
+        if self.class_ids is not None:
+            mask &= np.isin(dets.classes, self.class_ids)
+        return int(mask.sum()) >= EVENT_CLIP_MIN_COUNT
+
+    def _on_detections(self, result: DetectionResult, pts: Optional[int]):
+        """Event loop: feed the sidecar and evaluate the trigger"""
+        with self._lock:
+            self._recent.append((result, pts))
+            if self.clip is not None:
+                self.clip.feed_detections(result, pts)
+            elif self._pending is not None:
+                self._pending_dets.append((result, pts))
+
+        self._hits = self._hits + 1 if self._matches(result) else 0
+        if self._hits < EVENT_CLIP_TRIGGER_FRAMES:
+            return
+
+        now = time.monotonic()
+        if self.clip is None and self._start_task is None:
+            if now < self._retry_at:
+                return
+            self._clip_started = now
+            self._start_task = asyncio.create_task(self._start_clip())
+        # Each trigger extends the post-roll, up to the clip length cap
+        self._clip_until = min(now + EVENT_CLIP_POST_ROLL_SEC, self._clip_started + EVENT_CLIP_MAX_SEC)
+
+    async def _start_clip(self):
+        try:
+            hub = self.hub
+            stamp = datetime.now(JAKARTA_TZ)
+            recording_id = f"event_{self.transport}_{stamp.strftime('%Y%m%d_%H%M%S')}"
+            codec_name = hub.packet_source().stream.codec_context.name
+            filename = f"recording_{recording_id}.{container_extension(codec_name)}"
+            filepath = os.path.join(RECORDINGS_DIR, filename)
+
+            # Only the snapshot is taken under the lock; packets arriving while
+            # the files are opened go to _pending, so none is lost or repeated
+            with self._lock:
+                preroll = self.ring.snapshot()
+                preroll_sec = self.ring.span_seconds()
+                first_t = packet_time(preroll[0]) if preroll else None
+                preroll_dets = [
+                    (r, p) for r, p in self._recent
+                    if p is not None and first_t is not None and p >= first_t
+                ]
+                self._pending, self._pending_dets = [], []
+
+            try:
+                clip = await asyncio.to_thread(
+                    PassthroughRecorder,
+                    hub,
+                    filepath,
+                    maxsize=len(preroll) + RECORDING_PASSTHROUGH_QUEUE,
+                    attach=False,
+                    preroll=preroll,
+                    preroll_detections=preroll_dets
+                )
+            except Exception as e:
+                with self._lock:
+                    self._pending, self._pending_dets = None, []
+                self._retry_at = time.monotonic() + _RETRY_SEC
+                logger.error(f"Event clip could not start: {e} (next attempt in {_RETRY_SEC}s)")
+                return
+
+            with self._lock:
+                for packet in self._pending:
+                    clip.feed(packet)
+                for result, pts in self._pending_dets:
+                    clip.feed_detections(result, pts)
+                self._pending, self._pending_dets = None, []
+                self.clip = clip
+
+            self._clip_info = {
+                "recording_id": recording_id,
+                "filename": filename,
+                "filepath": filepath,
+                "recorder": clip,
+                "start_time": stamp - timedelta(seconds=preroll_sec),
+                "session_id": streaming_session_id,
+            }
+            self.triggers += 1
+            logger.info(f"Event clip started: {filename} ({preroll_sec:.1f}s pre-roll)")
+        finally:
+            self._start_task = None
+
+    async def _end_clip(self):
+        with self._lock:
+            clip, info = self.clip, self._clip_info
+            self.clip, self._clip_info = None, None
+        self._hits = 0
+        if clip is None or info is None:
+            return
+        self.clips += 1
+        self.last_clip = info["filename"]
+        await finalize_recording(info)
+        logger.info(f"Event clip ended: {info['filename']} (finalizing in background)")
+
+    def state(self) -> dict:
+        return {
+            "source": self.transport,
+            "attached": self.hub is not None and not self.hub.closed,
+            "buffer_bytes": self.ring.bytes,
+            "buffer_max_bytes": self.ring.max_bytes,
+            "buffer_seconds": round(self.ring.span_seconds(), 2),
+            "evicted_gops": self.ring.evicted,
+            "starting": self._start_task is not None,
+            "recording": self.clip is not None,
+            "clip": self.clip.state() if self.clip is not None else None,
+            "triggers": self.triggers,
+            "clips": self.clips,
+            "last_clip": self.last_clip,
+        }
+
+
+event_clip_recorder: Optional[EventClipRecorder] = None
+
+
+def start_event_clips():
+    global event_clip_recorder
+    if event_clip_recorder is None:
+        event_clip_recorder = EventClipRecorder()
+        event_clip_recorder.start()
+
+
+async def stop_event_clips():
+    global event_clip_recorder
+    if event_clip_recorder is not None:
+        await event_clip_recorder.stop()
+        event_clip_recorder = None
+
+
+def get_event_clip_state() -> Optional[dict]:
+    return event_clip_recorder.state() if event_clip_recorder is not None else None
@@ -0,0 +1,76 @@
+"""
+Frame buffers without redundant copies
+
+FramePool recycles fixed-shape uint8 arrays for consumers that need their own
+copy of a frame (the model input). writable_view exposes a bgr24 VideoFrame's
+plane as an ndarray, so resize and overlay can write straight into the frame
+that goes to the encoder instead of building it afterwards.
+"""
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from av import VideoFrame
+
+logger = logging.getLogger("carter-backend")
+
+
+class FramePool:
+
+    def __init__(self, max_free: int = 4):
+        self.max_free = max_free
+        self._free: Dict[Tuple[int, ...], List[np.ndarray]] = {}
+
+        # Stats
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self, shape: Tuple[int, ...]) -> np.ndarray:
+        """Buffer of the given shape; contents are undefined"""
+        free = self._free.get(shape)
+        if free:
+            self.reused += 1
+            return free.pop()
+        self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def copy_of(self, img: np.ndarray) -> np.ndarray:
+        buf = self.acquire(img.shape)
+        np.copyto(buf, img)
+        return buf
+
+    def release(self, buf: Optional[np.ndarray]):
+        """Return a buffer once its consumer no longer reads it"""
+        if buf is None:
+            return
+        free = self._free.setdefault(buf.shape, [])
+        if len(free) < self.max_free:
+            free.append(buf)
+
+    def clear(self):
+        self._free.clear()
+
+    def state(self) -> dict:
+        return {
+            "allocated": self.allocated,
+            "reused": self.reused,
+            "free": sum(len(v) for v in self._free.values()),
+        }
+
+
+def writable_view(frame: VideoFrame) -> Optional[np.ndarray]:
+    """
+    HxWx3 view onto a bgr24 frame's pixels, or None if the plane is padded
+    or read-only (callers then fall back to VideoFrame.from_ndarray)
+    """
+    if frame.format.name != "bgr24":
+        return None
+    plane = frame.planes[0]
+    if plane.line_size != frame.width * 3:
+        return None
+    try:
+        arr = np.frombuffer(plane, dtype=np.uint8)
+    except (TypeError, ValueError):
+        return None
+    if not arr.flags.writeable:
+        return None
+    return arr[:frame.height * plane.line_size].reshape(frame.height, frame.width, 3)
@@ -0,0 +1,80 @@
+"""
+GOP-aligned ring of encoded packets
+
+Holds the most recent compressed packets of one stream, grouped by GOP so the
+oldest packet is always a keyframe and a snapshot can be muxed as-is. Bounded
+both by time (the pre-roll it must cover) and by bytes.
+"""
+from collections import deque
+from typing import TYPE_CHECKING, Deque, List, Optional
+
+if TYPE_CHECKING:
+    import av
+
+
+def packet_time(packet: "av.Packet") -> Optional[int]:
+    return packet.pts if packet.pts is not None else packet.dts
+
+
+class GopRing:
+    """
+    Encoded packets of the most recent GOPs
+
+    Always starts at a keyframe. Whole GOPs are evicted once the newer ones
+    alone cover the pre-roll or the byte budget is exceeded; a single GOP
+    larger than the budget is dropped too, so memory never exceeds max_bytes.
+    """
+
+    def __init__(self, seconds: float, max_bytes: int):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self._gops: Deque[List["av.Packet"]] = deque()
+        self._gop_bytes: Deque[int] = deque()
+        self.bytes = 0
+        self.evicted = 0
+
+    def push(self, packet: "av.Packet"):
+        if packet.is_keyframe:
+            self._gops.append([])
+            self._gop_bytes.append(0)
+        elif not self._gops:
+            return  # wait for the first keyframe
+        self._gops[-1].append(packet)
+        self._gop_bytes[-1] += packet.size
+        self.bytes += packet.size
+        self._trim(packet)
+
+    def _drop_oldest(self):
+        self._gops.popleft()
+        self.bytes -= self._gop_bytes.popleft()
+        self.evicted += 1
+
+    def _trim(self, newest: "av.Packet"):
+        newest_t = packet_time(newest)
+        while self._gops:
+            if self.bytes > self.max_bytes:
+                self._drop_oldest()
+                continue
+            if len(self._gops) < 2 or newest_t is None:
+                break
+            second_t = packet_time(self._gops[1][0])
+            if second_t is None or (newest_t - second_t) * newest.time_base < self.seconds:
+                break
+            # The newer GOPs alone already cover the pre-roll
+            self._drop_oldest()
+
+    def snapshot(self) -> List["av.Packet"]:
+        return [p for gop in self._gops for p in gop]
+
+    def span_seconds(self) -> float:
+        if not self._gops:
+            return 0.0
+        first, last = self._gops[0][0], self._gops[-1][-1]
+        if packet_time(first) is None or packet_time(last) is None:
+            return 0.0
+        return float((packet_time(last) - packet_time(first)) * last.time_base)
+
+    def clear(self):
+        self._gops.clear()
+        self._gop_bytes.clear()
+        self.bytes = 0
@@ -0,0 +1,225 @@
+"""
+Pass-through recording
+
+Stores the camera's compressed packets as they come off the RTSP demuxer
+(remux only, no decode or encode) next to a time-indexed detections sidecar;
+the browser draws the boxes over the original video during playback.
+
+The sidecar is JSON Lines, one header line followed by one line per
+inference result, times in seconds from the start of the video file:
+
+    {"v": 1, "w": 1280, "h": 720, "names": [...]}
+    {"t": 12.345, "b": [x1, y1, x2, y2, ...], "c": [cls, ...], "s": [conf, ...]}
+
+Boxes are in the w x h space the detector saw; a line holds until the next
+one. Packets and sidecar lines go through one bounded queue to a writer
+thread, so neither the demux thread nor the event loop touches the disk.
+"""
+import os
+import json
+import queue
+import logging
+import threading
+from fractions import Fraction
+from typing import Iterable, Optional, Tuple
+import av
+
+from config import RECORDING_PASSTHROUGH_QUEUE
+from models.yolo_detector import get_class_names
+from video.detection_pipeline import DetectionResult
+
+logger = logging.getLogger("carter-backend")
+
+SIDECAR_SUFFIX = ".detections.jsonl"
+
+# Browsers play H.264/H.265 from MP4; anything else is kept in Matroska
+_MP4_CODECS = ("h264", "hevc")
+
+
+def container_extension(codec_name: str) -> str:
+    return "mp4" if codec_name in _MP4_CODECS else "mkv"
+
+
+def sidecar_path(video_path: str) -> str:
+    return os.path.splitext(video_path)[0] + SIDECAR_SUFFIX
+
+
+def copy_packet(packet: av.Packet) -> av.Packet:
+    # Muxing consumes the packet's buffer; the decoder still needs the original
+    copy = av.Packet(bytes(packet))
+    copy.pts = packet.pts
+    copy.dts = packet.dts
+    copy.time_base = packet.time_base
+    copy.is_keyframe = packet.is_keyframe
+    return copy
+
+
+class PassthroughRecorder:
+    """
+    attach=False leaves the packet tap and detection listener to the caller,
+    which then feeds packets/detections itself (event clips) or calls
+    attach() once back on the event loop; preroll packets and (result, pts)
+    pairs are written first
+    """
+
+    def __init__(
+        self,
+        hub,
+        filepath: str,
+        maxsize: int = RECORDING_PASSTHROUGH_QUEUE,
+        attach: bool = True,
+        preroll: Iterable[av.Packet] = (),
+        preroll_detections: Iterable[Tuple[DetectionResult, Optional[int]]] = ()
+    ):
+        self.hub = hub
+        self.source = hub.packet_source()
+        if self.source is None:
+            raise RuntimeError("Source has no packet tap (RECORDING_MODE=passthrough needs the demux player)")
+        self.filepath = filepath
+        self.sidecar_path = sidecar_path(filepath)
+        in_stream = self.source.stream
+        self.time_base: Fraction = in_stream.time_base
+
+        options = {}
+        if filepath.endswith(".mp4"):
+            # Fragmented MP4 stays playable up to the last fragment if the process dies
+            options["movflags"] = "frag_keyframe+empty_moov+default_base_moof"
+        self._output = av.open(filepath, mode="w", options=options)
+        if hasattr(self._output, "add_stream_from_template"):
+            self._out_stream = self._output.add_stream_from_template(in_stream)
+        else:
+            self._out_stream = self._output.add_stream(template=in_stream)
+        self._sidecar = open(self.sidecar_path, "w", encoding="utf-8")
+        w, h = hub.size or (in_stream.codec_context.width, in_stream.codec_context.height)
+        self._sidecar.write(json.dumps(
+            {"v": 1, "w": w, "h": h, "names": get_class_names()}, separators=(",", ":")
+        ) + "\n")
+
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        # dts of the first keyframe; the file's timeline starts there
+        self._origin: Optional[int] = None
+        self._waiting_keyframe = True
+        self._last_empty = False
+        self._last_pts: Optional[int] = None
+        self.stopped = False
+
+        # Stats
+        self.packets = 0
+        self.bytes = 0
+        self.dropped_packets = 0
+        self.detections = 0
+
+        self._thread = threading.Thread(target=self._writer, name="passthrough-recorder", daemon=True)
+        self._thread.start()
+        for packet in preroll:
+            self.feed(packet)
+        for result, pts in preroll_detections:
+            self.feed_detections(result, pts)
+        self.attached = False
+        if attach:
+            self.attach()
+
+    def attach(self):
+        """Start taking packets and detections from the hub (event loop)"""
+        if not self.attached:
+            self.attached = True
+            self.source.add_packet_tap(self.feed)
+            self.hub.detection_listeners.add(self.feed_detections)
+
+    def feed(self, packet: av.Packet):
+        """Demux thread: queue a copy, resyncing at a keyframe after a drop"""
+        if self._waiting_keyframe:
+            if not packet.is_keyframe:
+                return
+            if self._origin is None:
+                self._origin = packet.dts if packet.dts is not None else packet.pts
+            self._waiting_keyframe = False
+        try:
+            self._queue.put_nowait(("packet", copy_packet(packet)))
+        except queue.Full:
+            self.dropped_packets += 1
+            self._waiting_keyframe = True
+
+    def feed_detections(self, result: DetectionResult, pts: Optional[int]):
+        """Event loop: one sidecar line per inference result"""
+        if pts is None or self._origin is None or self.stopped:
+            return
+        t = float((pts - self._origin) * self.time_base)
+        if t < 0:
+            return
+        dets = result.detections
+        # Consecutive empty results add nothing for playback
+        empty = len(dets) == 0
+        if empty and self._last_empty:
+            return
+        self._last_empty = empty
+        line = json.dumps({
+            "t": round(t, 3),
+            "b": [int(v) for v in dets.boxes.ravel().tolist()],
+            "c": dets.classes.tolist(),
+            "s": [round(v, 2) for v in dets.scores.tolist()],
+        }, separators=(",", ":"))
+        try:
+            self._queue.put_nowait(("det", line))
+            self.detections += 1
+        except queue.Full:
+            pass
+
+    def _writer(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, value = item
+                if kind == "det":
+                    self._sidecar.write(value + "\n")
+                    continue
+                packet = value
+                if packet.dts is not None:
+                    packet.dts -= self._origin
+                if packet.pts is not None:
+                    packet.pts -= self._origin
+                packet.stream = self._out_stream
+                self.bytes += packet.size
+                pts = packet.pts
+                try:
+                    self._output.mux(packet)
+                    self.packets += 1
+                    if pts is not None and (self._last_pts is None or pts > self._last_pts):
+                        self._last_pts = pts
+                except Exception as e:
+                    # e.g. non-monotonic dts from the camera; skip the packet
+                    self.dropped_packets += 1
+                    logger.debug(f"Pass-through mux skipped a packet: {e}")
+        finally:
+            try:
+                self._output.close()
+            except Exception as e:
+                logger.error(f"Error finalizing pass-through recording: {e}")
+            self._sidecar.close()
+
+    def stop(self, timeout: float = 10.0) -> dict:
+        """Detach from the source and finalize both files (blocking)"""
+        if not self.stopped:
+            self.stopped = True
+            if self.attached:
+                self.source.remove_packet_tap(self.feed)
+                self.hub.detection_listeners.discard(self.feed_detections)
+            self._queue.put(None)
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Pass-through recorder did not finish in time: {self.filepath}")
+        return self.state()
+
+    def state(self) -> dict:
+        return {
+            "mode": "passthrough",
+            "codec": self.source.stream.codec_context.name,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "dropped_packets": self.dropped_packets,
+            "detections": self.detections,
+            "duration_sec": round(float(self._last_pts * self.time_base), 3) if self._last_pts else 0.0,
+            "queued": self._queue.qsize(),
+        }
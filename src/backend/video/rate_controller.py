@@ -0,0 +1,127 @@
+"""
+Adaptive inference rate controller
+
+Watches per-frame processing time and per-call inference time and decides how
+often the detection stage may start a new inference (and, optionally, which
+model input size to use) so the video holds TARGET_FPS while detection runs
+as often as the hardware allows.
+"""
+import time
+from typing import List, Optional
+
+from config import (
+    TARGET_FPS,
+    ADAPTIVE_INFERENCE,
+    ADAPTIVE_INTERVAL_MAX_SEC,
+    ADAPTIVE_PERIOD_SEC,
+    ADAPTIVE_RESOLUTION,
+    ADAPTIVE_IMGSZ_STEPS
+)
+
+# EWMA smoothing factor for timing samples
+_ALPHA = 0.2
+
+
+class InferenceRateController:
+
+    def __init__(
+        self,
+        target_fps: int = TARGET_FPS,
+        enabled: bool = ADAPTIVE_INFERENCE,
+        max_interval: float = ADAPTIVE_INTERVAL_MAX_SEC,
+        imgsz_steps: Optional[List[int]] = None
+    ):
+        self.target_fps = max(1, target_fps)
+        self.enabled = enabled
+        self.max_interval = max_interval
+        self.frame_budget_ms = 1000.0 / self.target_fps
+
+        # Largest input size first; index 0 means full resolution
+        if imgsz_steps is None:
+            imgsz_steps = ADAPTIVE_IMGSZ_STEPS if ADAPTIVE_RESOLUTION else []
+        self.imgsz_steps = imgsz_steps
+        self.imgsz_idx = 0
+
+        # Current decision: minimum seconds between inference starts
+        self.interval = 0.0
+        self.last_start = 0.0
+
+        # Measurements
+        self.frame_ms = 0.0
+        self.infer_ms = 0.0
+        self.video_fps = 0.0
+        self._frames = 0
+        self._period_start = time.monotonic()
+
+    @property
+    def imgsz(self) -> Optional[int]:
+        if not self.imgsz_steps:
+            return None
+        return self.imgsz_steps[self.imgsz_idx]
+
+    def allow(self, now: float) -> bool:
+        """True if enough time has passed since the last inference start"""
+        return not self.enabled or now - self.last_start >= self.interval
+
+    def started(self, now: float):
+        self.last_start = now
+
+    def observe_inference(self, infer_ms: float):
+        self.infer_ms = infer_ms if self.infer_ms == 0.0 else (
+            (1 - _ALPHA) * self.infer_ms + _ALPHA * infer_ms
+        )
+
+    def observe_frame(self, frame_ms: float, now: Optional[float] = None):
+        """Record processing time of one video frame and re-evaluate periodically"""
+        self.frame_ms = frame_ms if self.frame_ms == 0.0 else (
+            (1 - _ALPHA) * self.frame_ms + _ALPHA * frame_ms
+        )
+        self._frames += 1
+
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self._period_start
+        if elapsed >= ADAPTIVE_PERIOD_SEC:
+            self.video_fps = self._frames / elapsed
+            self._frames = 0
+            self._period_start = now
+            if self.enabled:
+                self._adjust()
+
+    def _adjust(self):
+        fps_short = self.video_fps < self.target_fps * 0.9
+        overloaded = self.frame_ms > self.frame_budget_ms or (
+            fps_short and self.frame_ms > self.frame_budget_ms * 0.6
+        )
+        # Judged on processing time alone: a camera slower than TARGET_FPS keeps
+        # video_fps short for good, which must not pin the back-off forever
+        headroom = self.frame_ms < self.frame_budget_ms * 0.4
+
+        if overloaded:
+            if self.interval < self.max_interval:
+                # Back off: never ask for inference faster than it can complete
+                step = max(self.interval * 1.5, self.infer_ms / 1000.0, self.frame_budget_ms / 1000.0)
+                self.interval = min(self.max_interval, step)
+            elif self.imgsz_idx < len(self.imgsz_steps) - 1:
+                self.imgsz_idx += 1
+        elif headroom:
+            if self.imgsz_idx > 0:
+                self.imgsz_idx -= 1
+            elif self.interval > 0.0:
+                self.interval *= 0.75
+                if self.interval < self.frame_budget_ms / 1000.0:
+                    self.interval = 0.0
+
+    def state(self) -> dict:
+        """Current decision and the measurements behind it"""
+        max_hz = (1.0 / self.interval) if self.interval > 0 else None
+        return {
+            "enabled": self.enabled,
+            "target_fps": self.target_fps,
+            "min_interval_ms": round(self.interval * 1000.0, 1),
+            "max_inference_hz": round(max_hz, 2) if max_hz else None,
+            "imgsz": self.imgsz,
+            "frame_ms": round(self.frame_ms, 2),
+            "inference_ms": round(self.infer_ms, 2),
+            "video_fps": round(self.video_fps, 2),
+        }
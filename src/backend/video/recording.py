@@ -1,8 +1,9 @@
 import os
 import cv2
+import asyncio
 import logging
 import httpx
-from typing import Optional, Dict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
 from datetime import datetime
 import pytz
 from config import (
@@ -10,8 +11,18 @@ from config import (
     RESIZE_WIDTH,
     RESIZE_HEIGHT,
     API_BASE_URL,
+    RECORDING_CODEC,
+    RECORDING_ENCODER_PRESET,
+    RECORDING_MODE,
+    RECORDING_STOP_TIMEOUT_SEC,
     streaming_session_id
 )
+from video.recording_worker import RecordingProcess, container_extension
+from video.passthrough_recording import (
+    PassthroughRecorder,
+    sidecar_path,
+    container_extension as passthrough_extension
+)
 
 # Jakarta timezone
 JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
@@ -21,6 +32,14 @@ logger = logging.getLogger("carter-backend")
 # Active recordings
 active_recordings: Dict[str, dict] = {}
 
+# Stopped recordings being (or recently) finalized, by recording_id:
+# status = finalizing -> saving -> saved | unsaved (file kept, API failed) | failed
+finalize_status: Dict[str, dict] = {}
+_finalize_tasks: Set[asyncio.Task] = set()
+# Awaited with a copy of the status on every change (e.g. WebSocket push)
+status_listeners: Set[Callable[[dict], Awaitable[None]]] = set()
+FINALIZE_STATUS_KEEP = 50
+
 
 def initialize_recordings_dir():
     logger.info(f"Recordings will be stored in system temp directory: {RECORDINGS_DIR}")
@@ -60,50 +79,50 @@ async def start_recording(client_id: str, detection_track) -> Optional[str]:
 
     try:
         # Import here to avoid circular dependency
-        from video.detection_track import get_fps
+        from video.source_hub import get_fps
 
         recording_id = f"{client_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        filename = f"recording_{recording_id}.webm"
-        filepath = os.path.join(RECORDINGS_DIR, filename)
-
-        # Get actual stream FPS for recording
-        actual_fps = get_fps()
-        if actual_fps <= 0:
-            actual_fps = 10.0  # Default to 10 FPS if not yet calculated
-
-        logger.info(f"Recording at {actual_fps:.1f} FPS (full stream rate)")
-
-        # Create video writer with WebM format (VP8 codec) for browser compatibility
-        fourcc_options = [
-            cv2.VideoWriter.fourcc(*'VP80'),
-            cv2.VideoWriter.fourcc(*'VP90'),
-        ]
-
-        writer = None
-        for fourcc in fourcc_options:
-            writer = cv2.VideoWriter(
-                filepath,
-                fourcc,
-                actual_fps,
-                (RESIZE_WIDTH, RESIZE_HEIGHT)
+        hub = detection_track.hub
+
+        if RECORDING_MODE == "passthrough" and hub.packet_source() is not None:
+            # Camera bitstream as-is plus a detections sidecar; nothing is re-encoded
+            codec_name = hub.packet_source().stream.codec_context.name
+            filename = f"recording_{recording_id}.{passthrough_extension(codec_name)}"
+            filepath = os.path.join(RECORDINGS_DIR, filename)
+            # Opening the output and sidecar blocks: done in a thread, attached on the loop
+            recorder = await asyncio.to_thread(PassthroughRecorder, hub, filepath, attach=False)
+            recorder.attach()
+            logger.info(f"Recording {codec_name} pass-through (remux) with detections sidecar")
+        else:
+            if RECORDING_MODE == "passthrough":
+                logger.warning("Source has no packet tap; falling back to encoded recording")
+            filename = f"recording_{recording_id}.{container_extension()}"
+            filepath = os.path.join(RECORDINGS_DIR, filename)
+
+            # Get actual stream FPS for recording
+            actual_fps = get_fps()
+            if actual_fps <= 0:
+                actual_fps = 10.0  # Default to 10 FPS if not yet calculated
+
+            # Frames are muxed at their source pts, so the file plays at the real
+            # rate even if the stream FPS drifts; actual_fps is only the nominal rate
+            width, height = hub.size or (RESIZE_WIDTH, RESIZE_HEIGHT)
+            # Starting the encoder process blocks until it is connected: keep it off the loop
+            recorder = await asyncio.to_thread(RecordingProcess, filepath, (height, width, 3), actual_fps)
+            logger.info(
+                f"Recording {width}x{height} at {actual_fps:.1f} FPS with {RECORDING_CODEC} "
+                f"({RECORDING_ENCODER_PRESET}) in a separate process"
             )
-            if writer.isOpened():
-                logger.info(f"Using codec: {fourcc} at {actual_fps:.1f} FPS")
-                break
-            writer.release()
-            writer = None
 
-        if writer is None or not writer.isOpened():
-            logger.error(f"Failed to open video writer for {filepath}")
-            return None
-
-        detection_track.start_recording(writer)
+        # Encode mode: the track feeds the recorder; pass-through: it only reports it
+        detection_track.start_recording(recorder)
 
         active_recordings[client_id] = {
             "recording_id": recording_id,
             "filename": filename,
             "filepath": filepath,
-            "writer": writer,
+            "recorder": recorder,
+            "track": detection_track,
             "start_time": datetime.now(JAKARTA_TZ),
             "session_id": streaming_session_id
         }
@@ -117,33 +136,87 @@ async def start_recording(client_id: str, detection_track) -> Optional[str]:
 
 
 async def stop_recording(client_id: str) -> Optional[dict]:
+    """
+    Stop a recording without waiting for it to be written out
+
+    Frames stop flowing immediately; draining the encoder, closing and
+    fsyncing the file and registering it with the API run in the background.
+    Returns the initial "finalizing" status; poll get_finalize_status or
+    listen through status_listeners for the outcome.
+    """
     if client_id not in active_recordings:
         logger.warning(f"Client {client_id} is not recording")
         return None
 
-    try:
-        recording_info = active_recordings.pop(client_id)
-        recording_id = recording_info["recording_id"]
-        filepath = recording_info["filepath"]
+    recording_info = active_recordings.pop(client_id)
+    track = recording_info.get("track")
+    if track is not None:
+        track.detach_recorder()
+
+    status = await finalize_recording(recording_info, client_id)
+    logger.info(f"Stopping recording for client {client_id}: {recording_info['filename']} (finalizing in background)")
+    return status
+
+
+async def finalize_recording(recording_info: dict, client_id: Optional[str] = None) -> dict:
+    """
+    Close, fsync and register a recording in the background
+
+    recording_info holds recording_id, filename, filepath, recorder (anything
+    with a blocking stop() -> stats), start_time and session_id.
+    """
+    end_time = datetime.now(JAKARTA_TZ)
+    status = {
+        "recording_id": recording_info["recording_id"],
+        "client_id": client_id,
+        "filename": recording_info["filename"],
+        "status": "finalizing",
+        "start_time": recording_info["start_time"].isoformat(),
+        "end_time": end_time.isoformat(),
+        "session_id": recording_info["session_id"],
+    }
+    finalize_status[status["recording_id"]] = status
+    task = asyncio.create_task(_finalize(recording_info, status, end_time))
+    _finalize_tasks.add(task)
+    task.add_done_callback(_finalize_tasks.discard)
+    await _notify(status)
+    return dict(status)
+
+
+def _close_and_sync(recorder, paths: List[str]) -> dict:
+    """Blocking: drain and close the recorder, then fsync what it wrote"""
+    stats = recorder.stop()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return stats
 
 
-        # Get file info (use Jakarta timezone)
-        file_size = os.path.getsize(filepath)
-        end_time = datetime.now(JAKARTA_TZ)
-        duration = (end_time - recording_info["start_time"]).total_seconds()
+async def _finalize(recording_info: dict, status: dict, end_time: datetime):
+    filepath = recording_info["filepath"]
+    try:
+        recorder_stats = await asyncio.to_thread(
+            _close_and_sync, recording_info["recorder"], [filepath, sidecar_path(filepath)]
+        )
 
-        recording_data = {
-            "recording_id": recording_id,
-            "filename": recording_info["filename"],
+        file_size = os.path.getsize(filepath)
+        # Media duration from the muxed timestamps; wall clock if nothing was written
+        duration = recorder_stats.get("duration_sec") or (end_time - recording_info["start_time"]).total_seconds()
+        status.update({
+            "status": "saving",
             "filepath": filepath,
             "file_size": file_size,
             "duration": duration,
-            "start_time": recording_info["start_time"].isoformat(),
-            "end_time": end_time.isoformat(),
-            "session_id": recording_info["session_id"]
-        }
-
-        logger.info(f"Stopped recording for client {client_id}: {recording_info['filename']} ({duration:.1f}s, {file_size/1024/1024:.2f}MB)")
+            "recorder": recorder_stats,
+        })
+        if os.path.exists(sidecar_path(filepath)):
+            status["sidecar"] = os.path.basename(sidecar_path(filepath))
+        logger.info(f"Finalized recording {recording_info['filename']} ({duration:.1f}s, {file_size/1024/1024:.2f}MB)")
 
         # Save to database via API
         try:
@@ -164,17 +237,41 @@ async def stop_recording(client_id: str) -> Optional[dict]:
 
                 if response.status_code == 201:
                     logger.info(f"✓ Saved recording to database: {recording_info['filename']}")
+                    status["status"] = "saved"
                 else:
                     logger.warning(f"Failed to save recording to database: HTTP {response.status_code}")
+                    status.update({"status": "unsaved", "error": f"HTTP {response.status_code}"})
 
         except Exception as e:
             logger.error(f"Error saving recording to database: {e}")
-
-        return recording_data
+            status.update({"status": "unsaved", "error": str(e) or type(e).__name__})
 
     except Exception as e:
-        logger.error(f"Error stopping recording: {e}")
-        return None
+        logger.error(f"Error finalizing recording {recording_info['filename']}: {e}")
+        status.update({"status": "failed", "error": str(e) or type(e).__name__})
+
+    _prune_finalize_status()
+    await _notify(status)
+
+
+async def _notify(status: dict):
+    for listener in list(status_listeners):
+        try:
+            await listener(dict(status))
+        except Exception as e:
+            logger.debug(f"Recording status listener error: {e}")
+
+
+def _prune_finalize_status():
+    # Keep the most recent results for polling clients
+    done = [rid for rid, st in finalize_status.items() if st["status"] not in ("finalizing", "saving")]
+    for rid in done[:-FINALIZE_STATUS_KEEP]:
+        finalize_status.pop(rid, None)
+
+
+def get_finalize_status(recording_id: str) -> Optional[dict]:
+    status = finalize_status.get(recording_id)
+    return dict(status) if status is not None else None
 
 
 def is_recording(client_id: str) -> bool:
@@ -182,14 +279,31 @@ def is_recording(client_id: str) -> bool:
 
 
 def get_recording_info(client_id: str) -> Optional[dict]:
-    return active_recordings.get(client_id)
+    info = active_recordings.get(client_id)
+    if info is None:
+        return None
+    info = {k: v for k, v in info.items() if k not in ("recorder", "track")}
+    info["recorder"] = active_recordings[client_id]["recorder"].state()
+    return info
 
 
-def cleanup_all_recordings():
+async def cleanup_all_recordings(timeout: float = RECORDING_STOP_TIMEOUT_SEC):
+    """Finalize open recordings on shutdown (files only) and wait for pending ones"""
     for client_id in list(active_recordings.keys()):
         recording_info = active_recordings.pop(client_id)
+        if recording_info.get("track") is not None:
+            recording_info["track"].detach_recorder()
         try:
-            recording_info["writer"].release()
+            await asyncio.to_thread(
+                _close_and_sync,
+                recording_info["recorder"],
+                [recording_info["filepath"], sidecar_path(recording_info["filepath"])]
+            )
             logger.info(f"Cleaned up recording for client {client_id}")
         except Exception as e:
             logger.error(f"Error cleaning up recording for {client_id}: {e}")
+
+    if _finalize_tasks:
+        done, pending = await asyncio.wait(set(_finalize_tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} recording(s) still finalizing at shutdown")
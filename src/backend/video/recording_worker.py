@@ -0,0 +1,363 @@
+"""
+Out-of-process recording encoder
+
+Frames are copied into a shared-memory ring of RECORDING_RING_SLOTS slots and
+only the slot index and timestamp cross a local connection; a worker process
+encodes them with PyAV and hands the slot back. Encoding therefore never
+holds the GIL of the streaming process. When every slot is still owned by
+the worker the frame is dropped and counted instead of blocking the stream.
+
+The worker runs as `python -m video.recording_worker` rather than through
+multiprocessing's spawn, which would re-import main.py (torch, ultralytics,
+FastAPI) in every recording's child.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import subprocess
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+from fractions import Fraction
+from typing import List, Optional, Tuple
+import numpy as np
+
+from config import (
+    RECORDING_MAX_GAP_SEC,
+    RECORDING_CODEC,
+    RECORDING_ENCODER_PRESET,
+    RECORDING_BITRATE_KBPS,
+    RECORDING_RING_SLOTS,
+    RECORDING_STOP_TIMEOUT_SEC
+)
+
+logger = logging.getLogger("carter-backend")
+
+# Recording pts: 90 kHz (the RTP video clock), counted from the first frame
+TIME_BASE = Fraction(1, 90000)
+
+# x264-style presets mapped onto libvpx cpu-used (higher = faster)
+_VPX_CPU_USED = {
+    "ultrafast": 16, "superfast": 12, "veryfast": 8, "faster": 6,
+    "fast": 4, "medium": 2, "slow": 1, "slower": 0, "veryslow": 0,
+}
+
+
+def container_extension(codec: str = RECORDING_CODEC) -> str:
+    return "mp4" if codec == "libx264" else "webm"
+
+
+def encoder_options(codec: str, preset: str) -> dict:
+    if codec == "libx264":
+        return {"preset": preset, "tune": "zerolatency"}
+    cpu_used = _VPX_CPU_USED.get(preset, 8)
+    if codec == "libvpx-vp9":
+        cpu_used = min(cpu_used, 8)
+        return {"deadline": "realtime", "cpu-used": str(cpu_used), "row-mt": "1"}
+    return {"deadline": "realtime", "cpu-used": str(cpu_used)}
+
+
+def _worker_main(conn, shm_name: str, shape: Tuple[int, int, int], slots: int,
+                 filepath: str, fps: float, codec: str, preset: str, bitrate_kbps: int):
+    """Worker process: encode frames from the ring until a None arrives"""
+    import av
+
+    shm = _attach_shared_memory(shm_name)
+    ring = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=shm.buf)
+    written = 0
+    errors = 0
+    last_pts = -1
+    error = None
+    try:
+        container = av.open(filepath, mode="w")
+        stream = container.add_stream(codec, rate=max(1, int(round(fps))))
+        stream.width = shape[1]
+        stream.height = shape[0]
+        stream.pix_fmt = "yuv420p"
+        stream.bit_rate = bitrate_kbps * 1000
+        stream.time_base = TIME_BASE
+        stream.codec_context.time_base = TIME_BASE
+        stream.codec_context.options = encoder_options(codec, preset)
+
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            slot, pts = msg
+            try:
+                # from_ndarray copies the pixels: the slot is free right away,
+                # not held for the encode
+                try:
+                    frame = av.VideoFrame.from_ndarray(ring[slot], format="bgr24")
+                finally:
+                    conn.send(("free", slot))
+                pts = max(pts, last_pts + 1)
+                last_pts = pts
+                frame.pts = pts
+                frame.time_base = TIME_BASE
+                for packet in stream.encode(frame.reformat(format="yuv420p")):
+                    container.mux(packet)
+                written += 1
+            except Exception:
+                errors += 1
+
+        for packet in stream.encode():
+            container.mux(packet)
+        container.close()
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    finally:
+        del ring
+        shm.close()
+        try:
+            conn.send(("done", {"written": written, "errors": errors, "error": error}))
+            conn.close()
+        except OSError:
+            pass  # parent already gone
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Open the parent's ring without letting this process's tracker unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _start_worker(params: dict) -> Tuple[subprocess.Popen, Connection]:
+    """
+    Launch the worker module and connect to it (blocking)
+
+    The worker listens on a loopback port and prints the address; the
+    authkey travels over its stdin.
+    """
+    authkey = os.urandom(16)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "video.recording_worker"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        process.stdin.write((json.dumps({"authkey": authkey.hex(), **params}) + "\n").encode())
+        process.stdin.close()
+        line = process.stdout.readline()
+        process.stdout.close()
+        if not line:
+            raise RuntimeError(f"recording encoder exited during startup (code {process.wait()})")
+        host, port = json.loads(line)
+        return process, Client((host, port), authkey=authkey)
+    except Exception:
+        if process.poll() is None:
+            process.kill()
+        raise
+
+
+def _worker_entry():
+    """`python -m video.recording_worker`: handshake, then encode until told to stop"""
+    params = json.loads(sys.stdin.readline())
+    authkey = bytes.fromhex(params.pop("authkey"))
+    with Listener(("127.0.0.1", 0), authkey=authkey) as listener:
+        print(json.dumps(listener.address), flush=True)
+        conn = listener.accept()
+    params["shape"] = tuple(params["shape"])
+    _worker_main(conn, **params)
+
+
+class RecordingProcess:
+    """
+    Main-process side of one recording: owns the ring and the worker
+
+    Construction starts a process and blocks until it is connected; build it
+    with asyncio.to_thread from the event loop.
+    """
+
+    def __init__(self, filepath: str, shape: Tuple[int, int, int], fps: float,
+                 slots: int = RECORDING_RING_SLOTS, codec: str = RECORDING_CODEC,
+                 preset: str = RECORDING_ENCODER_PRESET, bitrate_kbps: int = RECORDING_BITRATE_KBPS):
+        self.filepath = filepath
+        self.shape = tuple(shape)
+        self.slots = max(2, slots)
+        self.codec = codec
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.shape)) * self.slots)
+        self._ring = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free: List[int] = list(range(self.slots))
+        # A fresh interpreter, not a fork: a fork would inherit the event loop,
+        # CUDA and aiortc threads
+        try:
+            self._process, self._conn = _start_worker({
+                "shm_name": self._shm.name, "shape": list(self.shape), "slots": self.slots,
+                "filepath": filepath, "fps": fps, "codec": codec, "preset": preset,
+                "bitrate_kbps": bitrate_kbps,
+            })
+        except Exception:
+            del self._ring
+            self._shm.close()
+            self._shm.unlink()
+            raise
+        self.fps = fps
+        # Source pts of the first frame and where the timeline stands
+        self._origin: Optional[Tuple[int, Fraction]] = None
+        self._offset = 0
+        self._last_pts = -1
+        self._t0: Optional[float] = None
+        self.stopped = False
+        self.result: Optional[dict] = None
+        self._failure_logged = False
+
+        # Stats
+        self.submitted = 0
+        self.dropped_ring_full = 0
+        self.dropped_shape = 0
+        self.discontinuities = 0
+
+    def _drain(self):
+        """Take back slots the worker has finished with"""
+        while self._conn.poll():
+            kind, value = self._conn.recv()
+            if kind == "free":
+                self._free.append(value)
+            elif kind == "done":
+                self.result = value
+
+    def _timestamp(self, pts: Optional[int], time_base: Optional[Fraction]) -> int:
+        """
+        Recording pts (TIME_BASE) from the source frame's pts/time_base
+
+        Variable frame rate and dropped frames come out right because every
+        frame keeps its own presentation time. A backwards jump or a gap over
+        RECORDING_MAX_GAP_SEC (camera restart, pts wrap) starts a new segment
+        one nominal frame after the previous frame. Frames without pts fall
+        back to their arrival time.
+        """
+        now = time.monotonic()
+        if self._t0 is None:
+            self._t0 = now
+        if pts is None or not time_base:
+            ts = int((now - self._t0) / TIME_BASE)
+        else:
+            if self._origin is None or self._origin[1] != time_base:
+                self._origin = (pts, time_base)
+                self._offset = self._last_pts + 1 if self._last_pts >= 0 else 0
+            ts = self._offset + int((pts - self._origin[0]) * time_base / TIME_BASE)
+        if self._last_pts >= 0:
+            delta = ts - self._last_pts
+            if delta > RECORDING_MAX_GAP_SEC / TIME_BASE or delta < -1 / TIME_BASE:
+                self.discontinuities += 1
+                self._offset = self._last_pts + int(1 / (max(1.0, self.fps) * TIME_BASE))
+                self._origin = (pts, time_base) if pts is not None and time_base else None
+                self._t0 = now - float(self._offset * TIME_BASE)
+                ts = self._offset
+            elif delta <= 0:
+                # Repeated or slightly reordered pts; x264/libvpx need strictly increasing
+                ts = self._last_pts + 1
+        return ts
+
+    def duration(self) -> float:
+        """Seconds covered by the frames submitted so far"""
+        if self._last_pts < 0:
+            return 0.0
+        return float((self._last_pts + int(1 / (max(1.0, self.fps) * TIME_BASE))) * TIME_BASE)
+
+    def failed(self) -> bool:
+        """True once the worker has exited on its own (e.g. the output could not be opened)"""
+        if self.stopped:
+            return False
+        if self.result is None and self._process.poll() is not None:
+            try:
+                self._drain()
+            except (EOFError, OSError):
+                pass
+            if self.result is None:
+                self.result = {"error": f"encoder exited (code {self._process.returncode})"}
+        if self.result is None:
+            return False
+        if not self._failure_logged:
+            self._failure_logged = True
+            logger.error(f"Recording encoder stopped early, no more frames accepted: {self.result.get('error')}")
+        return True
+
+    def submit(self, img: np.ndarray, pts: Optional[int] = None, time_base: Optional[Fraction] = None) -> bool:
+        """Copy one BGR frame into the ring; False if it had to be dropped"""
+        if self.stopped:
+            return False
+        if img.shape != self.shape:
+            self.dropped_shape += 1
+            return False
+        try:
+            self._drain()
+        except (EOFError, OSError):
+            pass
+        if self.failed():
+            return False
+        if not self._free:
+            self.dropped_ring_full += 1
+            return False
+        slot = self._free.pop()
+        np.copyto(self._ring[slot], img)
+        ts = self._timestamp(pts, time_base)
+        try:
+            self._conn.send((slot, ts))
+        except (BrokenPipeError, OSError):
+            self._free.append(slot)
+            self.dropped_ring_full += 1
+            return False
+        self._last_pts = max(ts, self._last_pts + 1)
+        self.submitted += 1
+        return True
+
+    def stop(self, timeout: float = RECORDING_STOP_TIMEOUT_SEC) -> dict:
+        """Flush the encoder, wait for the worker and free the ring (blocking)"""
+        if not self.stopped:
+            self.stopped = True
+            deadline = time.monotonic() + timeout
+            try:
+                self._conn.send(None)
+                while self.result is None and time.monotonic() < deadline:
+                    if self._conn.poll(0.1):
+                        self._drain()
+            except (EOFError, OSError):
+                pass
+            try:
+                self._process.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Recording encoder did not finish in time: {self.filepath}")
+                self._process.terminate()
+            self._conn.close()
+            del self._ring
+            self._shm.close()
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+            if self.result and self.result.get("error"):
+                logger.error(f"Recording encoder error: {self.result['error']}")
+        return self.state()
+
+    def state(self) -> dict:
+        result = self.result or {}
+        return {
+            "mode": "encode",
+            "codec": self.codec,
+            "slots": self.slots,
+            "free_slots": len(self._free) if not self.stopped else self.slots,
+            "submitted": self.submitted,
+            "written": result.get("written"),
+            "encode_errors": result.get("errors"),
+            "failed": self.failed(),
+            "error": result.get("error"),
+            "dropped_ring_full": self.dropped_ring_full,
+            "dropped_shape": self.dropped_shape,
+            "discontinuities": self.discontinuities,
+            "duration_sec": round(self.duration(), 3),
+        }
+
+
+if __name__ == "__main__":
+    _worker_entry()
@@ -0,0 +1,85 @@
+"""
+Output rendition ladder
+
+RENDITION_LADDER lists the sizes/bitrates offered to peers, e.g.
+"1280x720@2500,640x360@800,320x180@250". All renditions come from the same
+decoded and annotated source frame; each is scaled at most once per frame,
+off the event loop, whether it feeds a shared encoder or per-peer aiortc
+encoders.
+"""
+import logging
+from typing import List, NamedTuple, Optional
+from av import VideoFrame
+
+from config import RENDITION_LADDER
+
+logger = logging.getLogger("carter-backend")
+
+
+class Rendition(NamedTuple):
+    name: str
+    width: Optional[int]   # None = source size
+    height: Optional[int]
+    kbps: int
+
+
+def parse_ladder(spec: str) -> List[Rendition]:
+    """Parse "WxH@kbps,..." into renditions, highest bitrate first"""
+    ladder = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            size, kbps = item.split("@")
+            w, h = size.lower().split("x")
+            ladder.append(Rendition(f"{int(h)}p", int(w), int(h), int(kbps)))
+        except ValueError:
+            logger.warning(f"Ignoring invalid rendition '{item}' (expected WxH@kbps)")
+    return sorted(ladder, key=lambda r: r.kbps, reverse=True)
+
+
+RENDITIONS: List[Rendition] = parse_ladder(RENDITION_LADDER)
+
+
+def native_rendition(kbps: int) -> Rendition:
+    return Rendition("native", None, None, kbps)
+
+
+def pick_rendition(max_kbps: int) -> Optional[Rendition]:
+    """Best rendition within max_kbps (the lowest one if none fits); None without a ladder"""
+    if not RENDITIONS:
+        return None
+    for r in RENDITIONS:
+        if r.kbps <= max_kbps:
+            return r
+    return RENDITIONS[-1]
+
+
+def step(current: Rendition, direction: int, max_kbps: int) -> Optional[Rendition]:
+    """Neighbouring rendition (+1 = higher quality, -1 = lower) within max_kbps"""
+    if current not in RENDITIONS:
+        return None
+    idx = RENDITIONS.index(current) - direction
+    if not 0 <= idx < len(RENDITIONS):
+        return None
+    candidate = RENDITIONS[idx]
+    if direction > 0 and candidate.kbps > max_kbps:
+        return None
+    return candidate
+
+
+def needs_scaling(frame: VideoFrame, rendition: Optional[Rendition]) -> bool:
+    return (
+        rendition is not None
+        and rendition.width is not None
+        and (frame.width, frame.height) != (rendition.width, rendition.height)
+    )
+
+
+def scale_frame(frame: VideoFrame, rendition: Rendition) -> VideoFrame:
+    """Source frame at the rendition's size (blocking; the hub runs it in its executor)"""
+    out = frame.reformat(width=rendition.width, height=rendition.height, format="yuv420p")
+    out.pts = frame.pts
+    out.time_base = frame.time_base
+    return out
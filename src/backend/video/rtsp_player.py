@@ -1,14 +1,190 @@
 """
 RTSP Player utilities
 """
+import asyncio
 import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+import av
+from aiortc import MediaStreamTrack
 from aiortc.contrib.media import MediaPlayer
-from config import RTSP_URL
+from aiortc.mediastreams import MediaStreamError
+from av import VideoFrame
+
+from config import (
+    RTSP_URL,
+    RESIZE_WIDTH,
+    RESIZE_HEIGHT,
+    DECODER_SCALING,
+    DECODER_PIXEL_FORMAT,
+    DECODER_SCALE_INTERPOLATION,
+    RECORDING_MODE,
+    EVENT_CLIPS_ENABLED
+)
 
 logger = logging.getLogger("carter-backend")
 
 
-def make_rtsp_player(transport: str) -> MediaPlayer:
+class ScaledVideoTrack(MediaStreamTrack):
+    """
+    Delivers decoded frames already at the output size and pixel format
+
+    One swscale pass (yuv -> bgr24 at the target size) replaces the
+    full-resolution BGR conversion and cv2.resize done per frame downstream.
+    Runs off the event loop; swscale releases the GIL.
+    """
+
+    kind = "video"
+
+    def __init__(self, source: MediaStreamTrack, size: Tuple[int, int], pix_fmt: str, interpolation: str):
+        super().__init__()
+        self.source = source
+        self.size = size
+        self.pix_fmt = pix_fmt
+        self.interpolation = interpolation
+
+    def _reformat(self, frame: VideoFrame) -> VideoFrame:
+        out = frame.reformat(
+            width=self.size[0],
+            height=self.size[1],
+            format=self.pix_fmt,
+            interpolation=self.interpolation
+        )
+        out.pts = frame.pts
+        out.time_base = frame.time_base
+        return out
+
+    async def recv(self) -> VideoFrame:
+        frame = await self.source.recv()
+        if (frame.width, frame.height) == self.size and frame.format.name == self.pix_fmt:
+            return frame
+        return await asyncio.to_thread(self._reformat, frame)
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+
+class DemuxVideoTrack(MediaStreamTrack):
+    """Decoded frames from a DemuxPlayer; only the newest few are kept"""
+
+    kind = "video"
+
+    def __init__(self, player: "DemuxPlayer", maxsize: int = 2):
+        super().__init__()
+        self.player = player
+        self.maxsize = maxsize
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def _offer(self, frame: Optional[VideoFrame]):
+        # Runs on the event loop; a consumer that falls behind skips to the newest frame
+        while frame is not None and self._queue.qsize() >= self.maxsize:
+            self._queue.get_nowait()
+        self._queue.put_nowait(frame)
+
+    async def recv(self) -> VideoFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+        self.player._start(asyncio.get_running_loop())
+        frame = await self._queue.get()
+        if frame is None:
+            self.stop()
+            raise MediaStreamError
+        return frame
+
+    def stop(self):
+        super().stop()
+        self.player._stop()
+
+
+class DemuxPlayer:
+    """
+    RTSP player that demuxes and decodes in its own thread
+
+    Unlike aiortc's MediaPlayer it exposes the compressed packets: packet taps
+    are called (on the demux thread) with every video packet before it is
+    decoded, so a recorder can store the camera's own bitstream.
+    """
+
+    def __init__(self, url: str, options: dict):
+        self.container = av.open(url, format="rtsp", options=options)
+        self.stream = self.container.streams.video[0]
+        self.video = DemuxVideoTrack(self)
+        self.audio = None
+        self._taps: List[Callable[[av.Packet], None]] = []
+        self._taps_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._quit = threading.Event()
+
+    def add_packet_tap(self, tap: Callable[[av.Packet], None]):
+        with self._taps_lock:
+            self._taps.append(tap)
+
+    def remove_packet_tap(self, tap: Callable[[av.Packet], None]):
+        with self._taps_lock:
+            if tap in self._taps:
+                self._taps.remove(tap)
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._worker, args=(loop,), name="rtsp-demux", daemon=True
+            )
+            self._thread.start()
+
+    def _stop(self):
+        # The demux thread notices within rw_timeout and closes the container itself
+        self._quit.set()
+        if self._thread is None:
+            self.container.close()
+
+    def _worker(self, loop: asyncio.AbstractEventLoop):
+        try:
+            for packet in self.container.demux(self.stream):
+                if self._quit.is_set():
+                    break
+                if packet.size == 0:
+                    continue
+                with self._taps_lock:
+                    taps = list(self._taps)
+                for tap in taps:
+                    try:
+                        tap(packet)
+                    except Exception as e:
+                        logger.warning(f"Packet tap error: {e}")
+                for frame in packet.decode():
+                    loop.call_soon_threadsafe(self.video._offer, frame)
+        except Exception as e:
+            if not self._quit.is_set():
+                logger.warning(f"RTSP demux ended: {e}")
+        finally:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+            try:
+                loop.call_soon_threadsafe(self.video._offer, None)
+            except RuntimeError:
+                pass  # loop already closed
+
+
+class ScaledPlayer:
+    """MediaPlayer whose video track is scaled at the decoder"""
+
+    def __init__(self, player, video: Optional[ScaledVideoTrack]):
+        self.player = player
+        self.video = video
+        self.audio = player.audio
+
+
+def packet_source(player) -> Optional[DemuxPlayer]:
+    """The DemuxPlayer behind a player (possibly wrapped), if any"""
+    if isinstance(player, ScaledPlayer):
+        player = player.player
+    return player if isinstance(player, DemuxPlayer) else None
+
+
+def make_rtsp_player(transport: str):
     opts = {
         "rtsp_transport": transport,
         "fflags": "nobuffer",
@@ -22,4 +198,23 @@ def make_rtsp_player(transport: str) -> MediaPlayer:
         "fflags+": "flush_packets",
     }
     logger.info(f"Opening RTSP: {RTSP_URL} (transport={transport})")
-    return MediaPlayer(RTSP_URL, format="rtsp", options=opts)
+    if RECORDING_MODE == "passthrough" or EVENT_CLIPS_ENABLED:
+        # Pass-through recording and event clips need the compressed packets
+        player = DemuxPlayer(RTSP_URL, opts)
+    else:
+        player = MediaPlayer(RTSP_URL, format="rtsp", options=opts)
+
+    if not (DECODER_SCALING and RESIZE_WIDTH and RESIZE_HEIGHT) or player.video is None:
+        return player
+
+    logger.info(
+        f"Decoder scaling to {RESIZE_WIDTH}x{RESIZE_HEIGHT} {DECODER_PIXEL_FORMAT} "
+        f"({DECODER_SCALE_INTERPOLATION})"
+    )
+    video = ScaledVideoTrack(
+        player.video,
+        (RESIZE_WIDTH, RESIZE_HEIGHT),
+        DECODER_PIXEL_FORMAT,
+        DECODER_SCALE_INTERPOLATION
+    )
+    return ScaledPlayer(player, video)
@@ -0,0 +1,253 @@
+"""
+Encode once, relay to every peer
+
+One libx264 encoder per (source, rendition) turns the hub's annotated frames
+into H.264 packets, scaled to the rendition size in the same swscale pass as
+the yuv420p conversion. Each peer track subscribes and gets the packets through
+its own bounded queue; aiortc packetizes av.Packet objects without
+re-encoding. New subscribers start at the next keyframe (and ask for one);
+a subscriber that falls a full queue behind is cut back to the next
+keyframe rather than stalling the others.
+"""
+import time
+import asyncio
+import logging
+import av
+from av.video.frame import PictureType
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import (
+    TARGET_FPS,
+    SHARED_ENCODER_PRESET,
+    SHARED_ENCODER_GOP_SEC,
+    SHARED_ENCODER_QUEUE,
+    SHARED_ENCODER_KEYFRAME_MIN_SEC
+)
+from monitoring.metrics import STAGE_SECONDS
+from video.source_hub import SourceHub, SharedFrame
+from video.renditions import Rendition
+
+logger = logging.getLogger("carter-backend")
+
+TIME_BASE = Fraction(1, 90000)
+
+
+class EncodedSubscription:
+
+    def __init__(self, encoder: "SharedEncoder", maxsize: int):
+        self.encoder = encoder
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.waiting_keyframe = True
+        self.dropped = 0
+        self.resyncs = 0
+
+    async def get(self) -> Optional[Tuple[av.Packet, SharedFrame]]:
+        """Next (packet, source frame); None once the encoder has stopped"""
+        return await self.queue.get()
+
+    def _offer(self, item) -> bool:
+        packet = item[0]
+        if self.waiting_keyframe:
+            if not packet.is_keyframe:
+                self.dropped += 1
+                return True
+            self.waiting_keyframe = False
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog and resync on a keyframe
+            self.dropped += self.queue.qsize() + 1
+            self.resyncs += 1
+            self._clear()
+            self.waiting_keyframe = True
+            return False
+
+    def _clear(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def _close(self):
+        self._clear()
+        self.queue.put_nowait(None)
+
+
+class SharedEncoder:
+
+    def __init__(self, hub: SourceHub, rendition: Rendition, fps: int = TARGET_FPS):
+        self.hub = hub
+        self.rendition = rendition
+        self.bitrate_kbps = rendition.kbps
+        self.fps = max(1, fps)
+        self.key = (hub.transport, rendition)
+        self.subscribers: Set[EncodedSubscription] = set()
+        self.closed = False
+
+        self.codec: Optional[av.CodecContext] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shared-encoder")
+        self._task: Optional[asyncio.Task] = None
+        self._last_pts = -1
+        self._keyframe_requested = True
+        self._last_keyframe_request = 0.0
+        self._last_keyframe = 0.0
+        self._hist = STAGE_SECONDS.labels(source=hub.transport, stage=f"encode_{rendition.name}")
+
+        # Stats
+        self.frames = 0
+        self.keyframes = 0
+        self.keyframe_requests = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Shared encoder started ({self.hub.transport}, {self.rendition.name}, {self.bitrate_kbps} kbps)")
+
+    def subscribe(self) -> EncodedSubscription:
+        sub = EncodedSubscription(self, SHARED_ENCODER_QUEUE)
+        self.subscribers.add(sub)
+        # Late joiner: ask for an IDR right away (not rate limited)
+        self._keyframe_requested = True
+        self.keyframe_requests += 1
+        return sub
+
+    def unsubscribe(self, sub: EncodedSubscription):
+        self.subscribers.discard(sub)
+        # Wakes a recv still waiting on this subscription
+        sub._close()
+        if not self.subscribers:
+            self.close()
+
+    def request_keyframe(self):
+        now = time.monotonic()
+        if now - self._last_keyframe_request < SHARED_ENCODER_KEYFRAME_MIN_SEC:
+            return
+        self._last_keyframe_request = now
+        self._keyframe_requested = True
+        self.keyframe_requests += 1
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if _encoders.get(self.key) is self:
+            _encoders.pop(self.key, None)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for sub in list(self.subscribers):
+            sub._close()
+        self.subscribers.clear()
+        self._executor.shutdown(wait=False)
+        logger.info(f"Shared encoder stopped ({self.hub.transport}, {self.rendition.name}, {self.bitrate_kbps} kbps)")
+
+    def _open(self, width: int, height: int):
+        codec = av.CodecContext.create("libx264", "w")
+        codec.width = width
+        codec.height = height
+        codec.pix_fmt = "yuv420p"
+        codec.time_base = TIME_BASE
+        codec.framerate = Fraction(self.fps, 1)
+        codec.bit_rate = self.bitrate_kbps * 1000
+        codec.gop_size = max(1, int(self.fps * SHARED_ENCODER_GOP_SEC))
+        # Constrained baseline 3.1 (profile-level-id 42e01f) decodes on every WebRTC client
+        codec.profile = "baseline"
+        codec.options = {
+            "preset": SHARED_ENCODER_PRESET,
+            "tune": "zerolatency",
+            "level": "31",
+            "forced-idr": "1",
+        }
+        codec.open()
+        self.codec = codec
+
+    def _encode(self, frame: av.VideoFrame, force_keyframe: bool) -> List[av.Packet]:
+        width = self.rendition.width or frame.width
+        height = self.rendition.height or frame.height
+        if self.codec is None or (self.codec.width, self.codec.height) != (width, height):
+            self._open(width, height)
+            force_keyframe = True
+
+        yuv = frame.reformat(width=width, height=height, format="yuv420p")
+        pts = int(frame.pts * frame.time_base / TIME_BASE) if frame.pts is not None and frame.time_base else 0
+        # x264 rejects non-increasing timestamps
+        pts = max(pts, self._last_pts + 1)
+        self._last_pts = pts
+        yuv.pts = pts
+        yuv.time_base = TIME_BASE
+        if force_keyframe:
+            yuv.pict_type = PictureType.I
+
+        packets = self.codec.encode(yuv)
+        for packet in packets:
+            packet.time_base = TIME_BASE
+        return packets
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_seq = 0
+        try:
+            while True:
+                shared = await self.hub.next_frame(last_seq)
+                if shared is None:
+                    break
+                last_seq = shared.seq
+
+                # Keyframe interval kept in wall-clock time too: gop_size counts
+                # frames at self.fps, and a slower source (or a peer whose
+                # keyframe request never reaches us) would wait longer
+                now = time.monotonic()
+                force = self._keyframe_requested or now - self._last_keyframe >= SHARED_ENCODER_GOP_SEC
+                self._keyframe_requested = False
+                t0 = time.perf_counter()
+                packets = await loop.run_in_executor(self._executor, self._encode, shared.frame, force)
+                self._hist.observe(time.perf_counter() - t0)
+                self.frames += 1
+
+                for packet in packets:
+                    if packet.is_keyframe:
+                        self.keyframes += 1
+                        self._last_keyframe = now
+                    for sub in list(self.subscribers):
+                        if not sub._offer((packet, shared)):
+                            self.request_keyframe()
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.exception(f"Shared encoder error: {e}")
+        self._task = None
+        self.close()
+
+    def state(self) -> dict:
+        return {
+            "source": self.hub.transport,
+            "rendition": self.rendition.name,
+            "bitrate_kbps": self.bitrate_kbps,
+            "subscribers": len(self.subscribers),
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "keyframe_requests": self.keyframe_requests,
+            "dropped": sum(s.dropped for s in self.subscribers),
+        }
+
+
+# Active encoders, one per (transport, rendition)
+_encoders: Dict[Tuple[str, Rendition], SharedEncoder] = {}
+
+
+def acquire_shared_encoder(hub: SourceHub, rendition: Rendition) -> SharedEncoder:
+    encoder = _encoders.get((hub.transport, rendition))
+    if encoder is None or encoder.closed or encoder.hub is not hub:
+        encoder = SharedEncoder(hub, rendition)
+        encoder.start()
+        _encoders[encoder.key] = encoder
+    return encoder
+
+
+def get_shared_encoders() -> Dict[str, dict]:
+    return {f"{t}/{r.name}@{r.kbps}": enc.state() for (t, r), enc in _encoders.items()}
+
+
+def close_all_encoders():
+    for encoder in list(_encoders.values()):
+        encoder.close()
@@ -0,0 +1,404 @@
+"""
+Shared RTSP source hub
+
+One hub per RTSP transport opens the camera once, decodes each frame once,
+feeds the detection pipeline and fans the same annotated frame out to every
+subscribed RtspDetectionTrack. Subscribers only ever see the newest frame, so a slow
+viewer skips frames instead of queueing them.
+"""
+import cv2
+import time
+import asyncio
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Set, Callable, NamedTuple, Tuple
+from av import VideoFrame
+
+from config import (
+    RESIZE_WIDTH,
+    RESIZE_HEIGHT,
+    YOLO_CONF_THRESHOLD,
+    YOLO_IOU_THRESHOLD,
+    YOLO_MAX_DETECTIONS,
+    SAVE_DETECTIONS_ENABLED,
+    SAVE_INTERVAL_SECONDS,
+    MIN_DETECTIONS_TO_SAVE,
+    MODEL_INPUT_LETTERBOX,
+    OVERLAY_MODE
+)
+from models.yolo_detector import get_device_info
+from models.detection_batch import DetectionBatch
+from models.preprocess import Preprocessor
+from database.detection_writer import detection_writer
+from monitoring.metrics import STAGE_SECONDS, FRAMES_TOTAL, registry, GaugeFunction
+from video.rtsp_player import make_rtsp_player, packet_source, DemuxPlayer
+from video.detection_pipeline import DetectionPipeline, DetectionResult
+from video.frame_pool import FramePool, writable_view
+from video.overlay import OverlayRenderer
+from video.renditions import RENDITIONS, Rendition, needs_scaling, scale_frame
+
+logger = logging.getLogger("carter-backend")
+
+
+class SharedFrame(NamedTuple):
+    seq: int
+    frame: VideoFrame
+    image: np.ndarray
+    detections: DetectionBatch
+
+
+class SourceHub:
+
+    def __init__(self, transport: str, player_factory: Callable[[str], object] = make_rtsp_player):
+        self.transport = transport
+        self.player_factory = player_factory
+        self.player = None
+        self.subscribers: Set[object] = set()
+
+        self.latest: Optional[SharedFrame] = None
+        self.seq = 0
+        self.closed = False
+        self._cond = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+        self.frame_number = 0
+        self.size = (RESIZE_WIDTH, RESIZE_HEIGHT) if (RESIZE_WIDTH and RESIZE_HEIGHT) else None
+        # Model inputs (letterboxed canvases or plain copies), recycled once
+        # inference is done with them
+        self.pool = FramePool()
+        self.preprocessor = Preprocessor(self.pool) if MODEL_INPUT_LETTERBOX else None
+        self.pipeline = DetectionPipeline(
+            YOLO_CONF_THRESHOLD,
+            YOLO_IOU_THRESHOLD,
+            YOLO_MAX_DETECTIONS,
+            on_result=self._on_detections,
+            release=self.preprocessor.release if self.preprocessor else self.pool.release
+        )
+        self.overlay = OverlayRenderer(OVERLAY_MODE)
+        # Age of the frame the drawn detections came from, at overlay time
+        self.pipeline_lag_ms = 0.0
+
+        # Renditions of viewers on per-peer encoders: each is scaled once per
+        # frame in this executor as the frame is published, not in their recv
+        self._renditions: Dict[object, Rendition] = {}
+        self._scaled: Dict[Rendition, Tuple[int, asyncio.Future]] = {}
+        self._scaler = ThreadPoolExecutor(max_workers=max(1, len(RENDITIONS)), thread_name_prefix="rendition-scale")
+
+        # Database saving
+        self.last_save_time = 0.0
+
+        # Performance counters (per source, independent of viewer count)
+        self.frame_count = 0
+        self.last_fps_time = time.time()
+        self.fps = 0.0
+
+        # Called with per-stage timings (ms) of every processed frame
+        self.stage_listener: Optional[Callable[[Dict[str, float]], None]] = None
+        # Called with every inference result and the source pts of its frame
+        self.detection_listeners: Set[Callable[[DetectionResult, Optional[int]], None]] = set()
+        self._submitted_pts: Dict[int, Optional[int]] = {}
+        self._stage_hist = {
+            stage: STAGE_SECONDS.labels(source=transport, stage=stage)
+            for stage in ("recv", "convert", "resize", "submit", "inference", "overlay", "to_frame", "process")
+        }
+
+    def start(self):
+        self.player = self.player_factory(self.transport)
+        if not self.player.video:
+            raise RuntimeError("RTSP player has no video track")
+        self.pipeline.start()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Source hub started (transport={self.transport})")
+
+    def packet_source(self) -> Optional[DemuxPlayer]:
+        """Player exposing compressed packets (pass-through recording), if any"""
+        return packet_source(self.player)
+
+    def subscribe(self, track):
+        self.subscribers.add(track)
+        logger.info(f"Source hub {self.transport}: {len(self.subscribers)} subscriber(s)")
+
+    def unsubscribe(self, track):
+        if track not in self.subscribers:
+            return
+        self.subscribers.discard(track)
+        self._renditions.pop(track, None)
+        logger.info(f"Source hub {self.transport}: {len(self.subscribers)} subscriber(s)")
+        if not self.subscribers:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if _hubs.get(self.transport) is self:
+            _hubs.pop(self.transport, None)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        STAGE_SECONDS.remove(source=self.transport)
+        FRAMES_TOTAL.remove(source=self.transport)
+        self.pipeline.stop()
+        self.pool.clear()
+        self._scaled.clear()
+        self._scaler.shutdown(wait=False)
+        if self.player is not None and self.player.video is not None:
+            try:
+                self.player.video.stop()
+            except Exception:
+                pass
+        asyncio.ensure_future(self._notify())
+        logger.info(f"Source hub stopped (transport={self.transport})")
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def next_frame(self, last_seq: int) -> Optional[SharedFrame]:
+        """Wait for a frame newer than last_seq; None once the source has ended"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.closed or self.seq > last_seq)
+            if self.closed:
+                return None
+            return self.latest
+
+    def set_rendition(self, track, rendition: Optional[Rendition]):
+        """Rendition a subscriber's per-peer encoder takes (None = source size)"""
+        if rendition is None or track not in self.subscribers:
+            self._renditions.pop(track, None)
+        else:
+            self._renditions[track] = rendition
+
+    def _scale(self, shared: SharedFrame, rendition: Rendition) -> asyncio.Future:
+        future = asyncio.get_running_loop().run_in_executor(self._scaler, scale_frame, shared.frame, rendition)
+        self._scaled[rendition] = (shared.seq, future)
+        return future
+
+    def _scale_renditions(self, shared: SharedFrame):
+        """Start scaling the new frame to every rendition in use, once each"""
+        for rendition in set(self._renditions.values()):
+            if needs_scaling(shared.frame, rendition):
+                self._scale(shared, rendition)
+        for rendition in [r for r in self._scaled if r not in self._renditions.values()]:
+            del self._scaled[rendition]
+
+    async def rendition_frame(self, shared: SharedFrame, rendition: Optional[Rendition]) -> VideoFrame:
+        """The shared frame at the rendition's size, scaled off the event loop"""
+        if not needs_scaling(shared.frame, rendition):
+            return shared.frame
+        scaled = self._scaled.get(rendition)
+        if scaled is not None and scaled[0] == shared.seq:
+            future = scaled[1]
+        else:
+            # The peer moved to this rendition after the frame was published
+            future = self._scale(shared, rendition)
+        # Other peers share the future: a cancelled recv must not cancel it
+        return await asyncio.shield(future)
+
+    async def _run(self):
+        try:
+            recv_hist = self._stage_hist["recv"]
+            while True:
+                t0 = time.perf_counter()
+                frame: VideoFrame = await self.player.video.recv()
+                recv_hist.observe(time.perf_counter() - t0)
+                shared = self._process(frame, time.monotonic())
+                async with self._cond:
+                    self.latest = shared
+                    self.seq = shared.seq
+                    self._scale_renditions(shared)
+                    self._cond.notify_all()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Source hub {self.transport} ended: {e}")
+            self._task = None
+            self.close()
+
+    def _on_detections(self, result: DetectionResult):
+        dets = result.detections
+        self._stage_hist["inference"].observe(result.inference_ms / 1000.0)
+
+        pts = self._submitted_pts.pop(result.frame_number, None)
+        for frame_number in [n for n in self._submitted_pts if n < result.frame_number]:
+            del self._submitted_pts[frame_number]
+        for listener in list(self.detection_listeners):
+            try:
+                listener(result, pts)
+            except Exception as e:
+                logger.warning(f"Detection listener error: {e}")
+
+        # Queue for the batched database writer (never blocks)
+        now = time.time()
+        if (SAVE_DETECTIONS_ENABLED and
+            len(dets) >= MIN_DETECTIONS_TO_SAVE and
+            now - self.last_save_time >= SAVE_INTERVAL_SECONDS):
+            detection_writer.enqueue(dets, result.frame_number)
+            self.last_save_time = now
+
+    def _process(self, frame: VideoFrame, received_at: float) -> SharedFrame:
+        # The outgoing frame is allocated per frame and never written after it
+        # is published, so subscribers and the recorder can share its pixels
+        t0 = time.perf_counter()
+        out: Optional[VideoFrame]
+        if self.size and (frame.width, frame.height) != self.size:
+            src = frame.to_ndarray(format="bgr24")
+            t1 = time.perf_counter()
+            out = VideoFrame(self.size[0], self.size[1], "bgr24")
+            img = writable_view(out)
+            if img is not None:
+                cv2.resize(src, self.size, dst=img, interpolation=cv2.INTER_LINEAR)
+            else:
+                out = None
+                img = cv2.resize(src, self.size, interpolation=cv2.INTER_LINEAR)
+        else:
+            # Already at output size: convert only (no-op if the decoder gave bgr24)
+            out = frame.reformat(format="bgr24")
+            img = writable_view(out)
+            if img is None:
+                img = out.to_ndarray()
+                out = None
+            t1 = time.perf_counter()
+        t2 = time.perf_counter()
+
+        # Hand the newest frame to the detection stage only when it is idle;
+        # the letterboxed (or plain pooled) copy keeps the overlay below from
+        # drawing into the model input
+        if self.pipeline.wants_frame():
+            if self.preprocessor is not None:
+                model_input = self.preprocessor.letterbox(img, self.pipeline.controller.imgsz)
+            else:
+                model_input = self.pool.copy_of(img)
+            self.pipeline.submit(model_input, self.frame_number, received_at)
+            if self.detection_listeners:
+                self._submitted_pts[self.frame_number] = frame.pts
+        self.frame_number += 1
+        t3 = time.perf_counter()
+
+        result = self.pipeline.result
+        dets = result.detections
+        if result.frame_number >= 0:
+            self.pipeline_lag_ms = (time.monotonic() - result.frame_time) * 1000.0
+
+        # Draw overlay (no-op in metadata mode)
+        self.overlay.draw_detections(img, dets)
+
+        # Performance text
+        self.frame_count += 1
+        now = time.time()
+        if now - self.last_fps_time >= 1.0:
+            self.fps = self.frame_count / (now - self.last_fps_time)
+            self.frame_count = 0
+            self.last_fps_time = now
+
+        self.overlay.draw_hud(img, (
+            f"FPS: {self.fps:.1f}",
+            f"Inference: {self.pipeline.infer_fps:.1f}",
+            f"Device: {get_device_info()}",
+        ))
+
+        t4 = time.perf_counter()
+
+        if out is None:
+            out = VideoFrame.from_ndarray(img, format="bgr24")
+        out.pts = frame.pts
+        out.time_base = frame.time_base
+        t5 = time.perf_counter()
+
+        self.pipeline.controller.observe_frame((time.monotonic() - received_at) * 1000.0)
+        hist = self._stage_hist
+        hist["convert"].observe(t1 - t0)
+        hist["resize"].observe(t2 - t1)
+        hist["submit"].observe(t3 - t2)
+        hist["overlay"].observe(t4 - t3)
+        hist["to_frame"].observe(t5 - t4)
+        hist["process"].observe(t5 - t0)
+        FRAMES_TOTAL.inc(source=self.transport)
+        if self.stage_listener is not None:
+            self.stage_listener({
+                "convert": (t1 - t0) * 1000.0,
+                "resize": (t2 - t1) * 1000.0,
+                "submit": (t3 - t2) * 1000.0,
+                "overlay": (t4 - t3) * 1000.0,
+                "to_frame": (t5 - t4) * 1000.0,
+                "process": (t5 - t0) * 1000.0,
+            })
+        return SharedFrame(self.seq + 1, out, img, dets)
+
+
+# Active hubs, one per RTSP transport
+_hubs: Dict[str, SourceHub] = {}
+
+
+def acquire_source_hub(transport: str) -> SourceHub:
+    """Get the running hub for a transport, opening the RTSP source if needed"""
+    hub = _hubs.get(transport)
+    if hub is None or hub.closed:
+        hub = SourceHub(transport)
+        hub.start()
+        _hubs[transport] = hub
+    return hub
+
+
+def get_source_hubs() -> Dict[str, SourceHub]:
+    return _hubs
+
+
+def close_all_hubs():
+    for hub in list(_hubs.values()):
+        hub.close()
+
+
+def get_source_stats() -> Dict[str, dict]:
+    """Per-source rates; every subscribed client shares these"""
+    return {
+        t: {
+            "fps": round(hub.fps, 2),
+            "inference_fps": round(hub.pipeline.infer_fps, 2),
+            "pipeline_lag_ms": round(hub.pipeline_lag_ms, 1),
+            "frames": hub.frame_number,
+            "subscribers": len(hub.subscribers),
+            "frame_pool": hub.pool.state(),
+            "overlay": hub.overlay.state(),
+        }
+        for t, hub in _hubs.items()
+    }
+
+
+def get_fps() -> float:
+    """Get current FPS"""
+    return max((hub.fps for hub in _hubs.values()), default=0.0)
+
+
+def get_inference_fps() -> float:
+    """Get current inference FPS"""
+    return max((hub.pipeline.infer_fps for hub in _hubs.values()), default=0.0)
+
+
+def get_inference_control() -> Dict[str, dict]:
+    """Get the adaptive inference rate decision per source"""
+    return {t: hub.pipeline.controller.state() for t, hub in _hubs.items()}
+
+
+def get_pipeline_lag_ms() -> float:
+    """Get frame age (ms) of the detections being overlaid"""
+    return max((hub.pipeline_lag_ms for hub in _hubs.values()), default=0.0)
+
+
+registry.register(GaugeFunction(
+    "carter_source_fps", "Frames per second processed per source", ("source",),
+    lambda: [((t,), hub.fps) for t, hub in _hubs.items()]
+))
+registry.register(GaugeFunction(
+    "carter_inference_fps", "Inference results per second per source", ("source",),
+    lambda: [((t,), hub.pipeline.infer_fps) for t, hub in _hubs.items()]
+))
+registry.register(GaugeFunction(
+    "carter_pipeline_lag_seconds", "Age of the detections being overlaid", ("source",),
+    lambda: [((t,), hub.pipeline_lag_ms / 1000.0) for t, hub in _hubs.items()]
+))
+registry.register(GaugeFunction(
+    "carter_source_subscribers", "Client tracks subscribed per source", ("source",),
+    lambda: [((t,), len(hub.subscribers)) for t, hub in _hubs.items()]
+))
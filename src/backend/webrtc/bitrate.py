@@ -109,11 +109,13 @@ async def periodic_reapply_bitrate(
     sender,
     bps: int,
     fps: int,
-    peer_connections: dict
+    peer_connections: dict,
+    get_bps: Optional[Callable[[], int]] = None
 ):
+    # get_bps lets the cap follow the peer's current rendition
     try:
         while client_id in peer_connections:
-            await set_sender_bitrate(sender, bps, fps)
+            await set_sender_bitrate(sender, get_bps() if get_bps else bps, fps)
             await asyncio.sleep(BITRATE_REAPPLY_SEC)
     except asyncio.CancelledError:
         pass
@@ -0,0 +1,91 @@
+"""
+Detections over a WebRTC data channel
+
+Both peers create the channel out-of-band (negotiated=True, id=0), unordered
+and without retransmits: a late detection message is worthless, the next
+frame brings a fresh one. Messages are JSON:
+
+    {"t": "hello", "mode": "burn"|"metadata", "names": [...]}    once, on open
+    {"t": "det", "seq": 12, "pts": 3000, "ts": 1700000000000,
+     "w": 1280, "h": 720, "lag": 41.5,
+     "b": [x1, y1, x2, y2, ...], "c": [cls, ...], "s": [conf, ...]}
+
+"det" is sent for every frame handed to the client's encoder, so the browser
+can draw boxes in step with the video. The payload is built once per source
+frame and shared by every client.
+"""
+import json
+import time
+import logging
+from typing import Dict, Tuple
+
+from config import OVERLAY_MODE, DETECTION_CHANNEL_MAX_BUFFERED
+from models.yolo_detector import get_class_names
+
+logger = logging.getLogger("carter-backend")
+
+CHANNEL_LABEL = "detections"
+CHANNEL_ID = 0
+
+# transport -> (seq, payload) of the newest frame
+_payloads: Dict[str, Tuple[int, str]] = {}
+
+
+def offer_has_data_channel(sdp: str) -> bool:
+    return "m=application" in sdp
+
+
+def build_payload(hub, shared) -> str:
+    cached = _payloads.get(hub.transport)
+    if cached is not None and cached[0] == shared.seq:
+        return cached[1]
+
+    dets = shared.detections
+    h, w = shared.image.shape[:2]
+    payload = json.dumps({
+        "t": "det",
+        "seq": shared.seq,
+        "pts": shared.frame.pts,
+        "ts": int(time.time() * 1000),
+        "w": w,
+        "h": h,
+        "lag": round(hub.pipeline_lag_ms, 1),
+        "b": dets.boxes.ravel().tolist(),
+        "c": dets.classes.tolist(),
+        "s": [round(v, 2) for v in dets.scores.tolist()],
+    }, separators=(",", ":"))
+    _payloads[hub.transport] = (shared.seq, payload)
+    return payload
+
+
+class DetectionChannel:
+
+    def __init__(self, channel, client_id: str):
+        self.channel = channel
+        self.client_id = client_id
+
+        # Stats
+        self.sent = 0
+        self.skipped = 0
+
+        @channel.on("open")
+        def _on_open():
+            channel.send(json.dumps({"t": "hello", "mode": OVERLAY_MODE, "names": get_class_names()}))
+            logger.info(f"Detection channel open for {client_id}")
+
+    def send(self, hub, shared):
+        if self.channel.readyState != "open":
+            return
+        # Slow receiver: drop rather than build up latency
+        if self.channel.bufferedAmount > DETECTION_CHANNEL_MAX_BUFFERED:
+            self.skipped += 1
+            return
+        try:
+            self.channel.send(build_payload(hub, shared))
+            self.sent += 1
+        except Exception as e:
+            self.skipped += 1
+            logger.debug(f"Detection channel send failed for {self.client_id}: {e}")
+
+    def state(self) -> dict:
+        return {"state": self.channel.readyState, "sent": self.sent, "skipped": self.skipped}
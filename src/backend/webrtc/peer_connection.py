@@ -1,18 +1,26 @@
 import asyncio
 import logging
 from typing import Dict
-from aiortc import RTCPeerConnection, RTCSessionDescription
+from aiortc import RTCPeerConnection, RTCSessionDescription, RTCRtpSender
 
 from config import (
     RTSP_TRANSPORT,
     MAX_BITRATE_KBPS_DEFAULT,
     TARGET_FPS,
     PREFER_CODEC,
-    DISABLE_TWCC_REM
+    DISABLE_TWCC_REM,
+    DETECTION_CHANNEL_ENABLED,
+    SHARED_ENCODER_ENABLED,
+    SHARED_ENCODER_BITRATE_KBPS
 )
-from video.rtsp_player import make_rtsp_player
+from video.source_hub import acquire_source_hub, close_all_hubs
 from video.detection_track import RtspDetectionTrack
+from video.shared_encoder import acquire_shared_encoder, close_all_encoders
+from video.renditions import pick_rendition, native_rendition
+from video.recording import is_recording, stop_recording
 from webrtc.bitrate import set_sender_bitrate, periodic_reapply_bitrate, tune_answer_sdp
+from webrtc.rendition_control import adapt_rendition
+from webrtc.detection_channel import DetectionChannel, offer_has_data_channel, CHANNEL_LABEL, CHANNEL_ID
 
 logger = logging.getLogger("carter-backend")
 
@@ -20,6 +28,7 @@ logger = logging.getLogger("carter-backend")
 peer_connections: Dict[str, RTCPeerConnection] = {}
 detection_tracks: Dict[str, RtspDetectionTrack] = {}
 bitrate_tasks: Dict[str, asyncio.Task] = {}
+rendition_tasks: Dict[str, asyncio.Task] = {}
 
 
 async def handle_offer(websocket, client_id: str, message: dict):
@@ -40,17 +49,39 @@ async def handle_offer(websocket, client_id: str, message: dict):
     pc = RTCPeerConnection()
     peer_connections[client_id] = pc
 
-    # Create RTSP source
-    player = make_rtsp_player(transport)
-    if not player.video:
-        raise RuntimeError("RTSP player has no video track")
+    # Subscribe to the shared RTSP source (opened on first viewer)
+    hub = acquire_source_hub(transport)
+
+    # Start on the best rendition within the client's bitrate (None = no ladder)
+    rendition = pick_rendition(max_kbps)
+
+    # H.264 peers share one encoder per source; VP8-only peers encode their own
+    encoder = None
+    if SHARED_ENCODER_ENABLED and "H264/90000" in offer_sdp:
+        encoder = acquire_shared_encoder(hub, rendition or native_rendition(SHARED_ENCODER_BITRATE_KBPS))
 
     # Create detection track
-    det_track = RtspDetectionTrack(player.video)
+    det_track = RtspDetectionTrack(hub, client_id, encoder=encoder, rendition=rendition)
     detection_tracks[client_id] = det_track
 
     sender = pc.addTrack(det_track)
 
+    if encoder is not None:
+        # Pre-encoded packets only make sense as H.264
+        capabilities = RTCRtpSender.getCapabilities("video")
+        preferences = [c for c in capabilities.codecs if c.mimeType in ("video/H264", "video/rtx")]
+        for transceiver in pc.getTransceivers():
+            if transceiver.sender is sender:
+                transceiver.setCodecPreferences(preferences)
+        det_track.sender = sender
+
+    # Detections alongside the video; the browser creates the same channel
+    if DETECTION_CHANNEL_ENABLED and offer_has_data_channel(offer_sdp):
+        channel = pc.createDataChannel(
+            CHANNEL_LABEL, negotiated=True, id=CHANNEL_ID, ordered=False, maxRetransmits=0
+        )
+        det_track.detection_channel = DetectionChannel(channel, client_id)
+
     @pc.on("connectionstatechange")
     async def _on_state():
         logger.info(f"{client_id} state: {pc.connectionState}")
@@ -60,8 +91,9 @@ async def handle_offer(websocket, client_id: str, message: dict):
     # Set remote description
     await pc.setRemoteDescription(RTCSessionDescription(sdp=offer_sdp, type="offer"))
 
-    # Set bitrate
-    sdp_munger = await set_sender_bitrate(sender, max_kbps * 1000, fps)
+    # Set bitrate (per-peer encoders are capped at their rendition's bitrate)
+    send_kbps = rendition.kbps if rendition is not None else max_kbps
+    sdp_munger = await set_sender_bitrate(sender, send_kbps * 1000, fps)
 
     # Create answer
     answer = await pc.createAnswer()
@@ -77,29 +109,43 @@ async def handle_offer(websocket, client_id: str, message: dict):
 
     # Start periodic bitrate reapply
     task = asyncio.create_task(
-        periodic_reapply_bitrate(client_id, sender, max_kbps * 1000, fps, peer_connections)
+        periodic_reapply_bitrate(
+            client_id, sender, send_kbps * 1000, fps, peer_connections,
+            get_bps=(lambda: det_track.rendition.kbps * 1000) if rendition is not None else None
+        )
     )
     bitrate_tasks[client_id] = task
 
+    # Move the peer along the rendition ladder as its link changes
+    if rendition is not None:
+        rendition_tasks[client_id] = asyncio.create_task(
+            adapt_rendition(client_id, det_track, sender, max_kbps, fps, peer_connections)
+        )
+
     # Send answer back to client
     import json
     await websocket.send_text(json.dumps({"type": "answer", "sdp": pc.localDescription.sdp}))
     logger.info(
         f"Answer -> {client_id} | codec={pref_codec}, {max_kbps}kbps, fps={fps}, rtsp={transport}, "
-        f"twcc_remb_disabled={DISABLE_TWCC_REM}"
+        f"twcc_remb_disabled={DISABLE_TWCC_REM}, "
+        f"rendition={rendition.name if rendition else 'source'}, "
+        f"shared_encoder={f'{encoder.bitrate_kbps}kbps' if encoder else 'off'}"
     )
 
 
 async def cleanup_pc(client_id: str):
     # Stop bitrate task
     task = bitrate_tasks.pop(client_id, None)
+    if task:
+        task.cancel()
+    task = rendition_tasks.pop(client_id, None)
     if task:
         task.cancel()
 
-    # Stop detection track recording if active
-    det_track = detection_tracks.pop(client_id, None)
-    if det_track and det_track.recording:
-        det_track.stop_recording()
+    # Stop recording if active; the file is finalized and registered in the background
+    detection_tracks.pop(client_id, None)
+    if is_recording(client_id):
+        await stop_recording(client_id)
 
     # Close peer connection
     pc = peer_connections.pop(client_id, None)
@@ -127,7 +173,12 @@ def get_detection_track(client_id: str) -> Optional[RtspDetectionTrack]:
     return detection_tracks.get(client_id)
 
 
+def get_client_stats() -> Dict[str, dict]:
+    return {cid: track.stats() for cid, track in detection_tracks.items()}
+
+
 async def cleanup_all():
-    pass
     for cid in list(peer_connections.keys()):
         await cleanup_pc(cid)
+    close_all_encoders()
+    close_all_hubs()
@@ -0,0 +1,114 @@
+"""
+Per-peer rendition switching
+
+Every RENDITION_CHECK_SEC the peer's RTCP receiver report (fraction lost,
+round-trip time) and its own backlog are checked: frames it skipped with a
+per-peer encoder, queue overflows (resyncs) of its subscription with a shared
+encoder, whose frame gaps are common to every peer on it. Congestion steps the
+peer one rendition down right away; it steps back up only after
+RENDITION_UP_AFTER_SEC without loss, and never above the bitrate the client
+asked for. Other peers on the same source are unaffected.
+"""
+import time
+import asyncio
+import logging
+from typing import Optional, Tuple
+
+from config import (
+    RENDITION_CHECK_SEC,
+    RENDITION_DOWN_LOSS,
+    RENDITION_DOWN_RTT_SEC,
+    RENDITION_UP_LOSS,
+    RENDITION_UP_AFTER_SEC
+)
+from video.renditions import step
+from webrtc.bitrate import set_sender_bitrate
+
+logger = logging.getLogger("carter-backend")
+
+# Share of source frames a peer may skip per window before it counts as congested
+_MAX_DROP_RATIO = 0.2
+
+
+async def _remote_report(sender) -> Tuple[Optional[float], Optional[float]]:
+    """(fraction lost 0..1, RTT seconds) from the latest receiver report, if any"""
+    loss, rtt = None, None
+    try:
+        report = await sender.getStats()
+    except Exception:
+        return loss, rtt
+    for stats in report.values():
+        if getattr(stats, "type", None) != "remote-inbound-rtp":
+            continue
+        fraction = getattr(stats, "fractionLost", None)
+        if fraction is not None:
+            # RTCP carries it as an 8-bit fixed-point value
+            loss = fraction / 256.0 if isinstance(fraction, int) else float(fraction)
+        rtt = getattr(stats, "roundTripTime", None)
+    return loss, rtt
+
+
+def _backlog(track) -> Tuple[int, int]:
+    """(frames sent, frames this peer alone fell behind by) counters"""
+    if track.encoded is not None:
+        return track.frames_sent, track.encoded.resyncs
+    return track.frames_sent, track.frames_dropped
+
+
+async def adapt_rendition(
+    client_id: str,
+    track,
+    sender,
+    max_kbps: int,
+    fps: int,
+    peer_connections: dict
+):
+    clean_since = time.monotonic()
+    last_sent, last_dropped = _backlog(track)
+    try:
+        while client_id in peer_connections and track.rendition is not None:
+            await asyncio.sleep(RENDITION_CHECK_SEC)
+            now = time.monotonic()
+
+            loss, rtt = await _remote_report(sender)
+            total_sent, total_dropped = _backlog(track)
+            sent, dropped = total_sent - last_sent, total_dropped - last_dropped
+            last_sent, last_dropped = total_sent, total_dropped
+            if track.encoded is not None:
+                # Any overflow of its own queue: the peer cannot keep up
+                falling_behind = dropped > 0
+            else:
+                falling_behind = dropped > _MAX_DROP_RATIO * max(1, sent + dropped)
+
+            target = None
+            if (
+                (loss is not None and loss > RENDITION_DOWN_LOSS)
+                or (rtt is not None and rtt > RENDITION_DOWN_RTT_SEC)
+                or falling_behind
+            ):
+                clean_since = now
+                target = step(track.rendition, -1, max_kbps)
+            elif loss is not None and loss > RENDITION_UP_LOSS:
+                clean_since = now
+            elif now - clean_since >= RENDITION_UP_AFTER_SEC:
+                clean_since = now
+                target = step(track.rendition, +1, max_kbps)
+
+            if target is None:
+                continue
+
+            logger.info(
+                f"{client_id} rendition {track.rendition.name} -> {target.name} "
+                f"(loss={loss}, rtt={rtt}, dropped={dropped}/{sent + dropped})"
+            )
+            track.switch_rendition(target)
+            if track.encoded is None:
+                # Per-peer encoder: follow the rendition's bitrate
+                await set_sender_bitrate(sender, target.kbps * 1000, fps)
+            # The switch itself skips frames until the next keyframe (and
+            # starts a new subscription with a shared encoder)
+            last_sent, last_dropped = _backlog(track)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning(f"rendition control err: {e}")
@@ -1,7 +1,7 @@
 'use client';
 
 import { Button } from '@/components/ui/button';
-import { useState } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 
 interface Recording {
@@ -17,6 +17,175 @@ interface RecordingsTableProps {
   recordings: Recording[];
 }
 
+// Detections sidecar of a pass-through recording (see /api/video/sidecar)
+interface SidecarHeader {
+  v: number;
+  w: number;
+  h: number;
+  names: string[];
+}
+
+interface SidecarEntry {
+  t: number;
+  b: number[];
+  c: number[];
+  s: number[];
+}
+
+interface Sidecar {
+  header: SidecarHeader;
+  entries: SidecarEntry[];
+}
+
+function parseSidecar(text: string): Sidecar | null {
+  const lines = text.split('\n').filter((l) => l.trim().length > 0);
+  if (lines.length === 0) return null;
+  try {
+    const header = JSON.parse(lines[0]) as SidecarHeader;
+    const entries: SidecarEntry[] = [];
+    for (const line of lines.slice(1)) {
+      try {
+        entries.push(JSON.parse(line));
+      } catch {
+        // Torn last line of an interrupted recording
+      }
+    }
+    entries.sort((a, b) => a.t - b.t);
+    return { header, entries };
+  } catch {
+    return null;
+  }
+}
+
+// Last entry at or before time t (binary search)
+function entryAt(entries: SidecarEntry[], t: number): SidecarEntry | null {
+  let lo = 0;
+  let hi = entries.length - 1;
+  let found = -1;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    if (entries[mid].t <= t) {
+      found = mid;
+      lo = mid + 1;
+    } else {
+      hi = mid - 1;
+    }
+  }
+  return found >= 0 ? entries[found] : null;
+}
+
+// Video player that draws sidecar detections over the original footage
+function RecordingPlayer({ src, sidecarUrl }: { src: string; sidecarUrl: string }) {
+  const videoRef = useRef<HTMLVideoElement>(null);
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  const [sidecar, setSidecar] = useState<Sidecar | null>(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    setSidecar(null);
+    // Re-encoded recordings have the boxes burned in and no sidecar (404)
+    fetch(sidecarUrl)
+      .then((res) => (res.ok ? res.text() : null))
+      .then((text) => {
+        if (!cancelled && text) setSidecar(parseSidecar(text));
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [sidecarUrl]);
+
+  const draw = useCallback((mediaTime: number) => {
+    const canvas = canvasRef.current;
+    const video = videoRef.current;
+    if (!canvas || !video) return;
+
+    const dpr = window.devicePixelRatio || 1;
+    const cw = video.clientWidth;
+    const ch = video.clientHeight;
+    if (canvas.width !== Math.round(cw * dpr) || canvas.height !== Math.round(ch * dpr)) {
+      canvas.width = Math.round(cw * dpr);
+      canvas.height = Math.round(ch * dpr);
+    }
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, cw, ch);
+
+    if (!sidecar || !sidecar.header.w || !sidecar.header.h) return;
+    const det = entryAt(sidecar.entries, mediaTime);
+    if (!det) return;
+
+    // The video element letterboxes (object-contain)
+    const { w, h, names } = sidecar.header;
+    const scale = Math.min(cw / w, ch / h);
+    const ox = (cw - w * scale) / 2;
+    const oy = (ch - h * scale) / 2;
+
+    ctx.lineWidth = 2;
+    ctx.font = '12px sans-serif';
+    ctx.textBaseline = 'bottom';
+    for (let i = 0; i < det.c.length; i++) {
+      const x1 = ox + det.b[i * 4] * scale;
+      const y1 = oy + det.b[i * 4 + 1] * scale;
+      const x2 = ox + det.b[i * 4 + 2] * scale;
+      const y2 = oy + det.b[i * 4 + 3] * scale;
+      ctx.strokeStyle = 'rgb(50, 220, 50)';
+      ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+
+      const label = `${names[det.c[i]] ?? `Class_${det.c[i]}`} ${det.s[i].toFixed(2)}`;
+      const tw = ctx.measureText(label).width;
+      ctx.fillStyle = 'rgba(0, 0, 0, 0.6)';
+      ctx.fillRect(x1, Math.max(0, y1 - 16), tw + 6, 16);
+      ctx.fillStyle = '#fff';
+      ctx.fillText(label, x1 + 3, Math.max(16, y1));
+    }
+  }, [sidecar]);
+
+  useEffect(() => {
+    const video = videoRef.current;
+    if (!video || !sidecar) return;
+    let handle = 0;
+    let stopped = false;
+
+    // Per decoded frame where supported, otherwise per animation frame
+    const rvfc = (video as any).requestVideoFrameCallback?.bind(video);
+    const onFrame = (_now: number, meta?: { mediaTime: number }) => {
+      if (stopped) return;
+      draw(meta ? meta.mediaTime : video.currentTime);
+      handle = rvfc ? rvfc(onFrame) : requestAnimationFrame(onFrame);
+    };
+    handle = rvfc ? rvfc(onFrame) : requestAnimationFrame(onFrame);
+    // Paused seeks produce no new frame callback
+    const onSeeked = () => draw(video.currentTime);
+    video.addEventListener('seeked', onSeeked);
+
+    return () => {
+      stopped = true;
+      if (rvfc) (video as any).cancelVideoFrameCallback?.(handle);
+      else cancelAnimationFrame(handle);
+      video.removeEventListener('seeked', onSeeked);
+    };
+  }, [sidecar, draw]);
+
+  return (
+    <div className="relative">
+      <video
+        ref={videoRef}
+        controls
+        autoPlay
+        className="w-full rounded-lg"
+        src={src}
+      >
+        Your browser does not support the video tag.
+      </video>
+      {sidecar && (
+        <canvas ref={canvasRef} className="absolute inset-0 w-full h-full pointer-events-none" />
+      )}
+    </div>
+  );
+}
+
 // Format duration from seconds to HH:MM:SS
 function formatDuration(seconds: number): string {
   const hours = Math.floor(seconds / 3600);
@@ -201,14 +370,10 @@ export default function RecordingsTable({ recordings }: RecordingsTableProps) {
         </DialogHeader>
         <div className="mt-4">
           {playingVideo && (
-            <video
-              controls
-              autoPlay
-              className="w-full rounded-lg"
+            <RecordingPlayer
               src={`${backendUrl}/api/video/stream/${playingVideo}`}
-            >
-              Your browser does not support the video tag.
-            </video>
+              sidecarUrl={`${backendUrl}/api/video/sidecar/${playingVideo}`}
+            />
           )}
         </div>
       </DialogContent>
@@ -9,10 +9,21 @@ interface StreamComponentProps {
   userFullName?: string; 
 }
 
+/** Statistik per klien dari /api/performance (clients[clientId]) */
+interface ClientStats {
+  fps: number;
+  inference_fps: number;
+  frames_sent: number;
+  frames_dropped: number;
+  /** Resolusi yang sedang dikirim ke klien ini (null = resolusi sumber) */
+  rendition?: { name: string; kbps: number; switches: number } | null;
+}
+
 /** Sesuaikan dengan payload /api/performance backend-mu */
 interface PerformanceData {
   fps?: number;
   inference_fps?: number;
+  clients?: Record<string, ClientStats>;
   active_ws?: number;
   active_peer_connections?: number;
   device?: string;
@@ -20,6 +31,22 @@ interface PerformanceData {
   cuda_available?: boolean;
 }
 
+/** Pesan dari data channel "detections" (lihat backend webrtc/detection_channel.py) */
+type DetectionMessage =
+  | { t: 'hello'; mode: 'burn' | 'metadata'; names: string[] }
+  | {
+      t: 'det';
+      seq: number;
+      pts: number;
+      ts: number;
+      w: number;
+      h: number;
+      lag: number;
+      b: number[];   // x1, y1, x2, y2 berurutan per deteksi
+      c: number[];
+      s: number[];
+    };
+
 interface ModelInfo {
   model_loaded: boolean;
   num_classes?: number;
@@ -65,6 +92,14 @@ export default function StreamComponent({
   const localStreamRef = useRef<MediaStream | null>(null);
   const perfIntervalRef = useRef<NodeJS.Timeout | null>(null);
 
+  // Overlay dari data channel (dipakai saat backend OVERLAY_MODE=metadata)
+  const overlayCanvasRef = useRef<HTMLCanvasElement>(null);
+  const detChannelRef = useRef<RTCDataChannel | null>(null);
+  const overlayModeRef = useRef<'burn' | 'metadata'>('burn');
+  const classNamesRef = useRef<string[]>([]);
+  const latestDetRef = useRef<Extract<DetectionMessage, { t: 'det' }> | null>(null);
+  const drawPendingRef = useRef(false);
+
   const addLog = useCallback((msg: string) => {
     const t = new Date().toLocaleTimeString();
     setLogs(prev => [`[${t}] ${msg}`, ...prev.slice(0, 99)]);
@@ -182,6 +217,81 @@ export default function StreamComponent({
     }
   };
 
+  // --- Overlay canvas (object-cover, sama seperti elemen video) ---
+  const drawOverlay = useCallback(() => {
+    drawPendingRef.current = false;
+    const canvas = overlayCanvasRef.current;
+    const video = remoteVideoRef.current;
+    if (!canvas || !video) return;
+
+    const dpr = window.devicePixelRatio || 1;
+    const cw = video.clientWidth;
+    const ch = video.clientHeight;
+    if (canvas.width !== Math.round(cw * dpr) || canvas.height !== Math.round(ch * dpr)) {
+      canvas.width = Math.round(cw * dpr);
+      canvas.height = Math.round(ch * dpr);
+    }
+    const ctx = canvas.getContext('2d');
+    if (!ctx) return;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, cw, ch);
+
+    const det = latestDetRef.current;
+    if (!det || overlayModeRef.current !== 'metadata' || !det.w || !det.h) return;
+
+    const scale = Math.max(cw / det.w, ch / det.h);
+    const ox = (cw - det.w * scale) / 2;
+    const oy = (ch - det.h * scale) / 2;
+
+    ctx.lineWidth = 2;
+    ctx.font = '12px sans-serif';
+    ctx.textBaseline = 'bottom';
+    for (let i = 0; i < det.c.length; i++) {
+      const x1 = ox + det.b[i * 4] * scale;
+      const y1 = oy + det.b[i * 4 + 1] * scale;
+      const x2 = ox + det.b[i * 4 + 2] * scale;
+      const y2 = oy + det.b[i * 4 + 3] * scale;
+      ctx.strokeStyle = 'rgb(50, 220, 50)';
+      ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+
+      const label = `${classNamesRef.current[det.c[i]] ?? `Class_${det.c[i]}`} ${det.s[i].toFixed(2)}`;
+      const tw = ctx.measureText(label).width;
+      ctx.fillStyle = 'rgba(0, 0, 0, 0.6)';
+      ctx.fillRect(x1, Math.max(0, y1 - 16), tw + 6, 16);
+      ctx.fillStyle = '#fff';
+      ctx.fillText(label, x1 + 3, Math.max(16, y1));
+    }
+  }, []);
+
+  const handleDetectionMessage = useCallback((raw: string) => {
+    let msg: DetectionMessage;
+    try {
+      msg = JSON.parse(raw);
+    } catch {
+      return;
+    }
+    if (msg.t === 'hello') {
+      overlayModeRef.current = msg.mode;
+      classNamesRef.current = msg.names;
+      addLog(`Detection channel: mode=${msg.mode}, ${msg.names.length} kelas`);
+      return;
+    }
+    if (msg.t === 'det') {
+      latestDetRef.current = msg;
+      // Gambar paling banyak sekali per frame layar
+      if (!drawPendingRef.current) {
+        drawPendingRef.current = true;
+        requestAnimationFrame(drawOverlay);
+      }
+    }
+  }, [addLog, drawOverlay]);
+
+  const clearOverlay = () => {
+    latestDetRef.current = null;
+    const canvas = overlayCanvasRef.current;
+    canvas?.getContext('2d')?.clearRect(0, 0, canvas.width, canvas.height);
+  };
+
   // --- Codec preference helper ---
   const applyCodecPreference = (transceiver: RTCRtpTransceiver, wanted: Codec) => {
     try {
@@ -226,6 +336,12 @@ export default function StreamComponent({
     const trx = pc.addTransceiver('video', { direction: 'recvonly' });
     applyCodecPreference(trx, codec);
 
+    // Data channel deteksi: dibuat di kedua sisi (negotiated, id 0), tanpa retransmit
+    const dc = pc.createDataChannel('detections', { negotiated: true, id: 0, ordered: false, maxRetransmits: 0 });
+    dc.onmessage = (ev) => handleDetectionMessage(typeof ev.data === 'string' ? ev.data : '');
+    dc.onclose = () => clearOverlay();
+    detChannelRef.current = dc;
+
     const offer = await pc.createOffer();
     await pc.setLocalDescription(offer);
 
@@ -314,6 +430,12 @@ export default function StreamComponent({
       if (localVideoRef.current) localVideoRef.current.srcObject = null;
       if (remoteVideoRef.current) remoteVideoRef.current.srcObject = null;
 
+      if (detChannelRef.current) {
+        try { detChannelRef.current.close(); } catch {}
+        detChannelRef.current = null;
+      }
+      clearOverlay();
+
       if (peerConnectionRef.current) {
         peerConnectionRef.current.getSenders().forEach(s => {
           try { s.track?.stop(); } catch {}
@@ -381,9 +503,8 @@ export default function StreamComponent({
 
       if (data.success) {
         setIsRecording(false);
-        const duration = data.recording?.duration || 0;
-        const fileSize = data.recording?.file_size || 0;
-        addLog(`Recording stopped: ${duration.toFixed(1)}s, ${(fileSize/1024/1024).toFixed(2)}MB`);
+        // File ditutup & disimpan di background; hasilnya datang lewat WS "recording-status"
+        addLog(`Recording stopped, finalizing ${data.recording?.filename ?? ''}...`);
         setRecordingId(null);
       } else {
         addLog(`Failed to stop recording: ${data.error}`);
@@ -395,7 +516,22 @@ export default function StreamComponent({
     }
   };
 
+  const handleRecordingStatus = (msg: any) => {
+    if (msg.status === 'saved') {
+      const duration = msg.duration || 0;
+      const fileSize = msg.file_size || 0;
+      addLog(`Recording saved: ${duration.toFixed(1)}s, ${(fileSize/1024/1024).toFixed(2)}MB`);
+    } else if (msg.status === 'unsaved' || msg.status === 'failed') {
+      addLog(`Recording ${msg.filename} ${msg.status}: ${msg.error ?? ''}`);
+    }
+  };
+
   const handleMessage = async (msg: any) => {
+    // Status rekaman tidak butuh peer connection
+    if (msg.type === 'recording-status') {
+      handleRecordingStatus(msg);
+      return;
+    }
     const pc = peerConnectionRef.current;
     if (!pc) return;
     try {
@@ -638,6 +774,7 @@ export default function StreamComponent({
                 <div className="p-4">
                   <div className="relative bg-slate-900 rounded-lg overflow-hidden" style={{ aspectRatio: '16/9' }}>
                     <video ref={remoteVideoRef} autoPlay playsInline className="w-full h-full object-cover" />
+                    <canvas ref={overlayCanvasRef} className="absolute inset-0 w-full h-full pointer-events-none" />
                     {!isStreaming && (
                       <div className="absolute inset-0 flex items-center justify-center">
                         <div className="text-center text-slate-400">
@@ -671,16 +808,20 @@ export default function StreamComponent({
             </div>
 
             {/* Performance */}
-            {performanceData && isStreaming && (
+            {performanceData && isStreaming && (() => {
+              const own = performanceData.clients?.[clientId];
+              const renderFps = own?.fps ?? performanceData.fps ?? 0;
+              const inferFps = own?.inference_fps ?? performanceData.inference_fps ?? 0;
+              return (
               <div className="bg-white rounded-xl shadow-sm border border-slate-200 p-6">
                 <h3 className="text-lg font-medium text-slate-900 mb-4">Performance Monitor</h3>
                 <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
                   <div className="text-center p-4 bg-slate-50 rounded-lg">
-                    <p className={`text-3xl font-light ${fpsClass(performanceData.fps ?? 0)}`}>{(performanceData.fps ?? 0).toFixed(1)}</p>
+                    <p className={`text-3xl font-light ${fpsClass(renderFps)}`}>{renderFps.toFixed(1)}</p>
                     <p className="text-sm text-slate-600 mt-1">Render FPS</p>
                   </div>
                   <div className="text-center p-4 bg-slate-50 rounded-lg">
-                    <p className={`text-3xl font-light ${fpsClass(performanceData.inference_fps ?? 0)}`}>{(performanceData.inference_fps ?? 0).toFixed(1)}</p>
+                    <p className={`text-3xl font-light ${fpsClass(inferFps)}`}>{inferFps.toFixed(1)}</p>
                     <p className="text-sm text-slate-600 mt-1">Inference FPS</p>
                   </div>
                   <div className="text-center p-4 bg-slate-50 rounded-lg">
@@ -692,8 +833,17 @@ export default function StreamComponent({
                     <p className="text-sm text-slate-600 mt-1">Model Status</p>
                   </div>
                 </div>
+                {own && own.frames_dropped > 0 && (
+                  <p className="text-xs text-slate-500 mt-3">Frame terlewat (klien lambat): {own.frames_dropped}</p>
+                )}
+                {own?.rendition && (
+                  <p className="text-xs text-slate-500 mt-1">
+                    Resolusi: {own.rendition.name} ({own.rendition.kbps} kbps, {own.rendition.switches}x pindah)
+                  </p>
+                )}
               </div>
-            )}
+              );
+            })()}
 
             {/* Notes */}
             <div className="bg-white rounded-xl shadow-sm border border-slate-200 p-6">